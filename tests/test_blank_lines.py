@@ -4,7 +4,7 @@
 #   test of removal of blank lines left by macros
 #
 
-from yalafi import tex2txt
+from yalafi import defs, parameters, parser, tex2txt
 
 options = tex2txt.Options(lang='en', char=True)
 
@@ -58,3 +58,29 @@ def test_2():
     plain, nums = tex2txt.tex2txt(latex_2, options)
     assert plain_2 == plain
 
+
+#   Parser.remove_pure_action_lines(): consecutive lines, lines at
+#   begin and end, LanguageTokens are kept
+#
+def test_remove_pure_action_lines():
+    p = parser.Parser(parameters.Parameters())
+    toks = [defs.ActionToken(0), defs.TextToken(0, ' \n'),
+            defs.TextToken(2, 'A\n'), defs.ActionToken(4),
+            defs.TextToken(4, '\n'), defs.LanguageToken(5, 'de-DE'),
+            defs.ActionToken(5), defs.TextToken(5, ' \n '),
+            defs.TextToken(8, 'B'), defs.TextToken(9, '\n  '),
+            defs.ActionToken(12)]
+    out = p.remove_pure_action_lines(toks)
+    assert [(type(t), t.pos, t.txt) for t in out] == [
+            (defs.TextToken, 2, 'A\n'), (defs.LanguageToken, 5, ''),
+            (defs.TextToken, 7, ' '), (defs.TextToken, 8, 'B'),
+            (defs.TextToken, 9, '\n')]
+    # input tokens are not modified
+    assert toks[7].txt == ' \n '
+
+#   results of nested expansions are cleaned again
+#
+def test_nested():
+    latex = 'A\n' + '\\MakeUppercase{b\n\\label{x}\n' * 50 + 'c' + '}' * 50
+    plain, nums = tex2txt.tex2txt(latex, options)
+    assert plain == 'A\n' + 'B\n' * 50 + 'C'
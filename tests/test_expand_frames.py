@@ -0,0 +1,88 @@
+
+#
+#   test of Parser.expand_frames():
+#   removed environments and files read by \LTinput are expanded on an
+#   explicit stack, expansion can pause at paragraph boundaries
+#
+
+import glob
+import os
+import pytest
+from yalafi import defs, parameters, parser, scanner, tex2txt, utils
+
+def get_parser(read_macros=None):
+    parms = parameters.Parameters()
+    p = parser.Parser(parms, tex2txt.get_packages('*', parms.package_modules),
+                        read_macros=read_macros)
+    p.the_environments['xx'] = defs.Environ(parms, 'xx', remove=True)
+    return p
+
+def test_input_chain():
+    # longer than the recursion limit would allow for recursive calls
+    n = 2000
+    def read(file):
+        i = int(file[1:-4])
+        if i < n:
+            return True, '\\newcommand{\\x}{%d}\\LTinput{f%d.tex}' % (i, i + 1)
+        return True, '\\newcommand{\\last}{LAST}%\n'
+    p = get_parser(read)
+    plain, pos = utils.get_txt_pos(p.parse('A\\LTinput{f0.tex}\\last{} \\x B'))
+    assert plain == 'ALAST 1999B'
+    assert p.input_files == []
+    assert p.source == '<unknown>'
+
+def test_input_in_math():
+    def read(file):
+        return True, '\\newcommand{\\x}{X}'
+    p = get_parser(read)
+    plain, pos = utils.get_txt_pos(p.parse('$\\LTinput{a.tex}a$ \\x'))
+    assert plain == 'C-C-C X'
+
+def test_nested_removed_environments():
+    n = 3000
+    p = get_parser()
+    latex = 'A' + '\\begin{xx}y' * n + '\\end{xx}' * n + 'B'
+    plain, pos = utils.get_txt_pos(p.parse(latex))
+    assert plain == 'A\n\n\nB'
+
+data_test_paragraphs = [
+
+    '',
+    'A',
+    'A\n\nB\n\n\n\nC\n',
+    'A\n\n\\begin{xx}a\n\nb\\begin{xx}c\\end{xx}d\n\ne\\end{xx}\n\nB',
+    'A \\textbf{x\n\ny}\n\nC\n\n\n  \n\\label{x}\n\nD',
+    '\\begin{itemize}\n\n\\item a\n\n\\item b\\end{itemize}\n\n\\section{x}\n\nE',
+    'A\n\n\\begin{xx}a\n\nb',
+    '\\begin{equation}\nx\n\\end{equation}\n\n\\footnote{F\n\nG}\n\nH',
+
+]
+
+def expand_both(latex):
+    results = []
+    for pause in (False, True):
+        p = get_parser()
+        buf = scanner.Buffer(p.parms.scanner.scan(latex))
+        if pause:
+            chunks = list(p.expand_paragraphs(buf))
+            toks = [t for c in chunks for t in c]
+        else:
+            toks = p.expand_sequence(buf)
+        results.append(utils.get_txt_pos(toks))
+    return results, chunks
+
+@pytest.mark.parametrize('latex', data_test_paragraphs)
+def test_expand_paragraphs(latex):
+    (expected, result), chunks = expand_both(latex)
+    assert result == expected
+    for c in chunks[1:]:
+        assert type(c[0]) is defs.ParagraphToken
+
+def test_expand_paragraphs_files():
+    base = os.path.dirname(os.path.abspath(__file__))
+    files = glob.glob(os.path.join(base, '**', '*.tex'), recursive=True)
+    for name in files:
+        with open(name, encoding='utf-8') as f:
+            latex = f.read()
+        (expected, result), chunks = expand_both(latex)
+        assert result == expected, name
@@ -0,0 +1,83 @@
+
+#
+#   test of Parser.snapshot() and Parser.fork()
+#
+
+from yalafi import parameters, parser, tex2txt, utils
+
+
+def get_plain(p, latex, **kw):
+    plain, pos = utils.get_txt_pos(p.parse(latex, **kw))
+    return plain
+
+def test_fork_isolated():
+    base = parser.Parser(parameters.Parameters())
+    snapshot = base.snapshot()
+    p1 = base.fork(snapshot)
+    p2 = base.fork(snapshot)
+    assert get_plain(p1, '\\newcommand{\\x}{X}\\x') == 'X'
+    assert get_plain(p2, '\\x') == ''
+    assert '\\x' not in base.the_macros
+    assert '\\x' not in snapshot.the_macros
+    assert p2.get_unknowns() == ['\\x']
+    assert p1.get_unknowns() == []
+
+def test_fork_parameters():
+    base = parser.Parser(parameters.Parameters())
+    p = base.fork()
+    assert p.parms is not base.parms
+    assert p.parms.scanner.parms is p.parms
+    get_plain(p, '\\usepackage{amsmath}\\usepackage{listings}')
+    assert '\\text' in p.parms.math_text_macros
+    assert '\\text' not in base.parms.math_text_macros
+    assert 'lstlisting' in p.parms.raw_environments
+    assert 'lstlisting' not in base.parms.raw_environments
+    assert 'amsmath' in p.packages
+    assert 'amsmath' not in base.packages
+
+def test_snapshot_restore():
+    p = parser.Parser(parameters.Parameters())
+    snapshot = p.snapshot()
+    get_plain(p, '\\newcommand{\\x}{X}\\usepackage{listings}')
+    # snapshot is not affected
+    assert get_plain(p.fork(snapshot), '\\x') == ''
+    p.restore(snapshot)
+    assert get_plain(p, '\\x') == ''
+    assert 'lstlisting' not in p.parms.raw_environments
+
+def test_fork_extract():
+    base = parser.Parser(parameters.Parameters())
+    snapshot = base.snapshot()
+    p = base.fork(snapshot)
+    assert get_plain(p, '\\textit{A}\\footnote{B}',
+                            extract=['\\footnote']) == '\n\n\nB\n'
+    p = base.fork(snapshot)
+    assert get_plain(p, '\\textit{A}\\footnote{B}') == 'A\n\n\nB\n'
+
+def test_tex2txt_cache():
+    tex2txt.parser_cache.clear()
+    opts = tex2txt.Options(lang='en')
+    txt, pos = tex2txt.tex2txt('\\newcommand{\\x}{X}\\x', opts)
+    assert txt == 'X'
+    txt, pos = tex2txt.tex2txt('\\x', opts)
+    assert txt == ''
+    assert len(tex2txt.parser_cache) == 1
+    tex2txt.tex2txt('A', tex2txt.Options(lang='de'))
+    assert len(tex2txt.parser_cache) == 2
+
+def test_math_repl_restore():
+    # maths replacements are rotated during parsing
+    tex2txt.parser_cache.clear()
+    opts = tex2txt.Options(lang='en')
+    assert tex2txt.tex2txt('$a$ $b$', opts)[0] == 'C-C-C D-D-D'
+    assert tex2txt.tex2txt('$a$ $b$', opts)[0] == 'C-C-C D-D-D'
+
+def test_lang_change_repl_restore():
+    # replacements for language changes are rotated in get_txt_pos_ml()
+    tex2txt.parser_cache.clear()
+    opts = tex2txt.Options(lang='en', pack='*')
+    for n in range(3):
+        ml = tex2txt.tex2txt('A\\foreignlanguage{german}{T}B\n', opts,
+                                multi_language=True)
+        assert ml['en'][0][0] == 'AL-L-LB\n'
+
@@ -0,0 +1,124 @@
+
+#
+#   test of Parser.parse_incremental() and Parser.update()
+#
+
+import random
+from yalafi import parameters, parser, utils
+
+
+def parse(latex):
+    p = parser.Parser(parameters.Parameters())
+    return utils.get_txt_pos(p.parse(latex))
+
+def apply(txt, pos, res, edit):
+    start, end, t, n = res
+    off, rem, ins = edit
+    delta = len(ins) - rem
+    return (txt[:start] + t + txt[end:],
+                pos[:start] + n + [m + delta if m >= off + rem else m
+                                        for m in pos[end:]])
+
+latex_1 = r"""\newcommand{\x}{X}
+A \x{} $a$
+
+B \textbf{C}
+
+\begin{itemize}
+\item D
+
+\item E
+\end{itemize}
+
+F $b$ \x{}
+
+G
+"""
+def test_initial():
+    p = parser.Parser(parameters.Parameters())
+    assert p.parse_incremental(latex_1) == parse(latex_1)
+    assert p.incremental_txt_pos() == parse(latex_1)
+    assert len(p.paragraphs) == 6
+
+def test_update():
+    p = parser.Parser(parameters.Parameters())
+    txt, pos = p.parse_incremental(latex_1)
+    latex = latex_1
+    for edit in [(latex.index('B'), 1, 'H $c$'),
+                    (latex.index('\\newcommand'), 0, 'I\n\n'),
+                    (latex.index('G'), 1, '\\renewcommand{\\x}{Y}\\x'),
+                    (0, len(latex), '')]:
+        off, rem, ins = edit
+        res = p.update(*edit)
+        txt, pos = apply(txt, pos, res, edit)
+        latex = latex[:off] + ins + latex[off+rem:]
+        assert (txt, pos) == parse(latex)
+        assert p.incremental_txt_pos() == (txt, pos)
+
+def test_small_span():
+    latex = ''.join('Paragraph {} $a$.\n\n'.format(n) for n in range(100))
+    p = parser.Parser(parameters.Parameters())
+    txt, pos = p.parse_incremental(latex)
+    off = latex.index('Paragraph 50')
+    start, end, t, n = p.update(off, 9, 'Section')
+    # expansion restarts at the paragraph before the edit
+    assert txt[start:end] == '\n\nParagraph 49 D-D-D.\n\nParagraph 50 E-E-E.'
+    assert t == '\n\nParagraph 49 D-D-D.\n\nSection 50 E-E-E.'
+    assert n[t.index('Section')] == off
+
+def test_definition():
+    # a changed definition is applied to the following paragraphs
+    latex = '\\newcommand{\\x}{X}\n\nA \\x\n\nB \\x\n'
+    p = parser.Parser(parameters.Parameters())
+    txt, pos = p.parse_incremental(latex)
+    edit = (latex.index('X'), 1, 'Y')
+    res = p.update(*edit)
+    assert res[1] == len(txt)
+    txt, pos = apply(txt, pos, res, edit)
+    assert txt == parse(latex.replace('X', 'Y'))[0]
+    assert 'A Y\n\nB Y' in txt
+
+def test_extracted():
+    latex = 'A\\footnote{B}\n\nC\n'
+    p = parser.Parser(parameters.Parameters())
+    txt, pos = p.parse_incremental(latex)
+    edit = (latex.index('B'), 1, 'D')
+    txt, pos = apply(txt, pos, p.update(*edit), edit)
+    assert txt == parse('A\\footnote{D}\n\nC\n')[0]
+
+#   random edits, also of the definitions in the preamble
+#
+preamble = r"""\documentclass{article}
+\newcommand{\x}{X}
+\newcommand{\y}[1]{Y#1 \x}
+
+\begin{document}
+"""
+pieces = [
+    'Text \\textbf{bold} here\\footnote{Note.} and \\label{x}\n',
+    '\\begin{itemize}\n\\item[a)] A.\n\n\\item[b)] B\n\\end{itemize}\n',
+    '$a+b$ and\n\\[ x = y \\]\n', '\\section{Title}\n\\label{s}\n',
+    '\n\n', 'word text.\n', '\\renewcommand{\\x}{Z}\n', '\\x{} \\y{u}\n',
+    '%comment\n', '\\textit{a\n\nb}\n', '\\verb?%$? ', 'A \\\\\n\n[x] ',
+]
+def test_random():
+    rand = random.Random(0)
+    for n in range(30):
+        latex = (preamble + ''.join(rand.choice(pieces) for i in range(10))
+                    + '\\end{document}\n')
+        p = parser.Parser(parameters.Parameters())
+        txt, pos = p.parse_incremental(latex)
+        for m in range(5):
+            off = rand.randrange(len(latex))
+            if rand.random() < 0.3:
+                off = rand.randrange(len(preamble))
+            if latex[off] in '{}\\':
+                # do not create recursive definitions
+                edit = (off, 0, rand.choice(['\n\n', ' ', 'x']))
+            else:
+                edit = (off, 1, rand.choice(['', '\n\n', 'x', ' ']))
+            res = p.update(*edit)
+            txt, pos = apply(txt, pos, res, edit)
+            latex = latex[:off] + edit[2] + latex[off+edit[1]:]
+            assert (txt, pos) == parse(latex), edit
+            assert p.incremental_txt_pos() == (txt, pos)
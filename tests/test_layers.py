@@ -0,0 +1,118 @@
+
+#
+#   test of layered macro and environment tables
+#
+
+import pytest
+from yalafi import parameters, parser, scanner, utils
+
+
+def test_layered_dict():
+    d = utils.LayeredDict('a')
+    d['x'] = 1
+    d.checkpoint('b')
+    d['x'] = 2
+    d['y'] = 3
+    d.checkpoint('c')
+    del d['x']
+    d.update(z=4)
+    assert d == {'y': 3, 'z': 4}
+    assert d.layer_names() == ['a', 'b', 'c']
+    d.rollback('c')
+    assert d == {'x': 2, 'y': 3}
+    assert d.layer_names() == ['a', 'b', 'c']
+    d.rollback('b')
+    assert d == {'x': 1}
+    assert d.layer_names() == ['a', 'b']
+    d.rollback('a')
+    assert d == {}
+    with pytest.raises(KeyError):
+        d.rollback('b')
+
+def test_layered_dict_merge():
+    d = utils.LayeredDict()
+    d['x'] = 1
+    d.checkpoint('b')
+    d['x'] = 2
+    d.checkpoint('c')
+    d['x'] = 3
+    d.pop('x')
+    # layer 'c' is merged into existing layer 'b'
+    d.checkpoint('b')
+    assert d.layer_names() == ['base', 'b']
+    d.setdefault('y', 5)
+    d.rollback('b')
+    assert d == {'x': 1}
+
+def test_layered_dict_copy():
+    d = utils.LayeredDict()
+    d['x'] = 1
+    d.checkpoint('b')
+    d['x'] = 2
+    e = d.copy()
+    e['x'] = 3
+    d.rollback('b')
+    assert d == {'x': 1}
+    assert e == {'x': 3}
+    e.rollback('b')
+    assert e == {'x': 1}
+
+def test_parser_layers():
+    p = parser.Parser(parameters.Parameters())
+    assert p.the_macros.layer_names() == ['builtins', 'packages']
+    p.parse('\\newcommand{\\x}{X}', define='\\newcommand{\\y}{Y}')
+    assert p.the_macros.layer_names() == ['builtins', 'packages',
+                                            'preamble', 'document']
+    assert '\\x' in p.the_macros and '\\y' in p.the_macros
+    p.rollback('document')
+    assert '\\x' not in p.the_macros and '\\y' in p.the_macros
+    p.rollback('preamble')
+    assert '\\y' not in p.the_macros
+    # repeated parse reuses the layers
+    p.parse('A', define='B')
+    assert p.the_macros.layer_names() == ['builtins', 'packages',
+                                            'preamble', 'document']
+
+def test_parser_rollback():
+    p = parser.Parser(parameters.Parameters())
+    n = len(p.the_macros)
+    p.checkpoint('document')
+    p.parse('\\usepackage{listings}\\newcommand{\\x}{X}')
+    assert 'lstlisting' in p.parms.raw_environments
+    assert 'listings' in p.packages
+    p.rollback('document')
+    assert len(p.the_macros) == n
+    assert 'lstlisting' not in p.parms.raw_environments
+    assert 'listings' not in p.packages
+    assert '\\x' not in p.the_macros
+
+latex_1 = r"""A\newcommand{\x}{X}\x
+
+\renewcommand{\x}{Y}\x
+
+\x
+"""
+def test_paragraph_rollback():
+    p = parser.Parser(parameters.Parameters())
+    buf = scanner.Buffer(p.parms.scanner.scan(latex_1))
+    out = []
+    for toks in p.expand_paragraphs(buf):
+        out.append(utils.get_txt_pos(toks)[0].strip())
+        if len(out) == 1:
+            p.checkpoint('paragraph')
+        else:
+            # drop definitions of second paragraph
+            p.rollback('paragraph')
+    assert out == ['AX', 'Y', 'X']
+
+def test_layered_dict_version():
+    d = utils.LayeredDict()
+    d.checkpoint('b')
+    v = d.version
+    d['x'] = 1
+    assert d.version > v
+    v = d.version
+    d.rollback('b')
+    assert d.version > v
+    assert d.copy().version == d.version
+
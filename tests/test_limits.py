@@ -0,0 +1,67 @@
+
+#
+#   test of limits for runaway expansions:
+#   Parameters.max_expansions, max_buffer_growth, max_parse_time
+#
+
+import pytest
+from yalafi import parameters, parser, utils
+
+def get_plain(latex, **limits):
+    parms = parameters.Parameters()
+    for name, value in limits.items():
+        setattr(parms, name, value)
+    p = parser.Parser(parms)
+    plain, pos = utils.get_txt_pos(p.parse(latex))
+    return plain
+
+data_test_limits = [
+
+    ('A\\newcommand{\\x}{\\x}\\x B \\textbf{C}', 'A LATEXXXERROR B C',
+        'max_expansions: 51 expansions since input'),
+    ('A\\newcommand{\\x}{a\\x}\\x B', 'A' + 'a' * 51 + ' LATEXXXERROR B',
+        'max_expansions: 51 expansions since input'),
+    ('A\\def\\x{\\x\\x}\\x B', 'A LATEXXXERROR B',
+        'max_expansions: 51 expansions since input, 51 tokens pending'),
+    ('A\\def\\x#1{\\x{#1#1}}\\x{a} B', 'A LATEXXXERROR  B',
+        'max_buffer_growth: 8 expansions since input, 1278 tokens pending'),
+    ('\\newcommand{\\y}{x}' + '\\y' * 200, 'x' * 200, None),
+
+]
+
+@pytest.mark.parametrize('latex,plain_expected,err_expected',
+                            data_test_limits)
+def test_limits(latex, plain_expected, err_expected, capsys):
+    plain = get_plain(latex, max_expansions=50, max_buffer_growth=1000)
+    captured = capsys.readouterr()
+    assert plain == plain_expected
+    if err_expected:
+        assert 'runaway expansion of "\\x" stopped by limit' in captured.err
+        assert err_expected in captured.err
+    else:
+        assert not captured.err
+
+def test_time_limit(capsys):
+    latex = '\\newcommand{\\y}{Y}A\\newcommand{\\x}{\\x}\\x B \\y C'
+    plain = get_plain(latex, max_parse_time=0, max_expansions=None)
+    captured = capsys.readouterr()
+    # after the time limit, \y is not expanded either
+    assert plain == 'A LATEXXXERROR B C'
+    assert 'stopped by limit max_parse_time' in captured.err
+    assert get_plain(latex.replace('\\x}\\x', '\\x}'),
+                        max_parse_time=10) == 'A B YC'
+
+def test_enclosing_tokens(capsys):
+    # tokens of \y behind the runaway \x are kept
+    latex = '\\newcommand{\\x}{\\x}\\newcommand{\\y}[1]{(#1)}A\\y{C \\x B} D'
+    plain = get_plain(latex, max_expansions=50)
+    captured = capsys.readouterr()
+    assert plain == 'A(C  LATEXXXERROR B) D'
+    assert ('51 expansions since input, 3 tokens pending,'
+                + ' 54 expansions in total, nesting depth 0') in captured.err
+
+def test_no_limits():
+    parms = parameters.Parameters()
+    assert parms.max_expansions is None
+    assert parms.max_buffer_growth is None
+    assert parms.max_parse_time is None
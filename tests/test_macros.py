@@ -8,7 +8,7 @@
 #   - passing of information on argument delimiters {}
 #
 
-from yalafi import tex2txt
+from yalafi import defs, parameters, parser, scanner, tex2txt
 import pytest
 
 options = tex2txt.Options(lang='en', char=True)
@@ -129,3 +129,26 @@ def test_delimiters(latex, plain_expected):
     plain, nums = tex2txt.tex2txt(prefix + latex, options)
     assert plain == plain_expected
 
+
+data_test_arg_readers = [
+    '', ' ', 'x', ' {a b} {c}', '{a}{b}', '[o]{a}', '[]x', '*{a}', '*',
+    '}', '{a}}', '\n\n{a}', '{a', '[o', ' %c\n [o] %d\n {a}', '* [o]',
+]
+
+@pytest.mark.parametrize('args', ['', 'A', 'AA', 'OA', '*A'])
+@pytest.mark.parametrize('latex', data_test_arg_readers)
+def test_arg_readers(args, latex):
+    # fast paths have to read the same as the generic reader
+    def describe(x):
+        return [[(type(t).__name__, t.txt, t.pos, t.pos_fix) for t in arg]
+                    for arg in x]
+    parms = parameters.Parameters()
+    p = parser.Parser(parms)
+    mac = defs.Macro(parms, '\\m', args=args, defaults=['d e'])
+    results = []
+    for read in (p.arg_readers[args], p.read_arguments):
+        buf = scanner.Buffer(parms.scanner.scan(latex))
+        arguments, extr, delims = read(buf, mac, 7)
+        results.append((describe(arguments), describe(extr), delims,
+                            [t.txt for t in buf.all()]))
+    assert results[0] == results[1]
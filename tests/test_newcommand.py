@@ -4,7 +4,7 @@
 
 
 import pytest
-from yalafi import parameters, parser, utils
+from yalafi import defs, parameters, parser, utils
 
 
 def trim(string):
@@ -243,3 +243,26 @@ def test_newcommand_error(latex, plain_expected, stderr_expected, capsys):
     cap = capsys.readouterr()
     assert plain == trim(plain_expected)
     assert cap.err == trim(stderr_expected)
+
+
+def test_template():
+    parms = parameters.Parameters()
+    p = parser.Parser(parms)
+    p.parse('\\newcommand{\\xx}[2][o]{A \\verb?$? #2 B #1}')
+    mac = p.the_macros['\\xx']
+    assert mac.template(mac.repl) is mac.template(mac.repl)
+    toks = p.parse('\\newcommand{\\xx}[2][o]{A \\verb?$? #2 B #1}'
+                    '\\xx{yy}\\xx[z]{w}')
+    plain, pos = utils.get_txt_pos(toks)
+    assert plain == 'A $ yy B oA $ w B z'
+    arg1 = [defs.TextToken(50, 'a')]
+    arg2 = [defs.TextToken(60, 'bc')]
+    out = mac.template(mac.repl).expand([arg1, arg2], 40)
+    again = mac.template(mac.repl).expand([arg1, arg2], 40)
+    assert not set(map(id, out)) & set(map(id, again)) - set(map(id, arg1 + arg2))
+    assert [(type(t).__name__, t.txt, t.pos) for t in out if t.txt] == [
+        ('TextToken', 'A', 50), ('SpaceToken', ' ', 50),
+        ('VerbatimToken', '$', 50), ('SpaceToken', ' ', 50),
+        ('TextToken', 'bc', 60), ('SpaceToken', ' ', 61),
+        ('TextToken', 'B', 61), ('SpaceToken', ' ', 61), ('TextToken', 'a', 50)]
+    assert all(t.environ is False for t in out if type(t) is defs.VerbatimToken)
@@ -0,0 +1,102 @@
+
+#
+#   test of parser event callbacks
+#
+
+from yalafi import parameters, parser, utils
+
+
+def record(p, events):
+    log = []
+    def f(event):
+        def g(parser, name, start, end, seconds):
+            log.append((event, parser.source, name, start, end))
+        return g
+    for event in events:
+        p.add_observer(event, f(event))
+    return log
+
+latex_1 = r"""\usepackage{amsmath}
+\newcommand{\x}{X}
+\begin{itemize}
+\item \x $a$
+\end{itemize}
+"""
+def test_events():
+    p = parser.Parser(parameters.Parameters())
+    assert p.observers == {}
+    log = record(p, ['scan', 'macro', 'begin', 'end', 'math', 'package'])
+    p.parse(latex_1, source='t.tex')
+    # macros defined by package amsmath are expanded in source 'amsmath'
+    assert [e for e in log if e[1] != 'amsmath'] == [
+        ('package', 't.tex', 'amsmath', 0, 0),
+        ('macro', 't.tex', '\\usepackage', 0, 20),
+        ('macro', 't.tex', '\\newcommand', 21, 39),
+        ('begin', 't.tex', 'itemize', 40, 55),
+        ('macro', 't.tex', '\\x', 62, 65),
+        ('math', 't.tex', '$', 65, 68),
+        ('end', 't.tex', 'itemize', 69, 82),
+        ('scan', 't.tex', 't.tex', 0, len(latex_1)),
+    ]
+    assert [e[:3] for e in log if e[0] == 'scan'][0] == ('scan', 'amsmath',
+                                                            'amsmath')
+
+def test_timing():
+    times = []
+    p = parser.Parser(parameters.Parameters())
+    p.add_observer('macro', lambda *args: times.append(args[-1]))
+    p.parse(latex_1)
+    assert len(times) > 3
+    assert all(t >= 0 for t in times)
+
+def test_remove_observer():
+    p = parser.Parser(parameters.Parameters())
+    log = []
+    def f(*args):
+        log.append(args[1])
+    p.add_observer('macro', f)
+    p.parse('\\newcommand{\\x}{}\\x')
+    assert log == ['\\newcommand', '\\x']
+    p.remove_observer('macro', f)
+    assert p.observers == {}
+    p.parse('\\newcommand{\\x}{}\\x')
+    assert log == ['\\newcommand', '\\x']
+
+#   stop at \end{document}, remainder is not scanned
+#
+latex_2 = r"""\begin{document}
+A \textit{B}
+\end{document}
+C $
+"""
+plain_2 = r"""A B
+"""
+def test_stop(capsys):
+    capsys.readouterr()
+    p = parser.Parser(parameters.Parameters())
+    p.add_observer('end', lambda parser, name, *args: name == 'document')
+    toks = p.parse(latex_2)
+    plain, pos = utils.get_txt_pos(toks)
+    assert plain == plain_2
+    assert capsys.readouterr().err == ''
+
+def test_input():
+    def read(file):
+        return True, '\\newcommand{\\x}{X}'
+    p = parser.Parser(parameters.Parameters(), read_macros=read)
+    log = record(p, ['scan'])
+    p.parse('A\\LTinput{z.tex}\\x', source='t.tex')
+    assert log == [('scan', 'z.tex', 'z.tex', 0, 18),
+                    ('scan', 't.tex', 't.tex', 0, 18)]
+
+latex_3 = r"""\usepackage[english,ngerman]{babel}
+A \foreignlanguage{english}{B}
+"""
+def test_language():
+    parms = parameters.Parameters('de-DE')
+    parms.multi_language = True
+    p = parser.Parser(parms)
+    log = record(p, ['language'])
+    p.parse(latex_3)
+    assert [e[2] for e in log] == ['de-DE', 'en-GB', 'de-DE']
+
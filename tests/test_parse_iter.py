@@ -0,0 +1,105 @@
+
+#
+#   test of Parser.parse_iter() and tex2txt.tex2txt_iter()
+#
+
+import ast
+import glob
+import os.path
+import pytest
+from yalafi import defs, parameters, parser, tex2txt, utils
+
+
+latex_1 = r"""
+A\footnote{B}
+
+\begin{itemize}
+\item C
+
+\item D
+\end{itemize}
+
+E \LTskip{X}
+"""
+def test_parts():
+    p = parser.Parser(parameters.Parameters())
+    parts = list(p.parse_iter(latex_1))
+    assert len(parts) == 5
+    # paragraph breaks are held back till the next part
+    assert all(type(toks[0]) is defs.ParagraphToken for toks in parts[1:])
+    plain = ''.join(utils.get_txt_pos(toks)[0] for toks in parts)
+    txt, pos = utils.get_txt_pos(p.parse(latex_1))
+    assert plain == txt
+    # footnote is extracted at the end
+    assert utils.get_txt_pos(parts[-1])[0] == '\n\n\nB\n'
+
+def test_lazy():
+    p = parser.Parser(parameters.Parameters())
+    gen = p.parse_iter('A\n\n\\zz B\n')
+    assert utils.get_txt_pos(next(gen))[0] == 'A'
+    # rest not yet parsed
+    assert p.get_unknowns() == []
+    assert utils.get_txt_pos(next(gen))[0] == '\n\nB\n'
+    assert p.get_unknowns() == ['\\zz']
+
+def test_define_extract():
+    p = parser.Parser(parameters.Parameters())
+    parts = list(p.parse_iter(latex_1, define='\\newcommand{\\x}{}',
+                                extract=['\\footnote']))
+    assert [utils.get_txt_pos(toks)[0] for toks in parts] == ['\n\n\nB\n']
+    assert list(p.parse_iter('')) == []
+
+def test_tex2txt_iter():
+    opts = tex2txt.Options(lang='en', repl=['E & F'])
+    parts = list(tex2txt.tex2txt_iter(latex_1, opts))
+    assert len(parts) == 5
+    txt, pos = tex2txt.tex2txt(latex_1, opts)
+    assert ''.join(part[0] for part in parts) == txt
+    assert sum((part[1] for part in parts), []) == pos
+    assert 'F' in txt
+
+#   joined parts equal the output of parse() for all multi-line strings
+#   of the tests
+#
+def corpus():
+    latex = set()
+    for name in glob.glob(os.path.join(os.path.dirname(__file__),
+                                            'test_*.py')):
+        with open(name, encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        latex.update(node.value for node in ast.walk(tree)
+                        if isinstance(node, ast.Constant)
+                            and type(node.value) is str
+                            and '\n' in node.value)
+    return sorted(latex)
+
+parms = parameters.Parameters()
+packages = tex2txt.get_packages('*', parms.package_modules)
+p_corpus = parser.Parser(parms, packages)
+snapshot = p_corpus.snapshot()
+
+@pytest.mark.parametrize('latex', corpus())
+def test_corpus(latex):
+    p = p_corpus.fork(snapshot)
+    toks = p.parse(latex)
+    p = p_corpus.fork(snapshot)
+    parts = list(p.parse_iter(latex))
+    assert utils.get_txt_pos(sum(parts, [])) == utils.get_txt_pos(toks)
+
+#   output of parse() as before the introduction of parse_iter()
+#
+data_test_parse = [
+
+    ('a\n\n  \\label{x}\nb', 'a\n\nb'),
+    ('x.\n\n\\item[a)] b', 'x.\n\n a).  b'),
+
+]
+
+@pytest.mark.parametrize('latex,expected', data_test_parse)
+def test_parse(latex, expected):
+    p = parser.Parser(parameters.Parameters())
+    plain, pos = utils.get_txt_pos(p.parse(latex))
+    assert plain == expected
+    p = parser.Parser(parameters.Parameters())
+    plain, pos = utils.get_txt_pos(sum(p.parse_iter(latex), []))
+    assert plain == expected
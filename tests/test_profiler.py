@@ -0,0 +1,95 @@
+
+#
+#   test of profiling of macro and environment expansions
+#
+
+import json
+import subprocess
+from yalafi import parameters, parser, profiler, tex2txt, utils
+from tests.test_shell_cmd import run_shell
+
+
+latex_1 = r"""
+\newcommand{\x}[1]{#1 #1}
+\begin{itemize}
+\item \x{A}
+\end{itemize}
+$\x{B}$ \x{C}
+"""
+plain_1 = r"""
+  A A
+C-C-C C C
+"""
+def test_profiler():
+    p = parser.Parser(parameters.Parameters())
+    p.profiler = profiler.Profiler()
+    toks = p.parse(latex_1)
+    plain, pos = utils.get_txt_pos(toks)
+    assert plain == plain_1
+    stats = {(e['kind'], e['name']): e for e in p.profiler.entries()}
+    x = stats['macro', '\\x']
+    assert x['count'] == 3
+    # argument tokens are wrapped into ActionTokens
+    assert x['tokens'] == 3 * 7
+    assert x['handler_time'] == 0
+    assert x['template_time'] > 0
+    n = stats['macro', '\\newcommand']
+    assert n['count'] == 1
+    assert n['template_time'] == 0
+    assert stats['environment', 'itemize']['count'] == 1
+    assert stats['macro', '\\item']['count'] == 1
+
+def test_profiler_off():
+    p = parser.Parser(parameters.Parameters())
+    assert p.profiler is None
+    toks = p.parse(latex_1)
+    plain, pos = utils.get_txt_pos(toks)
+    assert plain == plain_1
+
+def test_profiler_shared():
+    prof = profiler.Profiler()
+    opts = tex2txt.Options(prof=prof)
+    tex2txt.tex2txt(latex_1, opts)
+    tex2txt.tex2txt(latex_1, opts)
+    assert prof.stats['macro', '\\x'][0] == 6
+
+def test_table():
+    prof = profiler.Profiler()
+    prof.record('macro', '\\a', False, 3, 0.5)
+    prof.record('environment', 'b', True, 1, 1.0)
+    prof.record('macro', '\\a', False, 3, 0.25)
+    assert prof.table() == (
+        '    count     tokens   handler/s  template/s  name\n'
+        '        1          1    1.000000    0.000000  {b}\n'
+        '        2          6    0.000000    0.750000  \\a\n')
+    assert json.loads(prof.json())[1] == {'kind': 'macro', 'name': '\\a',
+            'count': 2, 'tokens': 6, 'handler_time': 0.0,
+            'template_time': 0.75}
+
+def test_tex2txt_profile_json(tmp_path):
+    tex = tmp_path / 'in.tex'
+    tex.write_text(latex_1)
+    out = tmp_path / 'prof.json'
+    cmd = ['python', '-m', 'yalafi', '--profile-json', str(out), str(tex)]
+    plain = subprocess.run(cmd, stdout=subprocess.PIPE).stdout.decode()
+    assert plain == plain_1
+    names = [e['name'] for e in json.loads(out.read_text())]
+    assert sorted(names) == ['\\item', '\\newcommand', '\\x', 'itemize']
+
+def test_tex2txt_profile():
+    cmd = ['python', '-m', 'yalafi', '--profile']
+    res = subprocess.run(cmd, input=latex_1.encode(),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    lines = res.stderr.decode().splitlines()
+    assert lines[0].split() == ['count', 'tokens', 'handler/s',
+                                    'template/s', 'name']
+    assert sorted(l.split()[-1] for l in lines[1:]) == ['\\item',
+                                    '\\newcommand', '\\x', '{itemize}']
+
+def test_shell_profile_json(tmp_path):
+    out = tmp_path / 'prof.json'
+    run_shell.run_shell('--profile-json ' + str(out), latex_1, 'utf-8',
+                                run_shell.json_ok)
+    names = [e['name'] for e in json.loads(out.read_text())]
+    assert sorted(names) == ['\\item', '\\newcommand', '\\x', 'itemize']
+
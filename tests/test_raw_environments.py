@@ -0,0 +1,63 @@
+
+#
+#   test of Parameters.raw_environments:
+#   environments skipped by the scanner have to give the same result
+#   as environments expanded by the parser
+#
+
+import pytest
+from yalafi import defs, parameters, parser, tex2txt, utils
+
+def get_plain_pos(latex, raw):
+    parms = parameters.Parameters()
+    packages = tex2txt.get_packages('*', parms.package_modules)
+    p = parser.Parser(parms, packages)
+    if not raw:
+        parms.raw_environments.clear()
+    return utils.get_txt_pos(p.parse(latex))
+
+data_test_raw_environments = [
+
+    'A\n\\begin{tikzpicture}\n\\draw (0,0) -- (2,2);\n\\end{tikzpicture}\nB',
+    'A\\begin{tikzpicture}[x=1cm]\\node{\\xyz};\\end {tikzpicture}B',
+    'A\\begin{tikzpicture}\\begin{tikzpicture}X\\end{tikzpicture}'
+        + '\\end{tikzpicture}B',
+    'A\\begin{tikzpicture}% \\end{tikzpicture}\nX\\end{tikzpicture}B',
+    'A\\begin{tikzpicture}\\%\\end{tikzpicture}B',
+    'A\\begin{tikzpicture}X',
+    'A\\begin{lstlisting}[language=C]\nint x;\n\\end{lstlisting}B',
+    'A\\begin{circuitikz}\\draw (0,0) to[R] (2,0);\\end{circuitikz}B',
+    'A $x \\begin{tikzpicture}X\\end{tikzpicture}$ B',
+    '\\renewenvironment{tikzpicture}{(}{)}A\\begin{tikzpicture}X'
+        + '\\end{tikzpicture}B',
+
+]
+
+@pytest.mark.parametrize('latex', data_test_raw_environments)
+def test_raw_environments(latex):
+    assert get_plain_pos(latex, True) == get_plain_pos(latex, False)
+
+def test_raw_token():
+    parms = parameters.Parameters()
+    parms.raw_environments.add('tikzpicture')
+    latex = 'A\\begin{tikzpicture}\\begin{tikzpicture}X\\end{tikzpicture}%\n'
+    latex += '\\end{tikzpicture}B'
+    toks = parms.scanner.scan(latex)
+    assert [type(t) for t in toks] == [defs.TextToken, defs.RawEnvironToken,
+                                            defs.TextToken]
+    assert toks[1].txt == latex[1:-1]
+    assert toks[1].name == 'tikzpicture'
+
+def test_rescan_error(capsys):
+    # scanner errors in a raw environment that is scanned again by the
+    # parser give positions in the source
+    latex = 'A\n\\begin{tikzpicture}\nX \\verb\n\\end{tikzpicture}B'
+    capsys.readouterr()
+    for raw in (True, False):
+        parms = parameters.Parameters()
+        if raw:
+            parms.raw_environments.add('tikzpicture')
+        else:
+            parms.raw_environments.clear()
+        parser.Parser(parms).parse(latex)
+        assert 'line 3, column 3' in capsys.readouterr().err
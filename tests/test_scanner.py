@@ -0,0 +1,280 @@
+
+#
+#   test of yalafi.scanner:
+#   the table-driven scanner has to reproduce the token stream of the
+#   reference scanner
+#
+
+import glob
+import os
+import random
+import pytest
+from yalafi import defs, parameters, parser, scanner
+
+def describe(toks):
+    return [(type(t).__name__, repr(t)) for t in toks]
+
+data_test_engines = [
+
+    '',
+    'a',
+    'Hello world.\n\nNew paragraph.\n',
+    'A  \t B\n  \n\n C \u00a0 D\u2003E',
+    '\\textbf{bold} \\emph x \\foo@bar12',
+    "\\'e \\`a \\\"o \\^x \\~n \\=a \\. \\\\ \\, \\; \\! \\/",
+    '--- -- - `` \'\' ~ & _ ^ $$ $ x$ \\( \\) \\[ \\]',
+    '\\{ \\} \\$ \\# \\& \\_ \\% \\ x\\\ty\\\nz',
+    '#1 #x # #',
+    'a % comment\n  b',
+    'a%x\n\nb',
+    'a%x\n  \n b',
+    'a%x',
+    'a%x\n',
+    '%%% LT-SKIP-BEGIN\nx\n%%% LT-SKIP-END\ny',
+    '\\verb?%x\\y?\\label{z}',
+    '\\verb?abc',
+    '\\verb?abc\ndef?',
+    '\\verb',
+    '\\verb?',
+    'A\\begin{verbatim}\\verb?%\\x?\n\\end{verbatim}B',
+    '\\begin  \n {verbatim}x\\end{verbatim}',
+    '\\begin\n\n{verbatim}x\\end{verbatim}',
+    '\\begin{verbatim}missing end',
+    '\\begin{itemize}\\item a\\item[b] c\\end{itemize}',
+    '\\',
+    'x\\',
+    '\\begin',
+
+]
+
+@pytest.mark.parametrize('latex', data_test_engines)
+def test_engines(latex):
+    parms = parameters.Parameters()
+    reference = scanner.Scanner(parms).scan(latex)
+    table = scanner.TableScanner(parms).scan(latex)
+    assert describe(table) == describe(reference)
+
+def test_default_engine():
+    parms = parameters.Parameters()
+    assert type(parms.scanner) is scanner.TableScanner
+
+def test_engines_files():
+    parms = parameters.Parameters()
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    files = (glob.glob(os.path.join(base, 'tests', '**', '*.tex'),
+                            recursive=True)
+                + [os.path.join(base, 'README.md')])
+    for name in files:
+        with open(name, encoding='utf-8') as f:
+            latex = f.read()
+        reference = scanner.Scanner(parms).scan(latex)
+        table = scanner.TableScanner(parms).scan(latex)
+        assert describe(table) == describe(reference), name
+
+def test_slotted_tokens():
+    parms = parameters.Parameters()
+    toks = parms.scanner.scan('A \\verb?x? #1 \\begin{itemize}\\item\\\'e%\n')
+    for t in toks:
+        assert not hasattr(t, '__dict__'), repr(t)
+
+@pytest.mark.parametrize('latex', data_test_engines)
+def test_token_table(latex):
+    parms = parameters.Parameters()
+    toks = parms.scanner.scan(latex)
+    table = parms.scanner.scan(latex, table=True)
+    assert len(table) == len(toks)
+    assert describe(table) == describe(toks)
+    assert [table.text(i) for i in range(len(table))] == [t.txt for t in toks]
+    assert describe(table[1:-1]) == describe(toks[1:-1])
+
+def test_token_table_compress():
+    parms = parameters.Parameters()
+    latex = 'A % comment\n  \\verb?x? B\\begin{verbatim}y\\end{verbatim}\\verb'
+    toks = parms.scanner.scan(latex)
+    table = parms.scanner.scan(latex, table=True)
+    comment = table.codes[defs.CommentToken]
+    table = table.compress(k != comment for k in table.kind)
+    expected = [t for t in toks if type(t) is not defs.CommentToken]
+    assert describe(table) == describe(expected)
+    assert describe([table[-2], table[-1]]) == describe(expected[-2:])
+
+@pytest.mark.parametrize('latex', data_test_engines)
+def test_iter_scan(latex):
+    parms = parameters.Parameters()
+    expected = describe(parms.scanner.scan(latex))
+    toks = []
+    for t in parms.scanner.iter_scan(latex):
+        # nested scans must not disturb the generator
+        parms.scanner.scan('\\x{y} %z\n')
+        toks.append(t)
+    assert describe(toks) == expected
+
+def test_stream_buffer():
+    parms = parameters.Parameters()
+    latex = 'A \\x  %c\n {B} C'
+    toks = parms.scanner.scan(latex)
+    buf = scanner.StreamBuffer(parms.scanner.iter_scan(latex), chunk_size=2)
+    assert buf.cur().txt == 'A'
+    assert buf.next().txt == ' '
+    assert buf.next().txt == '\\x'
+    buf.next()
+    assert buf.look_ahead().txt == '{'
+    assert describe(buf.all()) == describe(toks[3:])
+    assert buf.skip_space().txt == '{'
+    buf.back([defs.TextToken(0, 'D')])
+    assert [t.txt for t in buf.all()] == ['D', '{', 'B', '}', ' ', 'C']
+    while buf.next():
+        pass
+    assert buf.cur() is None
+
+data_test_rescan = [
+
+    ('Hello world.', 6, 5, 'there'),
+    ('a % comment\nb', 12, 0, '   '),
+    ('a % comment\n b', 12, 1, 'x'),
+    ('a % comment\n\n b', 12, 1, ''),
+    ('a\\verb?x? b', 7, 0, '?'),
+    ('a\\verb?x\ny? b', 8, 1, ''),
+    ('A\\begin{verbatim}x\\end{verbatim}B', 20, 4, 'y'),
+    ('A\\begin{verbatim}x\n\n\nB', 21, 0, '\\end{verbatim}'),
+    ('A\\begin  \n  {verbatim}x\\end{verbatim}B', 9, 0, '\n'),
+    ('A\\begin  \n\n  {verbatim}x\\end{verbatim}B', 9, 1, ''),
+    ('\\foo bar', 4, 0, 'x'),
+    ('x--y', 3, 0, '-'),
+    ('#1 #2', 4, 1, 'x'),
+    ('abc', 0, 3, ''),
+    ('', 0, 0, 'a % b\n  c'),
+    ('%%% LT-SKIP-BEGIN\n%%% LT-SKIP-END\n {}%%% LT-SKIP-END\n', 19, 0,
+        '\\end{tikzpicture}'),
+    ('a \\verb|x\n\nab', 11, 0, 'cd'),
+
+]
+
+@pytest.mark.parametrize('latex,offset,removed,inserted', data_test_rescan)
+def test_rescan(latex, offset, removed, inserted):
+    parms = parameters.Parameters()
+    new_latex = latex[:offset] + inserted + latex[offset+removed:]
+    expected = describe(scanner.Scanner(parms).scan(new_latex))
+    sc = parms.scanner
+    toks = sc.rescan(sc.scan(latex), offset, removed, inserted)
+    assert describe(toks) == expected
+    assert sc.latex == new_latex
+
+@pytest.mark.parametrize('raw,runs', [(False, False), (True, True)])
+def test_rescan_random(raw, runs):
+    rnd = random.Random(0)
+    parms = parameters.Parameters()
+    if raw:
+        parms.raw_environments = ['tikzpicture']
+    parms.text_runs = runs
+    pieces = ['x', ' ', '\n', '%', '\\', '\\verb?', '?', '{verbatim}',
+                '\\begin{verbatim}', '\\end{verbatim}', '--', '#1', '\\foo ',
+                '%%% LT-SKIP-BEGIN\n', '%%% LT-SKIP-END\n', '{}', 'ab cd',
+                '\\begin{tikzpicture}', '\\end{tikzpicture}']
+    for n in range(1000):
+        if n % 50 == 0:
+            # short texts, where edits often reach the start or the end,
+            # half of them beginning with a skipped region
+            latex = (''.join(data_test_engines) if n == 0 else
+                        ''.join(rnd.choice(pieces) for _ in range(8)))
+            if n % 100:
+                latex = '%%% LT-SKIP-BEGIN\n' + latex
+            toks = parms.scanner.scan(latex)
+        offset = rnd.randrange(len(latex) + 1)
+        removed = min(rnd.choice([0, 1, 3, 20]), len(latex) - offset)
+        inserted = ''.join(rnd.choice(pieces) for _ in range(rnd.randrange(3)))
+        toks = parms.scanner.rescan(toks, offset, removed, inserted)
+        latex = latex[:offset] + inserted + latex[offset+removed:]
+        assert describe(toks) == describe(scanner.Scanner(parms).scan(latex))
+
+#   skipped regions yield no tokens: edits inside, before and across the
+#   special comments
+#
+data_test_rescan_skip = [
+
+    'A %%% LT-SKIP-BEGIN\nB\n\nC %\n%%% LT-SKIP-END\nD\n\nE',
+    '%%% LT-SKIP-BEGIN\nB\\verb?x\n%%% LT-SKIP-END\n  D %%% LT-SKIP-END\n',
+    'A\n%%% LT-SKIP-BEGIN\n%%% LT-SKIP-END\n%%% LT-SKIP-BEGIN\nC',
+
+]
+
+@pytest.mark.parametrize('latex', data_test_rescan_skip)
+def test_rescan_skip(latex):
+    parms = parameters.Parameters()
+    sc = parms.scanner
+    edits = [(0, '%'), (0, '\n'), (0, 'x'), (1, ''), (5, ''),
+                (0, '%%% LT-SKIP-BEGIN\n'), (0, '%%% LT-SKIP-END\n')]
+    for offset in range(len(latex) + 1):
+        for removed, inserted in edits:
+            removed = min(removed, len(latex) - offset)
+            new_latex = latex[:offset] + inserted + latex[offset+removed:]
+            toks = sc.rescan(sc.scan(latex), offset, removed, inserted)
+            assert (describe(toks)
+                    == describe(scanner.Scanner(parms).scan(new_latex)))
+
+def test_buffer():
+    parms = parameters.Parameters()
+    toks = parms.scanner.scan('A \\x  %c\n {B} C')
+    base = list(toks)
+    buf = scanner.Buffer(toks)
+    assert buf.cur().txt == 'A'
+    buf.next()
+    assert buf.look_ahead().txt == '\\x'
+    assert buf.cur().txt == ' '
+    buf.next()
+    buf.next()
+    assert buf.look_ahead().txt == '{'
+    assert buf.cur().txt == '  '
+    buf.back([defs.SpaceToken(0, ' '), defs.TextToken(0, 'D')])
+    assert buf.look_ahead().txt == 'D'
+    assert [t.txt for t in buf.all()][:3] == [' ', 'D', '  ']
+    assert buf.skip_space().txt == 'D'
+    buf.next()
+    assert buf.skip_space().txt == '{'
+    buf.next()
+    mark = buf.mark()
+    buf.next()
+    view = buf.since(mark)
+    assert [t.txt for t in view.all()] == ['B']
+    assert view.base is toks
+    assert toks == base
+
+def test_arg_buffer_view():
+    parms = parameters.Parameters()
+    p = parser.Parser(parms)
+    toks = parms.scanner.scan('{a{b}c}d')
+    buf = scanner.Buffer(toks)
+    arg = p.arg_buffer(buf, 0)
+    assert arg.base is toks
+    assert ''.join(t.txt for t in arg.all()) == 'a{b}c'
+    assert buf.cur().txt == 'd'
+    buf = scanner.Buffer(parms.scanner.scan('y}z'))
+    buf.back([defs.SpecialToken(0, '{'), defs.TextToken(0, 'x')])
+    arg = p.arg_buffer(buf, 0)
+    assert ''.join(t.txt for t in arg.all()) == 'xy'
+    assert buf.cur().txt == 'z'
+
+def test_scan_cached():
+    parms = parameters.Parameters()
+    sc = parms.scanner
+    latex = '\\textbf{#2} and #1 %c\n'
+    toks = sc.scan_cached(latex)
+    assert type(toks) is tuple
+    assert describe(toks) == describe(sc.scan(latex))
+    assert sc.scan_cached(latex) is toks
+    assert sc.scan_cached('') == ()
+    parms.text_runs = True
+    assert describe(sc.scan_cached('ab cd')) == describe(sc.scan('ab cd'))
+    parms.text_runs = False
+    assert describe(sc.scan_cached('ab cd')) == describe(sc.scan('ab cd'))
+
+def test_scan_cached_limit(monkeypatch):
+    monkeypatch.setattr(scanner.Scanner, 'scan_cache', {})
+    monkeypatch.setattr(scanner.Scanner, 'scan_cache_size', 3)
+    sc = parameters.Parameters().scanner
+    first = sc.scan_cached('x0')
+    for i in range(1, 10):
+        sc.scan_cached('x' + str(i))
+    assert len(scanner.Scanner.scan_cache) == 3
+    assert sc.scan_cached('x9') is sc.scan_cached('x9')
+    assert sc.scan_cached('x0') is not first
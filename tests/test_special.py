@@ -224,3 +224,26 @@ def test_9(capsys):
     assert plain_9 == plain
     assert stderr_9 == captured.err
 
+
+#   %%% LT-SKIP: closing comment has to start a LaTeX comment
+#
+latex_10 = r"""
+A
+%%% LT-SKIP-BEGIN
+\%%% LT-SKIP-END
+x % %%% LT-SKIP-END
+%%% LT-SKIP-END
+B
+"""
+plain_10 = r"""
+A
+B
+"""
+def test_10():
+    p = parser.Parser(parameters.Parameters())
+    toks = p.parse(latex_10)
+    plain, pos = utils.get_txt_pos(toks)
+    assert plain_10 == plain
+    # skipped text is not tokenized
+    toks = p.parms.scanner.scan(latex_10)
+    assert [t.txt for t in toks] == ['\n', 'A', '\n', 'B', '\n']
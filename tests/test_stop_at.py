@@ -0,0 +1,64 @@
+
+#
+#   test of parser option stop_at
+#
+
+import types
+from yalafi import parameters, parser, tex2txt, utils
+from yalafi.shell import addpacks
+
+
+def get_plain(latex, **kw):
+    p = parser.Parser(parameters.Parameters())
+    plain, pos = utils.get_txt_pos(p.parse(latex, **kw))
+    return plain, p
+
+latex_1 = r"""\newcommand{\x}{X}
+A
+\begin{document}
+\x B
+\end{document}
+C \y $
+"""
+def test_stop_at_begin(capsys):
+    capsys.readouterr()
+    plain, p = get_plain(latex_1, stop_at='begin')
+    assert plain == 'A\n'
+    assert '\\x' in p.the_macros
+    assert p.get_unknowns() == []
+    assert capsys.readouterr().err == ''
+
+def test_stop_at_end(capsys):
+    capsys.readouterr()
+    plain, p = get_plain(latex_1, stop_at='end')
+    assert plain == 'A\nXB\n'
+    assert p.get_unknowns() == ['document']
+    assert capsys.readouterr().err == ''
+
+def test_no_stop(capsys):
+    plain, p = get_plain(latex_1)
+    assert plain.startswith('A\nXB\nC ')
+    assert '\\y' in p.get_unknowns()
+    assert 'missing end of maths' in capsys.readouterr().err
+
+def test_tex2txt_iter():
+    opts = tex2txt.Options(lang='en', stop='begin')
+    parts = list(tex2txt.tex2txt_iter(latex_1, opts))
+    assert ''.join(txt for txt, pos in parts) == 'A\n'
+
+latex_2 = r"""\documentclass{article}
+\usepackage{amsmath,xcolor}
+\begin{document}
+\usepackage{tikz}
+\end{document}
+"""
+def test_addpacks(tmp_path):
+    tex = tmp_path / 'in.tex'
+    tex.write_text(latex_2)
+    cmdline = types.SimpleNamespace(packages='', define=None,
+                    language='en-GB', documentclass='', add_modules=str(tex),
+                    encoding='utf-8')
+    addpacks.packages.clear()
+    dcls, packs = addpacks.addpacks(cmdline, '<unknown>')
+    assert dcls == 'article'
+    assert packs == ['amsmath', 'xcolor']
@@ -0,0 +1,58 @@
+
+#
+#   test of Parser.get_text_expanded(): plain text and cached results
+#
+
+from yalafi import parameters, parser
+
+
+def toks(p, latex):
+    return list(p.parms.scanner.scan(latex))
+
+def test_plain_text():
+    p = parser.Parser(parameters.Parameters())
+    def fail(buf):
+        raise AssertionError('expand_sequence() called')
+    p.expand_sequence = fail
+    assert p.get_text_expanded(toks(p, 'fig:a-b %x\n c')) == 'fig:a-b c'
+    assert p.text_cache == {}
+
+def test_active_chars():
+    # "a is a short macro of babel for German
+    parms = parameters.Parameters('de-DE')
+    p = parser.Parser(parms)
+    assert p.get_text_expanded(toks(p, '"a')) == 'ä'
+
+def test_cache():
+    p = parser.Parser(parameters.Parameters())
+    p.parse('\\newcommand{\\x}{X}')
+    assert p.get_text_expanded(toks(p, 'a\\x')) == 'aX'
+    assert len(p.text_cache) == 1
+    assert p.get_text_expanded(toks(p, 'a\\x')) == 'aX'
+    assert len(p.text_cache) == 1
+    # new definition gives new table version
+    p.parse('\\renewcommand{\\x}{Y}')
+    assert p.get_text_expanded(toks(p, 'a\\x')) == 'aY'
+
+def test_side_effects():
+    p = parser.Parser(parameters.Parameters())
+    p.parse('')
+    for i in range(2):
+        assert p.get_text_expanded(toks(p, 'a\\zz')) == 'a'
+    assert p.get_unknowns(counts=True) == [('\\zz', 2, '<unknown>', 1, 2)]
+    # \newcommand is a Python handler
+    p.get_text_expanded(toks(p, '\\newcommand{\\y}{Y}'))
+    assert p.text_cache == {}
+
+def test_maths():
+    # maths rotates the placeholders, compare with uncached expansion
+    out = []
+    for cached in (True, False):
+        p = parser.Parser(parameters.Parameters())
+        if not cached:
+            p.text_cache_types = frozenset()
+        p.parse('')
+        txt = [p.get_text_expanded(toks(p, 'Heading $a$')),
+                p.get_text_expanded(toks(p, 'Heading $a$'))]
+        out.append((txt, p.parse('$b$')[-1].txt))
+    assert out[0] == out[1] == (['Heading C-C-C', 'Heading D-D-D'], 'E-E-E')
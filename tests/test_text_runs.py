@@ -0,0 +1,70 @@
+
+#
+#   test of Parameters.text_runs:
+#   coalesced text tokens have to give the same plain text and the same
+#   position mapping as one token per character
+#
+
+import glob
+import os
+import pytest
+from yalafi import parameters, scanner, tex2txt
+
+def get_txt_pos(latex, text_runs, lang='en'):
+    def modify_parms(parms):
+        parms.text_runs = text_runs
+    opts = tex2txt.Options(lang=lang, pack='*')
+    return tex2txt.tex2txt(latex, opts, modify_parms=modify_parms)
+
+data_test_text_runs = [
+
+    ('Hello world.\n\nNew   paragraph 42 x1y2.\n', 'en'),
+    ('\\section{Title text}Some text.', 'en'),
+    ('\\newcommand{\\xx}[2]{#2 and #1}\\xx abc\\xx{a b}{cd e}', 'en'),
+    ('\\newcommand{\\xx}[2][opt]{#2 and #1}\\xx[x y]abc', 'en'),
+    ('\\def\\xx#1#2{(#2 #1)}\\xx ab cd', 'en'),
+    ("\\'ab \\`{a}b \\\"oo \\c cat", 'en'),
+    ('\\textbf{bold text} \\emph x ample \\label{ab cd} end', 'en'),
+    ('A \\cite[p. 12]{key} B \\ref{lab}.', 'en'),
+    ('\\begin{itemize}\\item one two\\item[lab el] three\\end{itemize}', 'en'),
+    ('text $x + y = 42$ more text\n\\[ a b \\]\nEnd', 'en'),
+    ('\\begin{proof}Proof text\\end{proof}', 'en'),
+    ('\\MakeUppercase{abc def}gh', 'en'),
+    ('\\usepackage[ngerman]{babel}Sch"one "Uberraschung "a "s', 'de-DE'),
+    ('\\verb?a b c? abc \\LTalter{ab cd}{ef gh} \\LTskip{xx yy}', 'en'),
+    ('ab % comment\n  cd\n\nef', 'en'),
+
+]
+
+@pytest.mark.parametrize('latex,lang', data_test_text_runs)
+def test_text_runs(latex, lang):
+    expected = get_txt_pos(latex, False, lang)
+    assert get_txt_pos(latex, True, lang) == expected
+
+def test_text_runs_files():
+    base = os.path.dirname(os.path.abspath(__file__))
+    files = glob.glob(os.path.join(base, '**', '*.tex'), recursive=True)
+    for name in files:
+        with open(name, encoding='utf-8') as f:
+            latex = f.read()
+        expected = get_txt_pos(latex, False)
+        assert get_txt_pos(latex, True) == expected, name
+
+def test_fewer_tokens():
+    latex = 'Some words and numbers 123, more words.\n'
+    parms = parameters.Parameters()
+    single = parms.scanner.scan(latex)
+    parms.text_runs = True
+    runs = parms.scanner.scan(latex)
+    assert len(runs) < len(single) // 4
+    assert ''.join(t.txt for t in runs) == latex
+    assert [t.txt for t in runs[:2]] == ['Some words and numbers 123', ',']
+
+def test_engines():
+    latex = 'ab cd\te\nf \u00e4\u00f6 x_1 y~z a--b \\foo12 ab%c\n'
+    parms = parameters.Parameters()
+    parms.text_runs = True
+    reference = scanner.Scanner(parms).scan(latex)
+    table = scanner.TableScanner(parms).scan(latex)
+    assert list(map(repr, table)) == list(map(repr, reference))
+
@@ -3,7 +3,8 @@
 #   - test of option --unkn
 #
 
-from yalafi import tex2txt
+import subprocess
+from yalafi import parameters, parser, tex2txt
 
 options = tex2txt.Options(unkn=True)
 
@@ -21,3 +22,46 @@ def test_1():
     plain, nums = tex2txt.tex2txt(latex_1, options)
     assert plain_1 == plain
 
+
+#   counts and first positions
+#
+latex_2 = r"""A \xxx
+\begin{yyy}\xxx $\zzz$
+\end{yyy}
+"""
+def test_counts():
+    p = parser.Parser(parameters.Parameters())
+    p.parse(latex_2, source='t.tex')
+    assert p.get_unknowns() == ['\\xxx', 'yyy']
+    assert p.get_unknowns(counts=True) == [('\\xxx', 2, 't.tex', 1, 3),
+                                            ('yyy', 1, 't.tex', 2, 1)]
+
+def test_merge():
+    opts = tex2txt.Options(utot={})
+    tex2txt.tex2txt(latex_2, opts, source='a.tex')
+    tex2txt.tex2txt('\\yyy\\begin{yyy}\n\\xxx', opts, source='b.tex')
+    assert opts.utot == {'\\xxx': [3, 'a.tex', 1, 3],
+                            'yyy': [2, 'a.tex', 2, 1],
+                            '\\yyy': [1, 'b.tex', 1, 1]}
+    assert tex2txt.format_unknowns(opts.utot) == (
+                    '      3  \\xxx  a.tex:1:3\n'
+                    '      2  yyy  a.tex:2:1\n'
+                    '      1  \\yyy  b.tex:1:1\n')
+
+def test_merge_multi_language():
+    opts = tex2txt.Options(utot={})
+    tex2txt.tex2txt(latex_2, opts, source='a.tex')
+    utot = opts.utot
+    opts.utot = {}
+    tex2txt.tex2txt(latex_2, opts, source='a.tex', multi_language=True)
+    assert opts.utot == utot
+
+def test_unkn_files(tmp_path):
+    files = []
+    for n, latex in enumerate([latex_2, '\\xxx']):
+        files.append(tmp_path / ('f' + str(n) + '.tex'))
+        files[-1].write_text(latex)
+    cmd = ['python', '-m', 'yalafi', '--unkn'] + [str(f) for f in files]
+    out = subprocess.run(cmd, stdout=subprocess.PIPE).stdout.decode()
+    assert out == ('      3  \\xxx  ' + str(files[0]) + ':1:3\n'
+                    + '      1  yyy  ' + str(files[0]) + ':2:1\n')
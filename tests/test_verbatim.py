@@ -15,6 +15,14 @@ def test_verb():
     assert plain == '%x\\y?'
 
 
+def test_verb_special():
+
+    # verbatim text equal to a special token is no maths or brace
+    latex = 'a \\verb?$? b \\verb?{? c \\verb?\\\\? d'
+    plain, nums = tex2txt.tex2txt(latex, options)
+    assert plain == 'a $ b { c \\\\ d'
+
+
 def test_verbatim():
 
     # extra blank lines: see LAB:VERBATIM in tex2txt.py
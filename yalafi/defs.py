@@ -26,6 +26,7 @@ by the parsing mechanism and :class:`Macro`, and :class:`Environ`,
 environments, and math environments, respectively.
 """
 
+import copy
 from yalafi import utils
 
 
@@ -35,17 +36,24 @@ class InitModule:
     LaTeX packages and document classes.
     """
     def __init__(self, macros_latex='', macros_python=None, environments=None,
-                       inject_tokens=None):
+                       inject_tokens=None, raw_environments=None):
         if macros_python is None:
             macros_python = []
         if environments is None:
             environments = []
         if inject_tokens is None:
             inject_tokens = []
+        if raw_environments is None:
+            raw_environments = []
         self.macros_latex = macros_latex
         self.macros_python = macros_python
         self.environs = environments
         self.inject_tokens = inject_tokens
+        self.raw_environs = raw_environments
+        """
+        Names of environments whose body is skipped by the scanner, see
+        :attr:`yalafi.parameters.Parameters.raw_environments`.
+        """
 
 
 class Printable:
@@ -53,8 +61,12 @@ class Printable:
     Base class for all tokens which implements a functions to print
     tokens to the console.
     """
+
+    __slots__ = ()
+
     def __repr__(self):
-        variables = list(v for v in dir(self) if not v.startswith('_'))
+        variables = list(v for v in dir(self) if not v.startswith('_')
+                                    and not callable(getattr(self, v)))
         variables.sort()
         def get(v):
             return self.__getattribute__(v)
@@ -86,13 +98,29 @@ class TextToken(Printable):
       pos=0, pos_fix=True)` and all characters in ``'my long text'``
       have position ``0`` because they stem from the expanded
       ``\command{}``.
+
+    All token classes declare their attributes in ``__slots__``, tokens
+    do not carry an instance dictionary.
     """
 
+    __slots__ = ('pos', 'txt', 'pos_fix')
+
     def __init__(self, pos, txt, pos_fix=False):
         self.pos = pos
         self.txt = txt
         self.pos_fix = pos_fix
 
+    def last_pos(self):
+        r"""
+        Return the position of the last character of :attr:`txt`.
+
+        Only differs from :attr:`pos` for coalesced text runs, see
+        :attr:`yalafi.parameters.Parameters.text_runs`.
+        """
+        if type(self) is TextToken and not self.pos_fix and self.txt:
+            return self.pos + len(self.txt) - 1
+        return self.pos
+
 
 class SpaceToken(TextToken):
     """
@@ -102,6 +130,8 @@ class SpaceToken(TextToken):
     arguments.
     """
 
+    __slots__ = ()
+
     # pylint: disable-next=useless-parent-delegation
     def __init__(self, pos, txt, pos_fix=False):
         super().__init__(pos, txt, pos_fix)
@@ -114,6 +144,8 @@ class ParagraphToken(TextToken):
     See :class:`TextToken` for all attributes.
     """
 
+    __slots__ = ()
+
     # pylint: disable-next=useless-parent-delegation
     def __init__(self, pos, txt, pos_fix=False):
         super().__init__(pos, txt, pos_fix)
@@ -126,6 +158,8 @@ class CommentToken(TextToken):
     See :class:`TextToken` for all attributes.
     """
 
+    __slots__ = ()
+
     def __init__(self, pos, txt):
         super().__init__(pos, txt)
 
@@ -138,6 +172,8 @@ class SpecialToken(TextToken):
     See :class:`TextToken` for all attributes.
     """
 
+    __slots__ = ()
+
     def __init__(self, pos, txt):
         super().__init__(pos, txt)
 
@@ -152,6 +188,8 @@ class MacroToken(TextToken):
       pos: Position of the ``\`` in LaTeX source.
     """
 
+    __slots__ = ()
+
     def __init__(self, pos, txt):
         super().__init__(pos, txt)
 
@@ -165,6 +203,8 @@ class BeginToken(TextToken):
       pos: Position of the ``\`` in LaTeX source.
     """
 
+    __slots__ = ()
+
     # TODO: Fix `txt = '\\begin'`?
     def __init__(self, pos, txt):
         super().__init__(pos, txt)
@@ -179,6 +219,8 @@ class EndToken(TextToken):
       pos: Position of the ``\`` in LaTeX source.
     """
 
+    __slots__ = ()
+
     # TODO: Fix `txt = '\\end'`?
     def __init__(self, pos, txt):
         super().__init__(pos, txt)
@@ -193,6 +235,8 @@ class ItemToken(TextToken):
       pos: Position of the ``\`` in LaTeX source.
     """
 
+    __slots__ = ()
+
     def __init__(self, pos, txt):
         super().__init__(pos, txt)
 
@@ -206,6 +250,8 @@ class AccentToken(TextToken):
     See :class:`TextToken` for all attributes.
     """
 
+    __slots__ = ()
+
     def __init__(self, pos, txt):
         super().__init__(pos, txt)
 
@@ -223,11 +269,33 @@ class VerbatimToken(TextToken):
           an environment.
     """
 
+    __slots__ = ('environ',)
+
     def __init__(self, pos, txt, environ=False):
         super().__init__(pos, txt)
         self.environ = environ
 
 
+class RawEnvironToken(TextToken):
+    r"""
+    Token for a whole environment ``\begin{name}…\end{name}`` whose
+    body is not scanned.
+    See :attr:`yalafi.parameters.Parameters.raw_environments`.
+
+    Attributes:
+        pos: Position of ``\begin`` in source.
+        txt: The source text from ``\begin`` till the closing ``}``
+          of ``\end{name}``.
+        name: Name of the environment.
+    """
+
+    __slots__ = ('name',)
+
+    def __init__(self, pos, txt, name):
+        super().__init__(pos, txt)
+        self.name = name
+
+
 class ArgumentToken(TextToken):
     r"""
     Token for argument replacement symbol like ``#2`` appearing for
@@ -239,6 +307,8 @@ class ArgumentToken(TextToken):
         arg: Integer representation of the argument number, e.g. ``2``.
     """
 
+    __slots__ = ('arg',)
+
     def __init__(self, pos, txt, arg):
         super().__init__(pos, txt)
         self.arg = arg
@@ -257,6 +327,8 @@ class ActionToken(TextToken):
     :class:`ActionToken`.
     """
 
+    __slots__ = ()
+
     def __init__(self, pos):
         super().__init__(pos, '')
 
@@ -266,15 +338,39 @@ class VoidToken(TextToken):
     Empty token which is returned after parsing empty arguments.
     """
 
+    __slots__ = ()
+
     def __init__(self, pos):
         super().__init__(pos, '')
 
 
+class InputToken(TextToken):
+    r"""
+    Token for a file read by ``\LTinput``.
+
+    The file is expanded in a frame of its own, see
+    :meth:`yalafi.parser.Parser.expand_sequence`.
+
+    Attributes:
+        latex: Content of the file.
+        source: Name of the file.
+    """
+
+    __slots__ = ('latex', 'source')
+
+    def __init__(self, pos, latex, source):
+        super().__init__(pos, '')
+        self.latex = latex
+        self.source = source
+
+
 class LanguageToken(TextToken):
     """
     Token inserted to change the language.
     """
 
+    __slots__ = ('lang', 'back', 'hard', 'brk')
+
     def __init__(self, pos, lang='', back=False, hard=False, brk=False):
         super().__init__(pos, '')
         self.lang = lang
@@ -301,26 +397,102 @@ class LanguageToken(TextToken):
 
 
 class MathBeginToken(TextToken):
+    __slots__ = ('environ',)
+
     def __init__(self, pos, text, env):
         super().__init__(pos, text)
         self.environ = env
 
 
 class MathElemToken(TextToken):
+    __slots__ = ()
+
     def __init__(self, pos, text):
         super().__init__(pos, text)
 
 
 class MathOperToken(TextToken):
+    __slots__ = ()
+
     def __init__(self, pos, text):
         super().__init__(pos, text)
 
 
 class MathSpaceToken(TextToken):
+    __slots__ = ()
+
     def __init__(self, pos, text):
         super().__init__(pos, text)
 
 
+class Template:
+    """
+    Replacement of a macro or environment compiled for expansion.
+
+    The token sequence is split into runs of literal tokens and argument
+    slots, such that :meth:`expand` does not need to inspect the tokens
+    again.
+
+    Attributes:
+        toks: Token sequence the template was compiled from.
+        parts: Tuple of zero-based argument numbers and tuples of
+          literal tokens.
+        last_args: Zero-based argument numbers in reverse order of
+          appearance.
+    """
+
+    __slots__ = ('toks', 'parts', 'last_args')
+
+    def __init__(self, toks):
+        self.toks = toks
+        parts = []
+        run = []
+        for t in toks:
+            if type(t) is ArgumentToken:
+                if run:
+                    parts.append(tuple(run))
+                    run = []
+                parts.append(t.arg - 1)
+            else:
+                run.append(t)
+        if run:
+            parts.append(tuple(run))
+        self.parts = tuple(parts)
+        self.last_args = tuple(p for p in reversed(self.parts)
+                                    if type(p) is int)
+
+    def expand(self, arguments, start):
+        """
+        Replace argument slots by `arguments` and return new token list.
+
+        Literal tokens get a fixed position: the position of the first
+        token of the last non-empty argument used, or `start`, and
+        behind an argument, the position of its last character.
+        """
+        cur_pos = start
+        for n in self.last_args:
+            if arguments[n]:
+                # NB: may be an absent optional argument
+                cur_pos = arguments[n][0].pos
+                break
+        out = []
+        for part in self.parts:
+            if type(part) is int:
+                arg = arguments[part]
+                if arg:
+                    out.append(ActionToken(arg[0].pos))
+                    out += arg
+                    cur_pos = arg[-1].last_pos()
+                    out.append(ActionToken(cur_pos))
+                continue
+            for t in part:
+                tok = copy.copy(t)
+                tok.pos = cur_pos
+                tok.pos_fix = True
+                out.append(tok)
+        return out
+
+
 class Expandable(Printable):
     def __init__(self, parms, name, args, repl, defaults,
                                     scanned=False, extract=''):
@@ -335,7 +507,9 @@ class Expandable(Printable):
                             + ' for ' + repr(name))
         self.name = name
         self.args = args
-        self.extract = check(parms.scanner.scan(extract), args)
+        self.templates = {}
+        # scanned tokens are shared by scanner.Scanner.scan_cached()
+        self.extract = check(parms.scanner.scan_cached(extract), args)
         if scanned:
             self.repl = repl
             self.defaults = defaults
@@ -343,8 +517,18 @@ class Expandable(Printable):
         if callable(repl):
             self.repl = repl
         else:
-            self.repl = check(parms.scanner.scan(repl), args)
-        self.defaults = [parms.scanner.scan(op) for op in defaults]
+            self.repl = check(parms.scanner.scan_cached(repl), args)
+        self.defaults = [parms.scanner.scan_cached(op) for op in defaults]
+
+    def template(self, toks):
+        """
+        Return :class:`Template` for token sequence `toks`, usually
+        :attr:`repl` or :attr:`extract`, compiled on first use.
+        """
+        t = self.templates.get(id(toks))
+        if t is None or t.toks is not toks:
+            t = self.templates[id(toks)] = Template(toks)
+        return t
 
 
 class Macro(Expandable):
@@ -97,9 +97,9 @@ def h_theorem(name):
             out.append(defs.SpaceToken(pos, ' ', pos_fix=True))
             out.append(defs.TextToken(pos, '(', pos_fix=True))
             out += args[0]
-            out.append(defs.TextToken(args[0][-1].pos,
+            out.append(defs.TextToken(args[0][-1].last_pos(),
                                         ').', pos_fix=True))
-            out.append(defs.SpaceToken(args[0][-1].pos,
+            out.append(defs.SpaceToken(args[0][-1].last_pos(),
                                         '\n', pos_fix=True))
         else:
             # unnamed theorem
@@ -133,7 +133,7 @@ def h_heading(parser, buf, mac, args, delim, pos):
     txt = parser.get_text_expanded(arg).strip()
     if (txt and parser.parms.heading_punct
                 and txt[-1] not in parser.parms.heading_punct):
-        arg.append(defs.TextToken(arg[-1].pos, '.'))
+        arg.append(defs.TextToken(arg[-1].last_pos(), '.'))
     return arg
 
 
@@ -197,8 +197,8 @@ def h_cite(parser, buf, mac, args, delim, pos):
         out = [defs.TextToken(pos, '[0,', pos_fix=True),
                     defs.SpaceToken(pos, ' ', pos_fix=True)]
         out += args[0]
-        out += [defs.TextToken(args[0][-1].pos, ']'),
-                    defs.ActionToken(args[0][-1].pos)]
+        out += [defs.TextToken(args[0][-1].last_pos(), ']'),
+                    defs.ActionToken(args[0][-1].last_pos())]
     else:
         out = [defs.TextToken(pos, '[0]', pos_fix=True),
                     defs.ActionToken(pos)]
@@ -225,12 +225,11 @@ def h_load_defs(parser, buf, mac, args, delim, pos):
     if not ok:
         return utils.latex_error(parser, 'could not read file ' + repr(file),
                                         pos)
-    try:
-        toks = parser.parser_work(latex, file)
-    except RecursionError:
+    if file in parser.input_files:
         utils.fatal('Problem while executing "' + mac.name + '{' + file
                     + '}".\n' + '*** Is the file included recursively?')
-    return utils.filter_set_toks(toks, pos, defs.LanguageToken)
+    # the file is expanded by the parser, see Parser.expand_input()
+    return [defs.InputToken(pos, latex, file)]
 
 #   read definitions for a LaTeX package
 #
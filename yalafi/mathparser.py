@@ -37,6 +37,8 @@ class MathPartToken(defs.TextToken):
         toks: List of contained tokens.
     """
 
+    __slots__ = ('toks',)
+
     def __init__(self, toks):
         super().__init__(toks[0].pos, toks[0].txt)
         self.toks = toks
@@ -144,10 +146,10 @@ class MathParser:
                         self.parser.parms.lang_context.math_repl_display)
             out += sec
             if end and end.txt == '&':
-                out.append(defs.SpaceToken(out[-1].pos, ' ', pos_fix=True))
+                out.append(defs.SpaceToken(out[-1].last_pos(), ' ', pos_fix=True))
                 first_section = False
             elif end and end.txt == '\\\\':
-                out.append(defs.SpaceToken(out[-1].pos, '\n  ', pos_fix=True))
+                out.append(defs.SpaceToken(out[-1].last_pos(), '\n  ', pos_fix=True))
                 self.parser.parse_newline_option(buf, False)
                 first_section = True
                 if env.no_first_section:
@@ -160,9 +162,9 @@ class MathParser:
         if env.remove:
             txt = self.parser.get_text_direct(out).strip()
             if txt and txt[-1] in self.parser.parms.math_punctuation:
-                out = [defs.TextToken(out[-1].pos, txt[-1], pos_fix=True)]
+                out = [defs.TextToken(out[-1].last_pos(), txt[-1], pos_fix=True)]
             else:
-                out = [defs.ActionToken(out[-1].pos)]
+                out = [defs.ActionToken(out[-1].last_pos())]
         else:
             if self.parser.parms.math_displayed_simple:
                 txt = self.parser.get_text_direct(out).strip()
@@ -172,9 +174,9 @@ class MathParser:
                                         lang_context.math_repl_display[0],
                                         pos_fix=True)]
                 if txt and txt[-1] in self.parser.parms.math_punctuation:
-                    out.append(defs.TextToken(out[-1].pos, txt[-1],
+                    out.append(defs.TextToken(out[-1].last_pos(), txt[-1],
                                                         pos_fix=True))
-            out.append(defs.ActionToken(out[-1].pos))
+            out.append(defs.ActionToken(out[-1].last_pos()))
         return out
 
 
@@ -200,7 +202,7 @@ class MathParser:
         t, x = self.replace_section(True, tokens, True, True,
                             self.parser.parms.lang_context.math_repl_inline)
         out += t
-        out.append(defs.ActionToken(out[-1].pos))
+        out.append(defs.ActionToken(out[-1].last_pos()))
         return out
 
 
@@ -254,6 +256,14 @@ class MathParser:
             elif type(tok) is defs.BeginToken:
                 buf.back(parser.begin_environment(buf, tok, True))
                 continue
+            elif type(tok) is defs.RawEnvironToken:
+                buf.next()
+                buf.back(parser.expand_raw_env_token(tok))
+                continue
+            elif type(tok) is defs.InputToken:
+                buf.next()
+                buf.back(parser.expand_input(tok))
+                continue
             elif type(tok) is defs.EndToken:
                 t, stop = parser.end_environment(buf, tok, env_stop)
                 out += t
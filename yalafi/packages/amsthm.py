@@ -35,6 +35,6 @@ def h_proof(parser, buf, mac, args, delim, pos):
     else:
         ret = [TextToken(pos, parser.parms.lang_context.proof_name,
                         pos_fix=True)]
-    return ret + [TextToken(ret[-1].pos, '.', pos_fix=True),
-                        SpaceToken(ret[-1].pos, '\n', pos_fix=True)]
+    return ret + [TextToken(ret[-1].last_pos(), '.', pos_fix=True),
+                        SpaceToken(ret[-1].last_pos(), '\n', pos_fix=True)]
 
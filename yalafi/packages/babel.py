@@ -104,7 +104,7 @@ def translate_lang(lang):
 def h_foreignlanguage(parser, buf, mac, args, delim, pos):
     lang = translate_lang(parser.get_text_expanded(args[1]).strip())
     return ([LanguageToken(pos, lang=lang, brk=foreignlang_break)] + args[2]
-                        + [LanguageToken(args[2][-1].pos, back=True)])
+                        + [LanguageToken(args[2][-1].last_pos(), back=True)])
 
 def h_selectlanguage(parser, buf, mac, args, delim, pos):
     lang = translate_lang(parser.get_text_expanded(args[0]).strip())
@@ -57,22 +57,22 @@ def h_cite(parser, buf, mac, args, delim, pos):
     out = [defs.TextToken(pos, '[', pos_fix=True)]
     if pre:
         out += pre
-        out.append(defs.SpaceToken(out[-1].pos, ' ', pos_fix=True))
-    out.append(defs.TextToken(out[-1].pos, cite_text, pos_fix=True))
+        out.append(defs.SpaceToken(out[-1].last_pos(), ' ', pos_fix=True))
+    out.append(defs.TextToken(out[-1].last_pos(), cite_text, pos_fix=True))
     if post:
-        out += [defs.TextToken(out[-1].pos, ',', pos_fix=True),
-                    defs.SpaceToken(out[-1].pos, ' ', pos_fix=True)]
+        out += [defs.TextToken(out[-1].last_pos(), ',', pos_fix=True),
+                    defs.SpaceToken(out[-1].last_pos(), ' ', pos_fix=True)]
         out += post
-    out += [defs.TextToken(out[-1].pos, ']', pos_fix=True),
-                defs.ActionToken(out[-1].pos)]
+    out += [defs.TextToken(out[-1].last_pos(), ']', pos_fix=True),
+                defs.ActionToken(out[-1].last_pos())]
     return out
 
 def h_footcite(parser, buf, mac, args, delim, pos):
     out = [defs.MacroToken(pos, '\\footnote'),
                 defs.SpecialToken(pos, '{')]
     out += h_cite(parser, buf, mac, args, delim, pos)
-    out += [defs.TextToken(out[-1].pos, '.', pos_fix=True),
-                    defs.SpecialToken(out[-1].pos, '}'),
-                    defs.ActionToken(out[-1].pos)]
+    out += [defs.TextToken(out[-1].last_pos(), '.', pos_fix=True),
+                    defs.SpecialToken(out[-1].last_pos(), '}'),
+                    defs.ActionToken(out[-1].last_pos())]
     return out
 
@@ -24,6 +24,9 @@ def init_module(parser, options, position):
 
     ]
 
+    raw_environments = ['circuitikz']
+
     return InitModule(macros_latex=macros_latex, macros_python=macros_python,
-                        environments=environments)
+                        environments=environments,
+                        raw_environments=raw_environments)
 
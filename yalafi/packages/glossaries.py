@@ -159,7 +159,7 @@ def cap_first(toks):
         # NB: keep original token list
         toks = toks.copy()
         toks[i] = copy.copy(toks[i])
-        toks[i].txt = toks[i].txt[0].upper()
+        toks[i].txt = toks[i].txt[0].upper() + toks[i].txt[1:]
     return toks
 
 #   capitalise all letters
@@ -180,6 +180,6 @@ def modify_description(parser, toks):
     toks = cap_first(toks)
     txt = parser.get_text_expanded(toks)
     if txt and txt[-1] not in ('.', '!', '?'):
-        toks.append(defs.TextToken(toks[-1].pos, '.', pos_fix=True))
+        toks.append(defs.TextToken(toks[-1].last_pos(), '.', pos_fix=True))
     return toks
 
@@ -25,6 +25,9 @@ def init_module(parser, options, position):
 
     ]
 
+    raw_environments = ['lstlisting']
+
     return InitModule(macros_latex=macros_latex, macros_python=macros_python,
-                        environments=environments)
+                        environments=environments,
+                        raw_environments=raw_environments)
 
@@ -23,6 +23,8 @@
    math material settings.
 """
 
+import copy
+
 from yalafi.defs import Environ, EquEnv, Macro
 from yalafi import handlers as hs
 from yalafi import scanner
@@ -53,6 +55,10 @@ class Parameters:
         newcommand_ignore: 
         comment_skip_begin: 
         comment_skip_end: 
+        raw_environments: 
+        max_expansions: 
+        max_buffer_growth: 
+        max_parse_time: 
         class_modules: 
         package_modules: 
         accent_macros: 
@@ -66,7 +72,10 @@ class Parameters:
         math_punctuation: 
         multi_language: 
         ml_continue_thresh: 
-        scanner: 
+        text_runs: 
+        scanner: The scanner, by default a
+          :class:`yalafi.scanner.TableScanner`. Replace it with a
+          :class:`yalafi.scanner.Scanner` for the reference engine.
         proof_name: 
         math_repl_inline: 
         math_repl_inline_vowel: 
@@ -365,6 +374,25 @@ class Parameters:
         self.comment_skip_begin = '%%% LT-SKIP-BEGIN'
         self.comment_skip_end = '%%% LT-SKIP-END'
 
+        #   environments skipped by the scanner: body without effect
+        #   on the output, environment without arguments and with
+        #   Environ(..., remove=True)
+        #
+        self.raw_environments = set()
+
+        #   limits for runaway macros, None: no limit
+        #   - max_expansions: expansions of macros and environments read
+        #     from tokens that were generated by expansions, i.e., since
+        #     a macro or environment has been read from the input
+        #   - max_buffer_growth: number of tokens pushed back to a
+        #     buffer by expansions and not yet read
+        #   - max_parse_time: seconds for Parser.parse(), later macros
+        #     and environments are not expanded
+        #
+        self.max_expansions = None
+        self.max_buffer_growth = None
+        self.max_parse_time = None
+
         #   module directories
         #
         self.class_modules = 'yalafi.documentclasses'
@@ -564,6 +592,50 @@ class Parameters:
         return self.parser_lang_stack[-1][1]
 
 
+    def repl_lists(self):
+        """
+        Return the lists of replacements for maths and language changes
+        in all language settings, which are rotated in place during
+        parsing and creation of the output.
+        """
+        return [lst for s in self.parser_lang_settings.values()
+                    for lst in (s.math_repl_inline, s.math_repl_inline_vowel,
+                                s.math_repl_display, s.math_repl_display_vowel,
+                                s.lang_change_repl, s.lang_change_repl_vowel)]
+
+
+    def repl_state(self):
+        """
+        Return the current order of the lists from
+        :meth:`repl_lists`.
+        """
+        return tuple(tuple(lst) for lst in self.repl_lists())
+
+
+    def set_repl_state(self, state):
+        """
+        Restore the order returned by :meth:`repl_state`.
+        """
+        for lst, saved in zip(self.repl_lists(), state):
+            lst[:] = saved
+
+
+    def copy(self):
+        """
+        Return a copy that can be modified independently, e.g., by
+        packages loaded into a forked parser.
+
+        Lists, dictionaries and sets are copied, their items are shared.
+        """
+        parms = copy.copy(self)
+        for name, value in vars(self).items():
+            if type(value) in (list, dict, set):
+                setattr(parms, name, copy.copy(value))
+        parms.scanner = copy.copy(self.scanner)
+        parms.scanner.parms = parms
+        return parms
+
+
     def no_specials(self):
         """
         Deactivate special macros and magic comments.
@@ -584,8 +656,14 @@ class Parameters:
         self.init_math_collections()
         self.multi_language = False
         self.ml_continue_thresh = 3
+        self.text_runs = False
+        """
+        Boolean indicating whether the scanner generates a single token
+        for runs of letters and digits instead of one token per
+        character.
+        """
         self.init_parser_languages(language)
-        self.scanner = scanner.Scanner(self)
+        self.scanner = scanner.TableScanner(self)
         self.init_macros()
         self.init_environments()
 
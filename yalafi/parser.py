@@ -20,7 +20,9 @@ r"""
 Parsing LaTeX source with advanced macro expansion.
 """
 
+import bisect
 import copy
+import time
 import unicodedata
 
 from yalafi import defs
@@ -34,6 +36,16 @@ class Parser:
     LaTeX parser with advanced macro expansion.
     """
 
+    text_cache_size = 1024
+    """Maximum number of entries in :attr:`text_cache`."""
+    text_cache_types = frozenset([defs.TextToken, defs.SpaceToken,
+                    defs.ParagraphToken, defs.CommentToken, defs.SpecialToken,
+                    defs.MacroToken, defs.AccentToken])
+    """
+    Token classes without attributes beyond position and text, only
+    token lists of these classes are cached by :meth:`get_text_expanded`.
+    """
+
     def __init__(self, parms, packages=None, read_macros=None):
         if packages is None:
             packages = []
@@ -43,23 +55,90 @@ class Parser:
         self.packages = {}
         self.global_latex_options = []
         """Global options passed to document class."""
-        self.the_macros = {}
+        self.the_macros = utils.LayeredDict('builtins')
         r"""Dictionary of all registered LaTeX macros.
 
         The keys are the macro names with preceding ``\``.
         The values are of type :class:`yalafi.defs.Macro`.
+        The layers are given by :meth:`checkpoint`.
         """
-        self.the_environments = {}
+        self.the_environments = utils.LayeredDict('builtins')
         """Dictionary of all registered LaTeX environment.
 
         The keys are the environment names.
         The values are of type :class:`yalafi.defs.Environ`.
+        The layers are given by :meth:`checkpoint`.
+        """
+        self.checkpoints = {}
+        """
+        Dictionary of layer names and saved parameters, packages and
+        global options, see :meth:`checkpoint`.
+        """
+        self.profiler = None
+        """Optional :class:`yalafi.profiler.Profiler` object."""
+        self.observers = {}
+        """
+        Dictionary of callbacks registered by :meth:`add_observer`, the
+        keys are event names.
         """
+        self.init_state()
+
+        # initialise and modify parameters, macros, etc.
+        builtin = [], lambda p, o, n: defs.InitModule(
+                                macros_latex=parms.macro_defs_latex,
+                                macros_python=parms.macro_defs_python,
+                                environments=parms.environment_defs)
+        self.checkpoint('builtins')
+        self.init_package('<builtins>', builtin, [], 0)
+        self.checkpoint('packages')
+        for name, actions in packages:
+            self.init_package(name, actions, [], 0)
+
+
+    def init_state(self):
+        """
+        Initialise parser state that is not taken over by :meth:`fork`.
+        """
+        parms = self.parms
         self.mathparser = mathparser.MathParser(self)
         self.extracted = []
-        self.unknowns = []
+        self.unknowns = {}
+        """
+        Dictionary of unknown macros and environments seen outside of
+        maths, in order of first appearance.  The values are lists of
+        the number of occurrences, and source, line and column of the
+        first occurrence.
+        """
         self.latex = ''
         self.source = self.source_main = '<none>'
+        self.stop_at = None
+        """`None`, ``'begin'`` or ``'end'``, see :meth:`parse`."""
+        self.paragraphs = []
+        """List of :class:`Paragraph` objects, see :meth:`parse_incremental`."""
+        self.incremental = None
+        """LaTeX source, its name and language tokens of the definitions
+        for :meth:`update`."""
+        self.input_files = []
+        """Stack of files currently read by ``\\LTinput``."""
+        self.expansions = 0
+        """Number of expansions of macros and environments."""
+        self.expansion_depth = 0
+        """Nesting depth of calls of :meth:`expand_sequence`, e.g., for
+        arguments expanded by macro handlers."""
+        self.side_effects = 0
+        """
+        Number of expansions with effects beyond the returned tokens,
+        e.g., calls of Python handlers, environments, unknown macros and
+        maths.
+        """
+        self.text_cache = {}
+        """
+        Cache of :meth:`get_text_expanded`, the keys contain token
+        classes and texts, the versions of :attr:`the_macros` and
+        :attr:`the_environments`, and the language context.
+        """
+        self.deadline = None
+        self.expansion_stopped = False
 
         # used by expand_item():
         self.item_macro = defs.Macro(parms, '\\item', args='O', repl='#1')
@@ -70,13 +149,132 @@ class Parser:
                 yield parms.item_default_label[0]
         self.item_lab_stack = [(labs_default(0), '')]
 
-        # initialise and modify parameters, macros, etc.
-        builtin = [], lambda p, o, n: defs.InitModule(
-                                macros_latex=parms.macro_defs_latex,
-                                macros_python=parms.macro_defs_python,
-                                environments=parms.environment_defs)
-        for name, actions in [('<builtins>', builtin)] + packages:
-            self.init_package(name, actions, [], 0)
+        # dispatch tables of expand_sequence(): token classes, texts of
+        # special tokens, and texts of other tokens (rebuilt for each
+        # language context, see update_text_actions())
+        self.type_actions = {
+            defs.ItemToken: self.text_item,
+            defs.MacroToken: self.text_macro,
+            defs.MathBeginToken: self.text_math_begin,
+            defs.AccentToken: self.text_accent,
+            defs.SpecialToken: self.text_special,
+            defs.RawEnvironToken: self.text_raw_environ,
+            defs.VerbatimToken: self.text_verbatim,
+            defs.LanguageToken: self.text_language,
+            defs.CommentToken: self.text_comment,
+            defs.SpaceToken: self.text_space,
+        }
+        # token classes handled in the loop of expand_frames()
+        self.frame_types = frozenset([defs.BeginToken, defs.EndToken,
+                                    defs.InputToken, defs.ParagraphToken])
+        self.special_actions = {
+            '$': self.text_inline_math,
+            '\\(': self.text_inline_math,
+            '$$': self.text_display_math,
+            '\\[': self.text_display_math,
+            '\\\\': self.text_newline,
+            '{': self.text_brace,
+            '}': self.text_brace,
+        }
+        self.text_actions = {}
+        self.text_actions_context = None
+
+        # fast paths of expand_arguments() for frequent argument
+        # signatures, others are read by read_arguments()
+        self.arg_readers = {
+            '': self.read_args_,
+            'A': self.read_args_A,
+            'AA': self.read_args_AA,
+            'OA': self.read_args_OA,
+            '*A': self.read_args_starA,
+        }
+
+
+    def snapshot(self):
+        """
+        Take a snapshot of parameters, macro and environment tables, and
+        loaded packages, e.g., after loading of all packages.
+
+        Later changes of the parser do not affect the snapshot.
+
+        Returns:
+            :class:`Snapshot` object for :meth:`fork` or :meth:`restore`.
+        """
+        return Snapshot(self)
+
+
+    def fork(self, snapshot=None):
+        """
+        Create a new parser in the state of `snapshot`, or in the current
+        state of this parser.
+
+        This avoids repeated loading of packages and definitions for
+        multiple documents.  Changes of the new parser, for instance by
+        ``\\newcommand``, do not affect this parser or the snapshot.
+        Read function, profiler and observers are shared.
+
+        Returns:
+            New :class:`Parser` object.
+        """
+        p = copy.copy(self)
+        p.observers = {e: list(f) for e, f in self.observers.items()}
+        p.restore(snapshot or Snapshot(self))
+        return p
+
+
+    def restore(self, snapshot):
+        """
+        Reset parser to the state of `snapshot` taken by :meth:`snapshot`.
+        """
+        self.parms = snapshot.parms.copy()
+        self.the_macros = snapshot.the_macros.copy()
+        self.the_environments = snapshot.the_environments.copy()
+        self.checkpoints = dict(snapshot.checkpoints)
+        self.packages = dict(snapshot.packages)
+        self.global_latex_options = list(snapshot.global_latex_options)
+        self.parms.set_repl_state(snapshot.repls)
+        self.init_state()
+
+
+    def checkpoint(self, name):
+        """
+        Start layer `name` of :attr:`the_macros` and
+        :attr:`the_environments` for the following changes, and save
+        parameters and loaded packages.
+
+        The parser creates layers ``'builtins'`` and ``'packages'``
+        (for packages passed to the constructor), and :meth:`parse`
+        creates layers ``'preamble'`` (for extractions and definitions)
+        and ``'document'``.  If layer `name` already exists, the layers
+        above are merged into it, see
+        :meth:`yalafi.utils.LayeredDict.checkpoint`.
+        """
+        self.the_macros.checkpoint(name)
+        self.the_environments.checkpoint(name)
+        names = self.the_macros.layer_names()
+        self.checkpoints = {n: s for n, s in self.checkpoints.items()
+                                    if n in names}
+        if name not in self.checkpoints:
+            self.checkpoints[name] = (self.parms.copy(), dict(self.packages),
+                                        list(self.global_latex_options))
+
+
+    def rollback(self, name):
+        """
+        Restore the state at creation of layer `name` by
+        :meth:`checkpoint`.  The time needed is proportional to the
+        number of changed macros and environments.  Layer `name` remains
+        as empty top layer.
+        """
+        self.the_macros.rollback(name)
+        self.the_environments.rollback(name)
+        names = self.the_macros.layer_names()
+        self.checkpoints = {n: s for n, s in self.checkpoints.items()
+                                    if n in names}
+        parms, packages, options = self.checkpoints[name]
+        self.parms = parms.copy()
+        self.packages = dict(packages)
+        self.global_latex_options = list(options)
 
 
     def init_package(self, name, actions, options, position):
@@ -102,6 +300,7 @@ class Parser:
         if (name in self.packages and
                 self.packages[name] == self.global_latex_options + options):
             return out
+        t = time.perf_counter() if self.observers else None
         try:
             for requ in actions[0]:
                 if requ not in self.packages or self.packages[requ] == options:
@@ -112,6 +311,8 @@ class Parser:
             out += self.modify_parameters(name, actions[1], options, position)
         except Exception:
             utils.fatal('error loading module ' + repr(name))
+        if t is not None:
+            self.notify('package', name, position, t)
         return out
 
 
@@ -148,6 +349,7 @@ class Parser:
             self.the_macros[m.name] = m
         for e in mods.environs:
             self.the_environments[e.name] = e
+        self.parms.raw_environments.update(mods.raw_environs)
         if mods.macros_latex:
             self.parser_work(mods.macros_latex, name)
         return mods.inject_tokens
@@ -157,10 +359,10 @@ class Parser:
         """
         Scan and parse (expand) LateX string to tokens.
 
-        Skip text enclosed in special comments
+        Text enclosed in special comments
         :attr:`yalafi.parameters.Parameters.comment_skip_begin` and
         :attr:`yalafi.parameters.Parameters.comment_skip_end` of
-        :attr:`parms`.
+        :attr:`parms` is skipped by the scanner.
 
         Args:
             latex: String with LaTeX source code to be parsed.
@@ -174,42 +376,50 @@ class Parser:
         self.latex = latex
         source_sav = self.source
         self.source = source
-
-        toks = self.parms.scanner.scan(latex, source)
-
-        # treat special comments for skipping LaTeX text
-        out = []
-        last = 0
-        while True:
-            beg = next((i for i in range(last, len(toks))
-                    if type(toks[i]) is defs.CommentToken and
-                    toks[i].txt.startswith(self.parms.comment_skip_begin)),
-                                    len(toks))
-            out += toks[last:beg]
-            if beg == len(toks):
-                break
-            end = next((i for i in range(beg + 1, len(toks))
-                    if type(toks[i]) is defs.CommentToken and
-                    toks[i].txt.startswith(self.parms.comment_skip_end)),
-                                    len(toks))
-            if end == len(toks):
-                out += utils.latex_error(self,
-                                    'cannot find closing LaTeX comment '
-                                    + repr(self.parms.comment_skip_end),
-                                    toks[beg].pos)
-                out += toks[beg+1:]
-                break
-            last = end + 1
-        toks = out
-
-        toks = self.expand_sequence(scanner.Buffer(toks))
+        t = time.perf_counter() if self.observers else None
+
+        # scan lazily: tokens are pulled from the scanner on demand
+        toks = self.parms.scanner.iter_scan(latex, source)
+        # top level as in parser_work_iter(), not counted as nesting
+        toks = self.expand_frames(scanner.StreamBuffer(toks))[0]
+        if t is not None:
+            self.notify('scan', source, 0, t, end=len(latex))
         self.latex = latex_sav
         self.source = source_sav
         return toks
 
 
+    def parser_work_iter(self, latex, source):
+        """
+        Scan and parse (expand) LaTeX string to tokens, pausing at
+        paragraph boundaries, see :meth:`expand_paragraphs`.
+
+        Args:
+            latex: String with LaTeX source code to be parsed.
+            source: Name of the source for debug messages.
+
+        Returns:
+            Generator of expanded token sequences.  Joined, they give
+            the result of :meth:`parser_work`.
+        """
+        latex_sav = self.latex
+        self.latex = latex
+        source_sav = self.source
+        self.source = source
+        t = time.perf_counter() if self.observers else None
+        try:
+            toks = self.parms.scanner.iter_scan(latex, source)
+            yield from self.expand_paragraphs(scanner.StreamBuffer(toks))
+            if t is not None:
+                self.notify('scan', source, 0, t, end=len(latex))
+        finally:
+            self.latex = latex_sav
+            self.source = source_sav
+
+
     def parse(self, latex, source='<unknown>',
-                    define='', source_defs='<unknown>', extract=None):
+                    define='', source_defs='<unknown>', extract=None,
+                    stop_at=None):
         r"""
         Parse LaTeX source.
 
@@ -222,6 +432,11 @@ class Parser:
             extract: List of macro names whose first argument should be
               extracted. If provided, only these macros are handled by
               YaLafi. No other parsing is happening. Defaults to None.
+            stop_at: ``'begin'`` to stop at ``\begin{document}``, for
+              instance to parse the preamble only, ``'end'`` to stop at
+              ``\end{document}``.  The remaining tokens of the file
+              being read are dropped without scanning.  Defaults to
+              None.
 
         Returns:
             List of parsed tokens. First part contains expansion
@@ -230,30 +445,293 @@ class Parser:
             by paragraph breaks. If `extract` is given, the first part
             is removed from the output.
         """
+        main = self.start_parse(source, define, source_defs, extract,
+                                    stop_at)
+        main += self.parser_work(latex, source)
+        self.deadline = None
+        if extract:
+            # Clear `main` again, if only extracted parts are requested.
+            main = []
+        for extr in self.extracted:
+            if extr:
+                main += self.extracted_part(extr)
+        return main
+
+
+    def parse_iter(self, latex, source='<unknown>',
+                    define='', source_defs='<unknown>', extract=None,
+                    stop_at=None):
+        """
+        Parse LaTeX source, yielding the output in parts.
+
+        The arguments are those of :meth:`parse`.  A list of tokens is
+        yielded as soon as the expansion reaches a paragraph boundary
+        outside of environment bodies, such that a caller can process
+        the beginning of a long document while the rest is parsed.
+        The extracted parts follow at the end.  Joined, the lists give
+        the result of :meth:`parse`.
+
+        The parser must not be used otherwise, before the generator is
+        exhausted.
+
+        Returns:
+            Generator of non-empty token lists.
+        """
+        main = self.start_parse(source, define, source_defs, extract,
+                                    stop_at)
+        for toks in self.parser_work_iter(latex, source):
+            # skip main part, if only extracted parts are requested
+            if extract:
+                continue
+            main += toks
+            if main:
+                yield main
+                main = []
+        if main and not extract:
+            yield main
+
+        self.deadline = None
+        for extr in self.extracted:
+            if extr:
+                yield self.extracted_part(extr)
+
+
+    def start_parse(self, source, define, source_defs, extract,
+                        stop_at=None):
+        """
+        Reset the parser state for :meth:`parse_iter` and
+        :meth:`parse_incremental`, and expand the definitions `define`.
+
+        Returns:
+            List of language tokens from `define`.
+        """
+        self.checkpoint('preamble')
         if extract:
             # Redefine all macros, if only extracted parts are requested.
             self.init_extractions(extract)
         self.extracted = []
-        self.unknowns = []
+        self.unknowns = {}
         self.source = self.source_main = source
+        self.expansions = 0
+        self.expansion_stopped = False
+        if self.parms.max_parse_time is not None:
+            self.deadline = time.monotonic() + self.parms.max_parse_time
 
         main = []
         if define:
             toks = self.parser_work(define, source_defs)
             main = utils.filter_set_toks(toks, 0, defs.LanguageToken)
-        main += self.parser_work(latex, source)
+        self.checkpoint('document')
+        self.stop_at = stop_at
+        return main
 
-        if extract:
-            # Clear `main` again, if only extracted parts are requested.
+
+    def extracted_part(self, extr):
+        """
+        Return extracted tokens `extr` enclosed in paragraph breaks, as
+        appended to the output of :meth:`parse`.
+        """
+        return ([defs.ParagraphToken(extr[0].pos, '\n\n\n', pos_fix=True)]
+                + extr
+                + [defs.SpaceToken(extr[-1].last_pos(), '\n', pos_fix=True)])
+
+
+    def parse_incremental(self, latex, source='<unknown>',
+                                define='', source_defs='<unknown>'):
+        """
+        Parse LaTeX source as :meth:`parse`, and record the output and
+        the parser state for each paragraph, such that the output can
+        be updated after an edit by :meth:`update`.
+
+        The records are kept in :attr:`paragraphs`.  Extraction of macro
+        arguments is not supported, and :meth:`get_unknowns` only
+        covers the text parsed by the last call of this method or of
+        :meth:`update`.
+
+        Args:
+            latex: String with LaTeX source code to be parsed.
+            source: Name of the source for debug messages.
+            define: LaTeX source with definitions parsed before.
+            source_defs: Name of the source of `define`.
+
+        Returns:
+            Tuple ``(txt, pos)`` for the output of :meth:`parse`, see
+            :func:`yalafi.utils.get_txt_pos`.
+        """
+        main = self.start_parse(source, define, source_defs, None)
+        self.paragraphs, stop = self.parse_paragraphs(latex, source, 0,
+                                    main, Snapshot(self), [None], None)
+        self.deadline = None
+        self.incremental = (latex, source, main)
+        return self.incremental_txt_pos()
+
+
+    def parse_paragraphs(self, latex, source, start, main, state, carry,
+                                stop):
+        """
+        Expand `latex` from position `start` with parser state `state`
+        and tokens `carry` held back before, see :meth:`expand_frames`,
+        creating a :class:`Paragraph` for each part yielded by
+        :meth:`expand_paragraphs`.
+
+        A paragraph can be parsed again on its own, if the expansion
+        before ended at a paragraph break of the source outside of
+        environment bodies and lists, and the remaining tokens are those
+        scanned behind.  Its state then is a :class:`Snapshot` of the
+        parser, shared with the previous such paragraph if tables and
+        language stack are unchanged, and the order of rotated
+        replacements, see
+        :meth:`yalafi.parameters.Parameters.repl_state`.
+
+        Args:
+            stop: `None` or function called as
+              ``stop(start, state, repls, carry)``
+              for each paragraph that can be parsed on its own; the
+              expansion stops before this paragraph, if the function
+              returns `True`.
+
+        Returns:
+            Tuple of list of :class:`Paragraph` objects and the position
+            where expansion stopped, or `None` at the end of `latex`.
+        """
+        latex_sav = self.latex
+        self.latex = latex
+        source_sav = self.source
+        self.source = source
+        buf = scanner.StreamBuffer(self.parms.scanner.iter_scan(latex,
+                                                        source, start))
+        last_state = state
+        repls = self.parms.repl_state()
+        carry = list(carry)
+        pars = []
+        while True:
+            n = len(self.extracted)
+            held = list(carry)
+            toks, paused = self.expand_frames(buf, None, carry)
+            pars.append(Paragraph(start, main + toks,
+                        [self.extracted_part(e) for e in self.extracted[n:]
+                                if e],
+                        state, repls, held))
             main = []
-        for extr in self.extracted:
-            if not extr:
+            if not paused:
+                start = None
+                break
+            tok = buf.cur()
+            # the paragraph break held back, if any
+            last = carry[-1] if len(carry) > 1 else None
+            end = last and last.pos + len(last.txt)
+            if (tok is None or buf.overlay or len(self.item_lab_stack) > 1
+                    or type(last) is not defs.ParagraphToken
+                    or last.pos_fix
+                    or end > scanner.token_start(tok, latex)
+                    or latex[end:scanner.token_start(tok, latex)].strip()):
+                # the next paragraph cannot be parsed on its own
+                state = None
                 continue
-            main.append(defs.ParagraphToken(extr[0].pos, '\n\n\n',
-                                                pos_fix=True))
-            main += extr
-            main.append(defs.SpaceToken(extr[-1].pos, '\n', pos_fix=True))
-        return main
+            start = scanner.token_start(tok, latex)
+            if (last_state.the_macros.version != self.the_macros.version
+                    or last_state.the_environments.version
+                                != self.the_environments.version
+                    or last_state.parms.parser_lang_stack
+                                != self.parms.parser_lang_stack):
+                last_state = Snapshot(self)
+            state = last_state
+            repls = self.parms.repl_state()
+            if stop and stop(start, state, repls, carry):
+                break
+        self.latex = latex_sav
+        self.source = source_sav
+        return pars, start
+
+
+    def update(self, edit_offset, removed_len, inserted_text):
+        """
+        Update the output of :meth:`parse_incremental` after an edit of
+        the LaTeX source.
+
+        The edit replaces `removed_len` characters at `edit_offset` by
+        `inserted_text`, as for :meth:`yalafi.scanner.Scanner.rescan`.
+        Expansion restarts at the last paragraph in :attr:`paragraphs`
+        that can be parsed on its own and starts before the edit.  It
+        stops at the first paragraph behind the edit where position and
+        parser state agree with a paragraph of the previous run, the
+        paragraphs from there on are taken over.  Thus, the effort
+        mostly depends on the size of the edited paragraphs.
+
+        Returns:
+            Tuple ``(start, end, txt, pos)``: the output of the previous
+            run from `start` to `end` (exclusive) is replaced by `txt`
+            with character positions `pos`, see
+            :func:`yalafi.utils.get_txt_pos`.  Positions in the output
+            behind `end` that point behind the removed characters are
+            shifted by the length difference of the edit; this excludes
+            extracted parts from before the edit.  If extracted parts
+            have changed, the replacement reaches to the end of the
+            output.
+        """
+        latex, source, main = self.incremental
+        old = self.paragraphs
+        edit_end = edit_offset + removed_len
+        delta = len(inserted_text) - removed_len
+        latex = latex[:edit_offset] + inserted_text + latex[edit_end:]
+
+        starts = [p.start for p in old]
+        k = bisect.bisect_left(starts, edit_offset) - 1
+        while k > 0 and old[k].state is None:
+            k -= 1
+        k = max(k, 0)
+        found = []
+        def stop(start, state, repls, carry):
+            # same position in the old source behind the edit, and same
+            # state: the remaining output is that of the previous run
+            if start - delta < edit_end:
+                return False
+            j = bisect.bisect_left(starts, start - delta, k + 1)
+            if (j < len(old) and old[j].start == start - delta
+                    and old[j].state is state
+                    and old[j].repls == repls
+                    and old[j].same_carry(carry, start)):
+                found.append(j)
+                return True
+            return False
+
+        self.restore(old[k].state)
+        self.parms.set_repl_state(old[k].repls)
+        new, stopped = self.parse_paragraphs(latex, source, old[k].start,
+                                main if k == 0 else [], old[k].state,
+                                old[k].get_carry(), stop)
+        self.deadline = None
+        j = found[0] if found else len(old)
+        for p in old[j:]:
+            p.start += delta
+        self.paragraphs = old[:k] + new + old[j:]
+        self.incremental = (latex, source, main)
+
+        start = sum(len(p.txt) for p in old[:k])
+        end = start + sum(len(p.txt) for p in old[k:j])
+        if (any(p.extracted for p in old[k:j])
+                or any(p.extracted for p in new)):
+            end += (sum(len(p.txt) for p in old[j:])
+                        + sum(len(e[0]) for p in old for e in p.extracted))
+            new = self.paragraphs[k:]
+            txt, pos = Paragraph.get_txt_pos(new)
+            extr, extr_pos = Paragraph.get_txt_pos(self.paragraphs,
+                                                        extracted=True)
+            return start, end, txt + extr, pos + extr_pos
+        txt, pos = Paragraph.get_txt_pos(new)
+        return start, end, txt, pos
+
+
+    def incremental_txt_pos(self):
+        """
+        Return tuple ``(txt, pos)`` for the output of the last call of
+        :meth:`parse_incremental` or :meth:`update`, see
+        :func:`yalafi.utils.get_txt_pos`.
+        """
+        txt, pos = Paragraph.get_txt_pos(self.paragraphs)
+        extr, extr_pos = Paragraph.get_txt_pos(self.paragraphs,
+                                                    extracted=True)
+        return txt + extr, pos + extr_pos
 
 
     def init_extractions(self, extracts):
@@ -275,7 +753,10 @@ class Parser:
                     extr = ''
             else:
                 extr = ''
-            mac.extract = self.parms.scanner.scan(extr)
+            # macro objects may be shared with snapshots, forks and
+            # lower layers of the_macros
+            mac = self.the_macros[name] = copy.copy(mac)
+            mac.extract = self.parms.scanner.scan_cached(extr)
             mac.repl = []   # overwrite possible handlers
         for name in extracts:
             if name not in self.the_macros:
@@ -283,9 +764,106 @@ class Parser:
                             name, args='A', repl='', extract='#1')
 
 
-    def get_unknowns(self):
-        """Return unknown macro names."""
-        return self.unknowns
+    def get_unknowns(self, counts=False):
+        """
+        Return unknown macro and environment names seen outside of
+        maths, in order of first appearance.
+
+        Args:
+            counts: If `True`, return tuples of name, number of
+              occurrences, and source, line and column of the first
+              occurrence.
+        """
+        if counts:
+            return [(name,) + tuple(v) for name, v in self.unknowns.items()]
+        return list(self.unknowns)
+
+
+    def add_unknown(self, name, pos):
+        """
+        Count occurrence of unknown macro or environment `name` at
+        position `pos` of :attr:`latex`.
+        """
+        self.side_effects += 1
+        entry = self.unknowns.get(name)
+        if entry:
+            entry[0] += 1
+            return
+        lin = self.latex.count('\n', 0, pos) + 1
+        col = pos - self.latex.rfind('\n', 0, pos)
+        self.unknowns[name] = [1, self.source, lin, col]
+
+
+    def add_observer(self, event, func):
+        """
+        Register callback `func` for parser event `event`.
+
+        The callback is called as ``func(parser, name, start, end,
+        seconds)`` with positions `start` and `end` in
+        :attr:`latex` of the current :attr:`source`, and the time spent
+        for the event.  Events and values of `name`:
+
+        - ``'scan'``: LaTeX string of the main text, of definitions, of a
+          package module or of a file read by ``\\LTinput`` has been
+          scanned and expanded; name of the source.  As scanning is
+          lazy, the time includes expansion.
+        - ``'macro'``: macro with preceding ``\\`` has been expanded.
+        - ``'begin'``: known environment has been opened.
+        - ``'end'``: environment has been closed, also an unknown one
+          such as ``document`` without document class.
+        - ``'math'``: maths part started by ``$``, ``\\(``, ``\\[``,
+          ``$$`` or the name of an equation environment has been parsed.
+        - ``'package'``: package or document class has been loaded.
+        - ``'language'``: language has been switched in multi-language
+          mode; name of the new language.
+
+        Except for ``'scan'``, ``'package'`` and ``'language'``, `end` is
+        the position of the next token to be read.  If the callback
+        returns `True`, the tokens remaining in the buffer currently
+        read are dropped, e.g., behind ``\\end{document}``.
+
+        Without any registered callbacks, no events are generated.
+        """
+        self.observers.setdefault(event, []).append(func)
+
+
+    def remove_observer(self, event, func):
+        """
+        Remove callback `func` registered by :meth:`add_observer`.
+        """
+        funcs = self.observers.get(event, [])
+        if func in funcs:
+            funcs.remove(func)
+        if not funcs:
+            self.observers.pop(event, None)
+
+
+    def notify(self, event, name, start, t, buf=None, end=None):
+        """
+        Call the callbacks registered for `event`.
+
+        Args:
+            event: Event name, see :meth:`add_observer`.
+            name: Name passed to the callbacks.
+            start: Start position passed to the callbacks.
+            t: Value of :func:`time.perf_counter` at start of the event.
+            buf: Buffer read by the event, or `None`.  Its remaining
+              tokens are dropped, if a callback returns `True`.
+            end: End position, defaults to the position of the current
+              token in `buf` or to `start`.
+        """
+        seconds = time.perf_counter() - t
+        if end is None:
+            end = start
+            if buf is not None:
+                tok = buf.cur()
+                end = tok.pos if tok else len(self.latex)
+        stop = False
+        for func in list(self.observers.get(event, ())):
+            if func(self, name, start, end, seconds):
+                stop = True
+        if stop and buf is not None:
+            buf.clear()
 
 
     def expand_sequence(self, buf, env_stop=None):
@@ -293,6 +871,10 @@ class Parser:
         Expand token sequence in text mode from buffer `buf` until end
         of environment `env_stop`.
 
+        Bodies of removed environments and files read by ``\\LTinput``
+        are expanded on an explicit stack of frames, not by recursive
+        calls, see :meth:`expand_frames`.
+
         Args:
             buf: Buffer with tokens to be expanded.
             env_stop: Name of the environment at which end the expansion
@@ -301,81 +883,291 @@ class Parser:
         Returns:
             Expanded token sequence.
         """
+        self.expansion_depth += 1
+        try:
+            return self.expand_frames(buf, env_stop)[0]
+        finally:
+            self.expansion_depth -= 1
+
+
+    def expand_paragraphs(self, buf):
+        """
+        Expand token sequence in text mode from buffer `buf`, pausing
+        at paragraph boundaries.
+
+        Expansion resumes when the next list is requested.  Joined, the
+        lists give the same result as :meth:`expand_sequence`.
+
+        Args:
+            buf: Buffer with tokens to be expanded.
+
+        Returns:
+            Generator of expanded token sequences, each ending before
+            a :class:`yalafi.defs.ParagraphToken` outside of environment
+            bodies or files being read, except for the last one.  The
+            sequences may be empty.
+        """
+        carry = [None]
+        while True:
+            toks, paused = self.expand_frames(buf, None, carry)
+            yield toks
+            if not paused:
+                return
+
+
+    def expand_frames(self, buf, env_stop=None, carry=None):
+        """
+        Expansion loop behind :meth:`expand_sequence` and
+        :meth:`expand_paragraphs`.
+
+        The current frame consists of the output list, the environment
+        stopping expansion and the buffer.  Enclosing frames are kept on
+        a stack together with a function that pushes back the result of
+        the inner frame to the restored buffer.
+
+        If `carry` is given, expansion pauses behind a paragraph break
+        outside of environment bodies and files.  The break may still
+        lose its first line in :meth:`remove_pure_action_lines` due to
+        the following tokens, and ``\\item`` looks back for punctuation
+        in the text before.  Therefore, the last token with text and
+        the break are kept in list `carry`, which is updated in place
+        and passed to the next call; only the break is output there.
+        Initially, `carry` is ``[None]``.
+
+        Returns:
+            Tuple of expanded tokens and a Boolean indicating a pause at
+            a paragraph boundary, where expansion can be resumed by
+            another call with the same buffer.
+        """
+        # out[:look] only serves the look-back of \item
         out = []
+        look = 0
+        if carry:
+            look = 1 if carry[0] else 0
+            out = carry[1-look:]
+        frames = []
+        if self.text_actions_context is not self.parms.lang_context:
+            self.update_text_actions()
+        actions = self.type_actions
+        default = self.text_other
+        frame_types = self.frame_types
         while True:
             tok = buf.cur()
             if not tok:
-                break
-            elif type(tok) is defs.BeginToken:
-                buf.back(self.begin_environment(buf, tok, False))
+                if not frames:
+                    break
+                # end of buffer in removed environment or file
+                toks = self.remove_pure_action_lines(out)
+                out, env_stop, buf, finish = frames.pop()
+                finish(buf, toks)
                 continue
+            if type(tok) not in frame_types:
+                actions.get(type(tok), default)(buf, tok, out)
             elif type(tok) is defs.EndToken:
                 t, stop = self.end_environment(buf, tok, env_stop)
-                if stop:
-                    return t
-                buf.back(t)
-                continue
-            elif type(tok) is defs.ItemToken:
-                buf.back(self.expand_item(buf, tok, out))
-                continue
-            elif type(tok) is defs.MacroToken:
-                if tok.txt == '\\def':
-                    out += self.parse_def_macro(buf, tok.pos)
+                if not stop:
+                    buf.back(t)
+                elif frames:
+                    # body of removed environment is dropped
+                    out, env_stop, buf, finish = frames.pop()
+                    finish(buf, t)
                 else:
-                    buf.back(self.expand_macro(buf, tok, False))
-                continue
-            elif tok.txt == '$' or tok.txt == '\\(':
-                out += self.mathparser.expand_inline_math(buf, tok)
-                continue
-            elif type(tok) is defs.MathBeginToken:
-                out += self.mathparser.expand_display_math(buf, tok,
-                                                            tok.environ)
-                continue
-            elif tok.txt == '$$' or tok.txt == '\\[':
-                if self.parms.math_default_env not in self.the_environments:
-                    utils.fatal('no environment for \'$$\' or \'\\[\'')
-                env = self.the_environments[self.parms.math_default_env]
-                if type(env) is not defs.EquEnv:
-                    utils.fatal(repr(env.name) + ' is not an EquEnv')
-                out += self.mathparser.expand_display_math(buf, tok, env)
-                continue
-            elif type(tok) is defs.AccentToken:
-                out += self.expand_accent(buf, tok)
-                continue
-            elif tok.txt == '\\\\':
-                out.append(defs.ActionToken(tok.pos))
-                out.append(defs.SpaceToken(tok.pos, ' '))
-                buf.next()
-                self.parse_newline_option(buf, True)
-                continue
-            elif tok.txt == '{' or tok.txt == '}':
-                out.append(defs.ActionToken(tok.pos))
-            elif type(tok) is defs.SpecialToken:
-                out.append(defs.ActionToken(tok.pos))
-                txt = self.parms.special_tokens[tok.txt]
-                out.append(defs.TextToken(tok.pos, txt))
-            elif type(tok) is defs.VerbatimToken:
-                if tok.environ:
-                    # for Environ() entry in Parameters.environment_defs
-                    buf.next()
-                    buf.back(self.expand_verb_env_token(tok))
-                    continue
+                    return t, False
+            elif type(tok) is defs.BeginToken:
+                t, remove = self.open_environment(buf, tok, False)
+                if remove:
+                    frames.append((out, env_stop, buf,
+                                    lambda b, toks, t=t: b.back(t + toks)))
+                    out = []
+                    env_stop = remove
                 else:
-                    out.append(defs.ActionToken(tok.pos))
-                    out.append(defs.TextToken(tok.pos, tok.txt))
-            elif type(tok) is defs.LanguageToken:
-                if self.parms.multi_language:
-                    self.parms.change_parser_lang(tok)
-                    out.append(tok)
-            elif tok.txt in self.parms.lang_context.active_chars:
-                out.append(self.expand_short_macro(buf, tok))
-                continue
-            elif type(tok) is defs.CommentToken:
-                pass
+                    buf.back(t)
+            elif type(tok) is defs.InputToken:
+                buf.next()
+                frames.append((out, env_stop, buf, self.open_input(tok)))
+                out = []
+                env_stop = None
+                buf = scanner.StreamBuffer(
+                            self.parms.scanner.iter_scan(tok.latex, tok.source))
             else:
+                # ParagraphToken
                 out.append(tok)
+                buf.next()
+                if carry is not None and not frames:
+                    toks = self.remove_pure_action_lines(out[look:])
+                    carry[:] = [next((t for t in reversed(out)
+                                        if t.txt.strip()), None)]
+                    # the break, unless it has lost its only line
+                    if toks and (toks[-1] is tok
+                                    or tok.txt[tok.txt.find('\n')+1:]):
+                        carry.append(toks.pop())
+                    return toks, True
+        return self.remove_pure_action_lines(out[look:]), False
+
+
+    def open_input(self, tok):
+        """
+        Switch to file of :class:`yalafi.defs.InputToken` `tok`.
+
+        Returns:
+            Function that switches back and pushes the language tokens
+            from the expanded file to a buffer.
+        """
+        self.side_effects += 1
+        latex_sav = self.latex
+        source_sav = self.source
+        self.latex = tok.latex
+        self.source = tok.source
+        self.input_files.append(tok.source)
+        t = time.perf_counter() if self.observers else None
+        def finish(buf, toks):
+            if t is not None:
+                self.notify('scan', tok.source, 0, t, end=len(tok.latex))
+            self.latex = latex_sav
+            self.source = source_sav
+            self.input_files.pop()
+            buf.back(utils.filter_set_toks(toks, tok.pos, defs.LanguageToken))
+        return finish
+
+
+    def expand_input(self, tok):
+        """
+        Expand file of :class:`yalafi.defs.InputToken` `tok` with a
+        recursive call, used outside of :meth:`expand_frames`.
+
+        Returns:
+            Language tokens from the file.
+        """
+        finish = self.open_input(tok)
+        toks = self.expand_sequence(scanner.StreamBuffer(
+                        self.parms.scanner.iter_scan(tok.latex, tok.source)))
+        buf = scanner.Buffer([])
+        finish(buf, toks)
+        return buf.all()
+
+
+    def update_text_actions(self):
+        """
+        Rebuild dispatch table :attr:`text_actions` for the current
+        language context.
+
+        Texts handled for special tokens take precedence over active
+        characters of the language.
+        """
+        self.text_actions = dict.fromkeys(
+                            self.parms.lang_context.active_chars,
+                            self.text_short_macro)
+        self.text_actions.update(self.special_actions)
+        self.text_actions_context = self.parms.lang_context
+
+    # Handlers called by expand_sequence() for token `tok` at the current
+    # position of buffer `buf`.  They append expanded tokens to `out` or
+    # push back tokens to `buf`.
+
+    def text_item(self, buf, tok, out):
+        buf.back(self.expand_item(buf, tok, out))
+
+    def text_macro(self, buf, tok, out):
+        if tok.txt == '\\def':
+            out += self.parse_def_macro(buf, tok.pos)
+        else:
+            buf.back(self.expand_macro(buf, tok, False))
+
+    # maths rotates the placeholders in the language settings, a side
+    # effect for get_text_expanded()
+    def text_inline_math(self, buf, tok, out):
+        self.side_effects += 1
+        t = time.perf_counter() if self.observers else None
+        out += self.mathparser.expand_inline_math(buf, tok)
+        if t is not None:
+            self.notify('math', tok.txt, tok.pos, t, buf)
+
+    def text_math_begin(self, buf, tok, out):
+        self.side_effects += 1
+        t = time.perf_counter() if self.observers else None
+        out += self.mathparser.expand_display_math(buf, tok, tok.environ)
+        if t is not None:
+            self.notify('math', tok.txt, tok.pos, t, buf)
+
+    def text_display_math(self, buf, tok, out):
+        if self.parms.math_default_env not in self.the_environments:
+            utils.fatal('no environment for \'$$\' or \'\\[\'')
+        env = self.the_environments[self.parms.math_default_env]
+        if type(env) is not defs.EquEnv:
+            utils.fatal(repr(env.name) + ' is not an EquEnv')
+        self.side_effects += 1
+        t = time.perf_counter() if self.observers else None
+        out += self.mathparser.expand_display_math(buf, tok, env)
+        if t is not None:
+            self.notify('math', tok.txt, tok.pos, t, buf)
+
+    def text_accent(self, buf, tok, out):
+        out += self.expand_accent(buf, tok)
+
+    def text_newline(self, buf, tok, out):
+        out.append(defs.ActionToken(tok.pos))
+        out.append(defs.SpaceToken(tok.pos, ' '))
+        buf.next()
+        self.parse_newline_option(buf, True)
+
+    def text_brace(self, buf, tok, out):
+        out.append(defs.ActionToken(tok.pos))
+        buf.next()
+
+    def text_special(self, buf, tok, out):
+        f = self.special_actions.get(tok.txt)
+        if f:
+            f(buf, tok, out)
+            return
+        out.append(defs.ActionToken(tok.pos))
+        txt = self.parms.special_tokens[tok.txt]
+        out.append(defs.TextToken(tok.pos, txt))
+        buf.next()
+
+    def text_raw_environ(self, buf, tok, out):
+        buf.next()
+        buf.back(self.expand_raw_env_token(tok))
+
+    def text_verbatim(self, buf, tok, out):
+        if tok.environ:
+            # for Environ() entry in Parameters.environment_defs
             buf.next()
-        return self.remove_pure_action_lines(out)
+            buf.back(self.expand_verb_env_token(tok))
+            return
+        out.append(defs.ActionToken(tok.pos))
+        out.append(defs.TextToken(tok.pos, tok.txt))
+        buf.next()
+
+    def text_language(self, buf, tok, out):
+        if self.parms.multi_language:
+            t = time.perf_counter() if self.observers else None
+            self.side_effects += 1
+            self.parms.change_parser_lang(tok)
+            self.update_text_actions()
+            out.append(tok)
+            if t is not None:
+                self.notify('language', self.parms.lang_context_lang(),
+                                tok.pos, t)
+        buf.next()
+
+    def text_short_macro(self, buf, tok, out):
+        out.append(self.expand_short_macro(buf, tok))
+
+    def text_comment(self, buf, tok, out):
+        buf.next()
+
+    def text_space(self, buf, tok, out):
+        out.append(tok)
+        buf.next()
+
+    def text_other(self, buf, tok, out):
+        # text tokens, also generated by handlers, and remaining classes
+        f = self.text_actions.get(tok.txt)
+        if f:
+            f(buf, tok, out)
+            return
+        out.append(tok)
+        buf.next()
 
 
     def arg_buffer(self, buf, start, end='}'):
@@ -391,19 +1183,36 @@ class Parser:
             This ensures that also an empty option ``[]`` will be
             tracked.
         """
+        arg = self.arg_tokens(buf, start, end, view=True)
+        if type(arg) is list:
+            return scanner.Buffer(arg)
+        return arg
+
+
+    def arg_tokens(self, buf, start, end='}', view=False):
+        """
+        Like :meth:`arg_buffer`, but return a list of tokens.
+
+        With ``view=True``, a block read from the base tokens of ``buf``
+        is returned as :class:`yalafi.scanner.Buffer` view on them.
+        """
         tok = buf.skip_space()
         if not tok:
-            return scanner.Buffer([defs.VoidToken(start)])
+            return [defs.VoidToken(start)]
         if type(tok) is defs.ParagraphToken:
-            return scanner.Buffer([defs.VoidToken(tok.pos)])
+            return [defs.VoidToken(tok.pos)]
         if end == '}' and tok.txt != '{':
             # consume single token
+            if self.parms.text_runs:
+                tok = buf.split_cur()
             buf.next()
-            return scanner.Buffer([tok])
+            return [tok]
         pos = tok.pos
         lev = 1 if tok.txt == '{' else 0
         opening_tok = tok
         tok = buf.next()    # skip opening { or [
+        # if reading from base tokens of buf, return a view on them
+        mark = buf.mark()
         out = []
         while tok:
             if tok.txt == '{':
@@ -411,12 +1220,22 @@ class Parser:
             if tok.txt == '}':
                 lev -= 1
             if tok.txt == end and lev == 0:
+                if mark is not None and buf.cursor > mark:
+                    if view:
+                        arg = buf.since(mark)
+                    else:
+                        arg = buf.base[mark:buf.cursor]
+                    buf.next()  # consume closing } or ]
+                    return arg
                 buf.next()  # consume closing } or ]
                 if not out:
                     out = [defs.VoidToken(pos)]
-                return scanner.Buffer(out)
-            out.append(tok)
+                return out
+            if mark is None:
+                out.append(tok)
             tok = buf.next()
+        if mark is not None:
+            out = buf.base[mark:buf.cursor]
 
         # HACK: see Issue 23
         # We have read till end of text, and the collected tokens might
@@ -426,9 +1245,9 @@ class Parser:
         buf.back([opening_tok]
                 + utils.latex_error(self, 'cannot find closing "' + end + '"',
                                                 pos) + out)
-        return scanner.Buffer([defs.TextToken(opening_tok.pos,
+        return [defs.TextToken(opening_tok.pos,
                                     ' ' + self.parms.mark_latex_error + ' ',
-                                    pos_fix=True)])
+                                    pos_fix=True)]
 
 
     def expand_macro(self, buf, tok, math):
@@ -438,13 +1257,82 @@ class Parser:
         Return:
             List of tokens to be inserted.
         """
+        from_input = not buf.overlay
         buf.next()
         buf.skip_space()  # for macros without arguments, even if known
         if tok.txt not in self.the_macros:
-            if not (math or tok.txt in self.unknowns):
-                self.unknowns.append(tok.txt)
+            if not math:
+                self.add_unknown(tok.txt, tok.pos)
             return [defs.ActionToken(tok.pos)]
-        return self.expand_arguments(buf, self.the_macros[tok.txt], tok.pos)
+        err = self.check_limits(buf, tok, tok.txt, from_input)
+        if err:
+            return err
+        mac = self.the_macros[tok.txt]
+        if self.observers:
+            t = time.perf_counter()
+            out = self.expand_arguments(buf, mac, tok.pos)
+            self.notify('macro', tok.txt, tok.pos, t, buf)
+            return out
+        return self.expand_arguments(buf, mac, tok.pos)
+
+
+    def check_limits(self, buf, tok, name, from_input):
+        """
+        Count expansion of macro or environment `name` at token `tok`
+        and check the limits for runaway expansions given in
+        :attr:`parms`.
+
+        If a limit is exceeded, a LaTeX error is issued, and the tokens
+        pushed back to `buf` since the outermost expansion of `name`
+        are dropped.  Remaining tokens of enclosing expansions are kept.
+        After the time limit, no further expansions happen.
+
+        Args:
+            buf: Buffer the macro or environment was read from.
+            tok: Token starting the macro or environment.
+            name: Name of the macro or environment.
+            from_input: `True`, if `tok` was read from the base tokens
+              of `buf`, not from tokens pushed back.
+
+        Returns:
+            `None` if the expansion may proceed, otherwise a list of
+            tokens replacing the expansion.
+        """
+        if self.expansion_stopped:
+            return [defs.ActionToken(tok.pos)]
+        self.expansions += 1
+        if from_input:
+            buf.expansions = 0
+            buf.expansion_starts = {}
+        else:
+            buf.expansions += 1
+        depth = len(buf.overlay)
+        start = buf.expansion_starts.get(name)
+        if start is None or start > depth:
+            buf.expansion_starts[name] = start = depth
+        parms = self.parms
+        if (parms.max_expansions is not None
+                and buf.expansions > parms.max_expansions):
+            err = 'max_expansions'
+        elif (parms.max_buffer_growth is not None
+                and len(buf.overlay) > parms.max_buffer_growth):
+            err = 'max_buffer_growth'
+        elif (self.deadline is not None and self.expansions % 256 == 0
+                and time.monotonic() > self.deadline):
+            err = 'max_parse_time'
+            self.expansion_stopped = True
+        else:
+            return None
+        self.side_effects += 1
+        msg = (f'runaway expansion of "{name}" stopped by limit {err}:'
+                + f' {buf.expansions} expansions since input,'
+                + f' {len(buf.overlay)} tokens pending,'
+                + f' {self.expansions} expansions in total,'
+                + f' nesting depth {self.expansion_depth}')
+        del buf.overlay[start:]
+        buf.expansions = 0
+        buf.expansion_starts = {}
+        return utils.latex_error(self, msg, tok.pos)
 
 
     def expand_arguments(self, buf, mac, start):
@@ -454,85 +1342,174 @@ class Parser:
         Returns:
             List of tokens to be inserted.
         """
+        reader = self.arg_readers.get(mac.args)
+        if reader:
+            arguments, arguments_extr, delimiters = reader(buf, mac, start)
+        else:
+            arguments, arguments_extr, delimiters = self.read_arguments(
+                                                            buf, mac, start)
+
+        if mac.extract:
+            self.side_effects += 1
+            toks = ([defs.LanguageToken(start,
+                                    lang=self.parms.lang_context_lang(),
+                                    hard=True, brk=True)]
+                        + mac.template(mac.extract).expand(arguments_extr,
+                                                                start))
+            self.extracted.append(self.expand_sequence(scanner.Buffer(toks)))
+        out = [defs.ActionToken(start)]
+        if self.profiler:
+            return out + self.profile_expansion(buf, mac, arguments,
+                                                    delimiters, start)
+        if callable(mac.repl):
+            self.side_effects += 1
+            return out + mac.repl(self, buf, mac, arguments, delimiters, start)
+        return out + mac.template(mac.repl).expand(arguments, start)
+
+    def profile_expansion(self, buf, mac, arguments, delimiters, start):
+        """
+        Expand macro or environment `mac` and record it in :attr:`profiler`.
+        """
+        t = time.perf_counter()
+        handler = callable(mac.repl)
+        if handler:
+            self.side_effects += 1
+            toks = mac.repl(self, buf, mac, arguments, delimiters, start)
+        else:
+            toks = mac.template(mac.repl).expand(arguments, start)
+        kind = 'environment' if isinstance(mac, defs.Environ) else 'macro'
+        self.profiler.record(kind, mac.name, handler, len(toks),
+                                    time.perf_counter() - t)
+        return toks
+
+
+    def read_arguments(self, buf, mac, start):
+        """
+        Read arguments of macro or environment `mac` from `buf`.
+
+        Generic reader for all argument signatures, see
+        :attr:`arg_readers` for fast paths.
+
+        Returns:
+            Tuple of lists with arguments, arguments for extraction
+            (without defaults of optional arguments), and Booleans
+            indicating arguments delimited by ``{}`` or ``[]``.
+        """
         arguments = []
         arguments_extr = []
         delimiters = []
         pos = start
         for n, code in enumerate(mac.args):
-            arg_extr = arg = []
             delim = False
-            tok = buf.skip_space()
-            if tok:
-                pos = tok.pos
             if code == '*':
-                if tok and tok.txt == '*':
-                    arg_extr = arg = [tok]
-                    buf.next()
+                arg, pos = self.read_arg_star(buf, pos)
+                arg_extr = arg
             elif code == 'O':
-                if tok and tok.txt == '[':
-                    delim = True
-                    arg_extr = arg = self.arg_buffer(buf, pos, end=']').all()
-                else:
-                    if n < len(mac.defaults):
-                        # NB: do not use positions from macro definition
-                        arg = [copy.copy(t) for t in mac.defaults[n]]
-                        for t in arg:
-                            t.pos = pos
-                            t.pos_fix = True
+                arg, arg_extr, delim, pos = self.read_arg_opt(buf, mac, n, pos)
             elif code == 'A':
-                if tok and tok.txt == '}':
-                    # issue #135
-                    arg_extr = arg = [defs.VoidToken(pos)]
-                else:
-                    if tok and tok.txt == '{':
-                        delim = True
-                    arg_extr = arg = self.arg_buffer(buf, pos).all()
+                arg, delim, pos = self.read_arg(buf, pos)
+                arg_extr = arg
             else:
                 utils.fatal('illegal arg code ' + repr(code)
                                 + ' of ' + repr(mac.name))
             arguments.append(arg)
             arguments_extr.append(arg_extr)
             delimiters.append(delim)
+        return arguments, arguments_extr, delimiters
 
-        if mac.extract:
-            toks = ([defs.LanguageToken(start,
-                                    lang=self.parms.lang_context_lang(),
-                                    hard=True, brk=True)]
-                        + self.generate_replacements(arguments_extr,
-                                                        mac.extract, start))
-            self.extracted.append(self.expand_sequence(scanner.Buffer(toks)))
-        out = [defs.ActionToken(start)]
-        if callable(mac.repl):
-            return out + mac.repl(self, buf, mac, arguments, delimiters, start)
-        return out + self.generate_replacements(arguments, mac.repl, start)
+    # Readers of frequent argument signatures, selected in expand_arguments()
+    # by table arg_readers.  They return the same as read_arguments().
+
+    def read_args_(self, buf, mac, start):
+        return [], [], []
+
+    def read_args_A(self, buf, mac, start):
+        arg, delim, _ = self.read_arg(buf, start)
+        return [arg], [arg], [delim]
+
+    def read_args_AA(self, buf, mac, start):
+        arg1, delim1, pos = self.read_arg(buf, start)
+        arg2, delim2, _ = self.read_arg(buf, pos)
+        return [arg1, arg2], [arg1, arg2], [delim1, delim2]
+
+    def read_args_OA(self, buf, mac, start):
+        arg1, extr1, delim1, pos = self.read_arg_opt(buf, mac, 0, start)
+        arg2, delim2, _ = self.read_arg(buf, pos)
+        return [arg1, arg2], [extr1, arg2], [delim1, delim2]
+
+    def read_args_starA(self, buf, mac, start):
+        arg1, pos = self.read_arg_star(buf, start)
+        arg2, delim2, _ = self.read_arg(buf, pos)
+        return [arg1, arg2], [arg1, arg2], [False, delim2]
+
+    def read_arg(self, buf, pos):
+        """
+        Read mandatory argument at position `pos`.
+
+        Returns:
+            Tuple of argument tokens, Boolean for delimiting ``{}``, and
+            position of the argument.
+        """
+        tok = buf.skip_space()
+        if not tok:
+            return [defs.VoidToken(pos)], False, pos
+        if tok.txt == '}':
+            # issue #135
+            return [defs.VoidToken(tok.pos)], False, tok.pos
+        return self.arg_tokens(buf, tok.pos), tok.txt == '{', tok.pos
+
+    def read_arg_opt(self, buf, mac, n, pos):
+        """
+        Read optional argument number `n` of `mac` at position `pos`.
+
+        Returns:
+            Tuple of argument tokens or default value, argument tokens
+            for extraction, Boolean for delimiting ``[]``, and position
+            of the argument.
+        """
+        tok = buf.skip_space()
+        if tok:
+            pos = tok.pos
+            if tok.txt == '[':
+                arg = self.arg_tokens(buf, pos, end=']')
+                return arg, arg, True, pos
+        if n < len(mac.defaults):
+            # NB: do not use positions from macro definition
+            template = mac.template(mac.defaults[n])
+            if not template.last_args:
+                return template.expand((), pos), [], False, pos
+            arg = [copy.copy(t) for t in mac.defaults[n]]
+            for t in arg:
+                t.pos = pos
+                t.pos_fix = True
+            return arg, [], False, pos
+        return [], [], False, pos
+
+    def read_arg_star(self, buf, pos):
+        """
+        Read optional asterisk at position `pos`.
+
+        Returns:
+            Tuple of list with the asterisk token or empty list, and
+            position of the argument.
+        """
+        tok = buf.skip_space()
+        if not tok:
+            return [], pos
+        if tok.txt != '*':
+            return [], tok.pos
+        buf.next()
+        return [tok], tok.pos
 
 
     def generate_replacements(self, arguments, repls, start):
-        out = []
-        # preparation for position tracking
-        #
-        cur_pos = start
-        for tok in repls:
-            if type(tok) is defs.ArgumentToken and arguments[tok.arg-1]:
-                # NB: may be an absent optional argument
-                cur_pos = arguments[tok.arg-1][0].pos
-
-        # macro expansion
-        #
-        for tok in repls:
-            if type(tok) is defs.ArgumentToken:
-                arg = arguments[tok.arg - 1]
-                if arg:
-                    out.append(defs.ActionToken(arg[0].pos))
-                    out += arg
-                    out.append(defs.ActionToken(arg[-1].pos))
-                    cur_pos = arg[-1].pos
-            else:
-                tok = copy.copy(tok)
-                tok.pos = cur_pos
-                tok.pos_fix = True
-                out.append(tok)
-        return out
+        """
+        Replace argument tokens in `repls` by `arguments`.
+
+        Expansion of macros uses the compiled :class:`yalafi.defs.Template`
+        cached in the macro, see :meth:`yalafi.defs.Expandable.template`.
+        """
+        return defs.Template(repls).expand(arguments, start)
 
     def expand_accent(self, buf, tok):
         buf.next()
@@ -546,6 +1523,8 @@ class Parser:
             args[0] = copy.copy(args[0])
             c = args[0].txt[0]
             args[0].txt = args[0].txt[1:]
+            if not args[0].pos_fix:
+                args[0].pos += 1
 
         if not c.strip():
             c = ' '.join(self.parms.accent_macros[tok.txt])
@@ -567,33 +1546,56 @@ class Parser:
     #   open an environment
     #
     def begin_environment(self, buf, tok, math):
+        out, remove = self.open_environment(buf, tok, math)
+        if remove:
+            out += self.expand_sequence(buf, env_stop=remove)
+        return out
+
+    #   open an environment without expanding the body of a removed one
+    #   - second element of returned 2-tuple: name of removed environment
+    #     or None
+    #
+    def open_environment(self, buf, tok, math):
         out = [defs.ActionToken(tok.pos)]
+        from_input = not buf.overlay
         name = self.get_environment_name(buf, tok)
+        if name == 'document' and self.stop_at == 'begin':
+            buf.clear()
+            return out, None
         if name not in self.the_environments:
-            if not (math or name in self.unknowns):
-                self.unknowns.append(name)
-            return out
+            if not math:
+                self.add_unknown(name, tok.pos)
+            return out, None
+        err = self.check_limits(buf, tok, name, from_input)
+        if err:
+            return err, None
         env = self.the_environments[name]
+        self.side_effects += 1
         if env.items:
             level = len([v for v in self.item_lab_stack if v[1] == name])
             self.item_lab_stack.append((env.items(level), name))
         if env.add_pars:
             out = [defs.ParagraphToken(tok.pos, '\n\n', pos_fix=True)]
-        out += self.expand_arguments(buf, env, tok.pos)
+        if self.observers:
+            t = time.perf_counter()
+            out += self.expand_arguments(buf, env, tok.pos)
+            self.notify('begin', name, tok.pos, t, buf)
+        else:
+            out += self.expand_arguments(buf, env, tok.pos)
         if type(env) is defs.EquEnv:
             out.append(defs.MathBeginToken(tok.pos, name, env))
-            return out
-        if env.remove:
-            out += self.expand_sequence(buf, env_stop=name)
-        return out
+            return out, None
+        return out, (name if env.remove else None)
 
     #   close an environment
     #   - second element of returned 2-tuple: reached env_stop
     #
     def end_environment(self, buf, tok, env_stop):
+        t = time.perf_counter() if self.observers else None
         name = self.get_environment_name(buf, tok)
         out = [defs.ActionToken(tok.pos)]
         if name in self.the_environments:
+            self.side_effects += 1
             env = self.the_environments[name]
             if env.items and len(self.item_lab_stack) > 1:
                 self.item_lab_stack.pop()
@@ -601,11 +1603,15 @@ class Parser:
                 out = [defs.ParagraphToken(tok.pos, '\n\n', pos_fix=True)]
             if env.end_func:
                 out += env.end_func(self, buf, env, [], [], tok.pos)
+        if t is not None:
+            self.notify('end', name, tok.pos, t, buf)
+        if name == 'document' and self.stop_at == 'end':
+            buf.clear()
         return out, name == env_stop
 
     def get_environment_name(self, buf, tok):
         buf.next()
-        return self.get_text_expanded(self.arg_buffer(buf, tok.pos).all())
+        return self.get_text_expanded(self.arg_tokens(buf, tok.pos))
 
 
     def expand_verb_env_token(self, tok):
@@ -641,6 +1647,51 @@ class Parser:
                     defs.SpecialToken(tok.pos + len(tok.txt), '}'),
         ]
 
+    def expand_raw_env_token(self, tok):
+        r"""
+        Expand a :class:`yalafi.defs.RawEnvironToken` from the scanner.
+
+        If the environment is defined with option ``remove=True`` and
+        without arguments, the token is replaced by ``\begin{name}`` and
+        ``\end{name}`` with empty body. Otherwise, for instance after a
+        redefinition of the environment, the text of the token is scanned
+        again.
+
+        Args:
+            tok: A single RawEnvironToken.
+
+        Returns:
+            A list of tokens.
+        """
+        env = self.the_environments.get(tok.name)
+        if env is None or not env.remove or env.args:
+            # scanning is resumed behind \begin, as done by the scanner
+            # for a BeginToken
+            start = tok.pos + len('\\begin')
+            end = tok.pos + len(tok.txt)
+            if self.latex.startswith(tok.txt, tok.pos):
+                # scan the source up to the end of the token, such that
+                # positions in error messages are those of the source
+                toks = list(self.parms.scanner.iter_scan(self.latex[:end],
+                                                    self.source, start))
+            else:
+                toks = self.parms.scanner.scan(tok.txt[len('\\begin'):],
+                                                    self.source)
+                for t in toks:
+                    t.pos += start
+            return [defs.BeginToken(tok.pos, '\\begin')] + toks
+        end = tok.pos + tok.txt.rfind('\\end')
+        return [
+                    defs.BeginToken(tok.pos, '\\begin'),
+                    defs.SpecialToken(tok.pos, '{'),
+                    defs.TextToken(tok.pos, tok.name),
+                    defs.SpecialToken(tok.pos, '}'),
+                    defs.EndToken(end, '\\end'),
+                    defs.SpecialToken(end, '{'),
+                    defs.TextToken(end, tok.name),
+                    defs.SpecialToken(end, '}'),
+        ]
+
     #   parse (skip) optional [...] after \\
     #
     def parse_newline_option(self, buf, skip_space):
@@ -665,40 +1716,59 @@ class Parser:
         Generate string from token sequence, with macro expansion.
 
         Expand all macros in `toks` and return the resulting text.
-        """
-        toks = self.expand_sequence(scanner.Buffer(toks.copy()))
-        return self.get_text_direct(toks)
 
-
-    def _classify_token(self, tok):
-        r"""
-        Classify token according to its ability to start or end a blank
-        section which can be removed. Three boolean attributes are added
-        to the token:
-          is_blank: Set `True`, when the token contains only space, but
-            no `\n`.
-          can_start: Set `True` if `tok` contains `\n` and only space
-            afterwards.
-          can_end: Set `True` if `tok` contains `\n` and only space
-            before.
-        """
-        if isinstance(tok, defs.ActionToken):
-            tok.is_blank = True
-            tok.can_start = False
-            tok.can_end = False
+        Lists of text, space and comment tokens, as for most labels and
+        names, are joined without expansion.  Otherwise, results are
+        kept in :attr:`text_cache`, unless the expansion had side
+        effects (see :attr:`side_effects`), or a profiler or observers
+        have to see each expansion.
+        """
+        if self.text_actions_context is not self.parms.lang_context:
+            self.update_text_actions()
+        text_actions = self.text_actions
+        for t in toks:
+            if type(t) is defs.TextToken:
+                if t.txt in text_actions:
+                    break
+            elif type(t) not in (defs.SpaceToken, defs.CommentToken):
+                break
         else:
-            txt = tok.txt
-            tok.is_blank = '\n' not in txt and not txt.strip()
-            tok.can_start = '\n' in txt and not txt[txt.rfind('\n'):].strip()
-            tok.can_end = '\n' in txt and not txt[:txt.find('\n')].strip()
-        return tok
+            return self.get_text_direct(toks)
+
+        if (self.profiler or self.observers
+                or not self.text_cache_types.issuperset(map(type, toks))):
+            toks = self.expand_sequence(scanner.Buffer(toks.copy()))
+            return self.get_text_direct(toks)
+        key = (tuple((type(t), t.txt) for t in toks), self.the_macros.version,
+                    self.the_environments.version, self.parms.lang_context)
+        cache = self.text_cache
+        txt = cache.get(key)
+        if txt is not None:
+            return txt
+        side_effects = self.side_effects
+        txt = self.get_text_direct(
+                        self.expand_sequence(scanner.Buffer(toks.copy())))
+        if self.side_effects == side_effects:
+            if len(cache) >= self.text_cache_size:
+                del cache[next(iter(cache))]
+            cache[key] = txt
+        return txt
 
 
     def remove_pure_action_lines(self, tokens):
-        """
+        r"""
         Remove all blank text lines in :obj:`tokens`, which contain at least
         one :class:`yalafi.defs.ActionToken`.
 
+        A removable section starts with a token that contains ``\n`` and
+        only space afterwards (or at list begin), continues with tokens
+        without ``\n`` that contain only space, and ends with a token that
+        contains ``\n`` and only space before (or at list end).
+        Instead of classifying each token, we build an index of the
+        ActionTokens and only look at the blank tokens around them.
+        Therefore, the effort for tokens already cleaned by a nested
+        expansion is not much more than that for copying the list.
+
         Args:
             tokens: list of :class:`yalafi.defs.TextToken`.
 
@@ -706,69 +1776,84 @@ class Parser:
             List of tokens with removed line breaks.
         """
         # Only keep tokens which have text, or are of type ActionToken
-        # or LanguageToken. Classify them (see self._classify_token),
-        # and put tokens which can start or end a blank section at the
-        # start and end of the list (so that all tokens could be
-        # removed).
+        # or LanguageToken.
         tokens = [t for t in tokens if t.txt or
                         type(t) in (defs.ActionToken, defs.LanguageToken)]
-        tokens = [self._classify_token(t) for t in tokens]
-        tok = self._classify_token(defs.TextToken(0, ''))
-        tok.can_start = True
-        tokens.insert(0, tok)
-        tok = self._classify_token(defs.TextToken(tokens[-1].pos, ''))
-        tok.can_end = True
-        tokens.append(tok)
-
-        # avoid modifications at list begin (expensive for long lists)
-        # TODO: use `scanner.Buffer` instead.
-        tokens = list(reversed(tokens))
+        types = list(map(type, tokens))
+        if defs.ActionToken not in types:
+            return tokens
+
+        def is_blank(t):
+            txt = t.txt
+            return (type(t) is defs.ActionToken
+                        or '\n' not in txt and not txt.strip())
+        def can_start(txt):
+            return '\n' in txt and not txt[txt.rfind('\n'):].strip()
+        def can_end(txt):
+            return '\n' in txt and not txt[:txt.find('\n')].strip()
+
+        n = len(tokens)
         out = []
-        while tokens:
-            tok = tokens.pop()
-            if not tok.can_start:
-                out.append(tok)
+        # tokens[:done] have been copied to out; after a removal, the
+        # shortened end token of the removed section replaces tokens[done],
+        # and a new section may start before it
+        done = 0
+        first = tokens[0]
+        k = -1
+        while True:
+            try:
+                k = types.index(defs.ActionToken, k + 1)
+            except ValueError:
+                break
+            # look backward for start of section
+            j = k - 1
+            while j > done and is_blank(tokens[j]):
+                j -= 1
+            if j < done or j == done and is_blank(first):
+                start = None
+            elif can_start(first.txt if j == done
+                                            else tokens[j].txt):
+                start = j
+            else:
+                start = -1
+            # look forward for end of section; all ActionTokens before
+            # have the same section
+            k += 1
+            while k < n and is_blank(tokens[k]):
+                k += 1
+            if start == -1 or k < n and not can_end(tokens[k].txt):
                 continue
-            buf = [tok]
-            can_remove = True
-            while tokens:
-                tok = tokens.pop()
-                buf.append(tok)
-                if tok.can_end:
-                    break
-                if not tok.is_blank:
-                    can_remove = False
-                    break
-            if (can_remove and len(buf) > 1
-                    and any(type(t) is defs.ActionToken for t in buf)):
-                lang_toks = [t for t in buf if type(t) is defs.LanguageToken]
-                t1 = copy.copy(buf[0])
-                t2 = copy.copy(buf[-1])
+
+            if start is None:
+                t1 = None
+                start = done - 1
+            else:
+                t1 = copy.copy(first if start == done else tokens[start])
                 # in t1, we remove all behind the last newline
                 txt = t1.txt
-                if '\n' in txt:
-                    t1.txt = txt[:txt.rfind('\n')+1]
-                else:
-                    t1.txt = ''
-                # in t2, we remove all till including the first newline
-                txt = t2.txt
-                if '\n' in txt:
-                    pos = txt.find('\n') + 1
-                    t2.txt = txt[pos:]
-                    t2.pos += pos
-                else:
-                    t2.txt = ''
-                    t2.pos += len(txt)
-                buf = [t1] + lang_toks
-                tokens.append(self._classify_token(t2))
-                # NB: we deleted a line break
-                tok = self._classify_token(defs.TextToken(t2.pos, ''))
-                tok.can_start = True
-                tokens.append(tok)
-            elif len(buf) > 1:
-                tokens.append(self._classify_token(buf.pop()))
-            out += buf
-
+                t1.txt = txt[:txt.rfind('\n')+1]
+            if start > done:
+                out.append(first)
+                out += tokens[done+1:start]
+            if t1 is not None:
+                out.append(t1)
+            out += [t for t in tokens[start+1:k]
+                            if type(t) is defs.LanguageToken]
+            if k == n:
+                return [t for t in out if t.txt
+                                or type(t) is defs.LanguageToken]
+            # in the end token, we remove all till including the first
+            # newline; NB: we deleted a line break
+            first = copy.copy(tokens[k])
+            txt = first.txt
+            pos = txt.find('\n') + 1
+            first.txt = txt[pos:]
+            first.pos += pos
+            done = k
+            k -= 1
+
+        out.append(first)
+        out += tokens[done+1:]
         return [t for t in out if t.txt or type(t) is defs.LanguageToken]
 
     #   \item: if [...] label is specified, look back in text and append
@@ -779,6 +1864,7 @@ class Parser:
             return defs.SpaceToken(pos, ' ', pos_fix=True)
         start = tok.pos
         buf.next()
+        self.side_effects += 1
         out = self.expand_arguments(buf, self.item_macro, start)
         if len(out) == 1:
             # only ActionToken: no [...]
@@ -790,9 +1876,9 @@ class Parser:
                                 if out_so_far[i].txt.strip()), -1)
         if (pos >= 0 and out_so_far[pos].txt[-1]
                     in self.parms.item_punctuation):
-            out.append(defs.TextToken(out[-1].pos,
+            out.append(defs.TextToken(out[-1].last_pos(),
                                 out_so_far[pos].txt[-1], pos_fix=True))
-        out.append(Space(out[-1].pos))
+        out.append(Space(out[-1].last_pos()))
         out.insert(0, Space(start))
         return out
 
@@ -803,6 +1889,8 @@ class Parser:
          e.g. ``"A`` → ``Ä``.
         """
         cur = buf.next()
+        if self.parms.text_runs:
+            cur = buf.split_cur()
         if (not cur or tok.txt + cur.txt
                     not in self.parms.lang_context.short_macros):
             return tok
@@ -871,14 +1959,14 @@ class Parser:
             while tok and tok.txt != ',':
                 if tok.txt == '{':
                     # `{...}` protects space and `,`
-                    seq = self.arg_buffer(buf, 0).all()
+                    seq = self.arg_tokens(buf, 0)
                     if len(seq) == 1 and type(seq[0]) is defs.VoidToken:
                         # this was an empty `{}`
                         seq = []
                     else:
                         # braces `{}` have been removed by arg_buffer()
                         seq = ([defs.SpecialToken(tok.pos, '{')] + seq
-                                    + [defs.SpecialToken(seq[-1].pos, '}')])
+                                    + [defs.SpecialToken(seq[-1].last_pos(), '}')])
                     val += seq
                     tok = buf.cur()
                 else:
@@ -935,10 +2023,12 @@ class Parser:
             if not tok:
                 return utils.latex_error(self, '\\def: missing macro body',
                                         start)
+            if self.parms.text_runs:
+                tok = buf.split_cur()
             if tok.txt == '{':
                 break
             args.append(tok)
-        repl = self.arg_buffer(buf, tok.pos).all()
+        repl = self.arg_tokens(buf, tok.pos)
 
         n = 1
         arg_pos_map = []
@@ -982,3 +2072,104 @@ class Parser:
             elif tok.txt == '}':
                 lev -= 1
             yield tok, lev
+
+
+class Snapshot:
+    """
+    State of a :class:`Parser` taken by :meth:`Parser.snapshot`.
+    """
+
+    def __init__(self, parser):
+        self.parms = parser.parms.copy()
+        self.the_macros = parser.the_macros.copy()
+        self.the_environments = parser.the_environments.copy()
+        self.checkpoints = dict(parser.checkpoints)
+        self.packages = dict(parser.packages)
+        self.global_latex_options = list(parser.global_latex_options)
+        self.repls = parser.parms.repl_state()
+
+
+class Paragraph:
+    """
+    Output of a paragraph, recorded by :meth:`Parser.parse_incremental`.
+    """
+
+    def __init__(self, start, toks, extracted, state, repls, carry):
+        self.start = start
+        """Position in the LaTeX source where expansion started."""
+        txt, pos = utils.get_txt_pos(toks)
+        self.txt = txt
+        """Text of the paragraph."""
+        self.pos = [n - start for n in pos]
+        """Character positions relative to :attr:`start`."""
+        self.extracted = []
+        """List of ``(txt, pos)`` for extracted parts, with relative
+        positions."""
+        for toks in extracted:
+            txt, pos = utils.get_txt_pos(toks)
+            self.extracted.append((txt, [n - start for n in pos]))
+        self.state = state
+        """
+        :class:`Snapshot` of the parser at :attr:`start`, or `None` if
+        the paragraph cannot be parsed on its own.
+        """
+        self.repls = repls
+        """Order of rotated replacements at :attr:`start`."""
+        self.carry = self.shift_carry(carry, -start)
+        """
+        Tokens held back at :attr:`start`, see
+        :meth:`Parser.expand_frames`, with relative positions.
+        """
+
+    def get_carry(self):
+        """
+        Return the tokens held back at :attr:`start`, with absolute
+        positions.
+        """
+        return self.shift_carry(self.carry, self.start)
+
+    def same_carry(self, carry, start):
+        """
+        Check whether tokens `carry` held back at position `start` of an
+        edited source continue the expansion as :attr:`carry`.  Of the
+        last token with text, only the last character is relevant.
+        """
+        carry = self.shift_carry(carry, -start)
+        if (carry[0] and carry[0].txt[-1]) != (self.carry[0]
+                                        and self.carry[0].txt[-1]):
+            return False
+        return ([(type(t), t.txt, t.pos, t.pos_fix) for t in carry[1:]]
+                == [(type(t), t.txt, t.pos, t.pos_fix)
+                        for t in self.carry[1:]])
+
+    @staticmethod
+    def shift_carry(carry, delta):
+        """
+        Return a copy of held back tokens `carry` with positions shifted
+        by `delta`.
+        """
+        out = []
+        for t in carry:
+            if t is not None:
+                t = copy.copy(t)
+                t.pos += delta
+            out.append(t)
+        return out
+
+    @staticmethod
+    def get_txt_pos(paragraphs, extracted=False):
+        """
+        Join text and absolute character positions of `paragraphs`,
+        or of their extracted parts.
+        """
+        txt = []
+        pos = []
+        for p in paragraphs:
+            if extracted:
+                for t, n in p.extracted:
+                    txt.append(t)
+                    pos += [m + p.start for m in n]
+            else:
+                txt.append(p.txt)
+                pos += [n + p.start for n in p.pos]
+        return ''.join(txt), pos
@@ -0,0 +1,109 @@
+
+#
+#   YaLafi: Yet another LaTeX filter
+#   Copyright (C) 2020 Matthias Baumann
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Profiling of macro and environment expansions.
+
+A :class:`Profiler` object assigned to :attr:`yalafi.parser.Parser.profiler`
+collects statistics for each expansion of a macro or environment.
+Multiple parser runs may share the same object.
+"""
+
+import json
+import sys
+
+
+class Profiler:
+    r"""
+    Statistics of macro and environment expansions.
+
+    For each macro (name with preceding ``\``) and each environment,
+    we record the number of expansions, the number of tokens produced,
+    and the time spent in Python handlers (attribute `repl` is a
+    function) or in expansion of replacement templates.
+    Handler times include nested expansions started by the handler.
+    """
+    def __init__(self):
+        self.stats = {}
+        """Dictionary (kind, name) -> [count, tokens, handler, template]."""
+
+    def record(self, kind, name, handler, ntoks, seconds):
+        """
+        Record an expansion.
+
+        Arguments:
+            kind: ``'macro'`` or ``'environment'``.
+            name: name of macro or environment.
+            handler: True if expanded by a Python handler.
+            ntoks: number of tokens produced.
+            seconds: time spent for the expansion.
+        """
+        entry = self.stats.get((kind, name))
+        if entry is None:
+            entry = self.stats[kind, name] = [0, 0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += ntoks
+        if handler:
+            entry[2] += seconds
+        else:
+            entry[3] += seconds
+
+    def entries(self):
+        """
+        Return list of dictionaries, sorted by decreasing total time.
+        """
+        out = [{'kind': kind, 'name': name, 'count': s[0], 'tokens': s[1],
+                    'handler_time': s[2], 'template_time': s[3]}
+                    for (kind, name), s in self.stats.items()]
+        out.sort(key=lambda e: (-e['handler_time'] - e['template_time'],
+                                    -e['count'], e['kind'], e['name']))
+        return out
+
+    def table(self):
+        """
+        Return entries as text table, one line per macro or environment.
+        """
+        lines = ['{:>9} {:>10} {:>11} {:>11}  {}'.format('count',
+                        'tokens', 'handler/s', 'template/s', 'name')]
+        for e in self.entries():
+            name = e['name']
+            if e['kind'] == 'environment':
+                name = '{' + name + '}'
+            lines.append('{:>9} {:>10} {:>11.6f} {:>11.6f}  {}'.format(
+                        e['count'], e['tokens'], e['handler_time'],
+                        e['template_time'], name))
+        return '\n'.join(lines) + '\n'
+
+    def json(self):
+        """
+        Return entries as JSON string.
+        """
+        return json.dumps(self.entries(), indent=1)
+
+    def report(self, file=None):
+        """
+        Write JSON entries to `file`, or text table to stderr if `file`
+        is None.
+        """
+        if file is None:
+            sys.stderr.write(self.table())
+            sys.stderr.flush()
+            return
+        with open(file, mode='w', encoding='utf-8') as f:
+            f.write(self.json() + '\n')
@@ -20,6 +20,11 @@
 Simple LaTeX scanner mapping LaTeX source to token lists.
 """
 
+import copy
+import re
+from array import array
+from itertools import islice
+
 from yalafi import defs
 from yalafi import utils
 
@@ -30,7 +35,18 @@ class Scanner:
 
     Each “normal” character becomes a single token. Space is divided
     into paragraph-breaking and non-breaking space.
+
+    If :attr:`yalafi.parameters.Parameters.text_runs` is set, maximal
+    runs of letters and digits, possibly separated by blanks, but not
+    by line breaks, become a single :class:`yalafi.defs.TextToken`
+    instead.  See :func:`split_text_run`.
     """
+
+    scan_cache = {}
+    """Cache of :meth:`scan_cached`, shared by all scanners."""
+    scan_cache_size = 4096
+    """Maximum number of entries in :attr:`scan_cache`."""
+
     def __init__(self, parms):
         self.parms = parms
 
@@ -38,6 +54,21 @@ class Scanner:
         self.special_tokens_sorted = list(parms.special_tokens.keys())
         self.special_tokens_sorted.sort(key=(lambda s: -len(s)))
 
+        # text runs must not contain characters starting special tokens
+        # or short macros of any language
+        excl = set(s[0] for s in parms.special_tokens)
+        for settings in parms.parser_lang_settings.values():
+            excl |= settings.active_chars
+        excl |= set('\\%#')
+        word = ('[^\\W_' + ''.join(re.escape(c) for c in sorted(excl))
+                    + ']+')
+        self.re_text_run = re.compile(word + '(?:[ \t]+' + word + ')*')
+
+        # scanner configuration fixed at creation, see scan_cached()
+        self.cache_key = (type(self), tuple(self.special_tokens_sorted),
+                            tuple(sorted(parms.accent_macros)),
+                            self.re_text_run.pattern)
+
         self.latex = None
         """LaTeX string loaded in the scanner."""
         self.source = None
@@ -45,9 +76,17 @@ class Scanner:
         self.pos = None
         """Current position of the scanner in :attr:`latex`."""
         self.max_pos = None
+        self.raw_environ_res = {}
+        self.rescan_list = None
+        """Token list returned by the last call of :meth:`rescan`."""
+        self.rescan_deps = []
+        """
+        Tokens of :attr:`rescan_list` that may depend on text far behind
+        them: error tokens, and raw environments without end.
+        """
 
 
-    def scan(self, latex, source='<unknown>'):
+    def scan(self, latex, source='<unknown>', table=False):
         """
         Scan a LaTeX string into tokens.
 
@@ -57,6 +96,8 @@ class Scanner:
             latex: LaTeX string.
             source: Name of the source, usually the file name from where
               the LaTeX strings comes. Defaults to '<unknown>'.
+            table: If `True`, return a :class:`TokenTable` instead of a
+              list. Defaults to `False`.
 
         Returns:
             List of tokens representing the LaTeX string.
@@ -65,12 +106,209 @@ class Scanner:
         self.source = source
         self.max_pos = len(latex)
         self.pos = 0
-        tokens = []
+        tokens = TokenTable(latex) if table else []
         while self.pos < self.max_pos:
-            tokens.append(self.next_token())
+            tok = self.next_token()
+            if tok is not None:
+                tokens.append(tok)
         return tokens
 
 
+    def scan_cached(self, latex):
+        """
+        Scan a LaTeX string into a tuple of tokens, using a cache.
+
+        Used for macro and environment definitions, where the same short
+        strings are scanned again and again. The cache is shared by all
+        scanners with the same configuration. The oldest entries are
+        dropped if it holds :attr:`scan_cache_size` entries.
+
+        The returned tokens are shared and must not be modified, copy
+        them before changing attributes.
+
+        Args:
+            latex: LaTeX string.
+
+        Returns:
+            Tuple of tokens representing the LaTeX string.
+        """
+        if not latex:
+            return ()
+        parms = self.parms
+        raw = parms.raw_environments
+        key = (self.cache_key, parms.text_runs, parms.comment_skip_begin,
+                parms.comment_skip_end, frozenset(raw) if raw else None,
+                latex)
+        cache = self.scan_cache
+        toks = cache.get(key)
+        if toks is None:
+            if len(cache) >= self.scan_cache_size:
+                del cache[next(iter(cache))]
+            # do not disturb a scan in progress
+            toks = cache[key] = tuple(copy.copy(self).scan(latex))
+        return toks
+
+
+    def iter_scan(self, latex, source='<unknown>', start=0):
+        """
+        Scan a LaTeX string lazily, yielding one token after the other.
+
+        The tokens are the same as from :meth:`scan`. Scanning works on a
+        copy of the scanner, such that :meth:`scan` may be called while
+        the generator is active, e.g., for macro definitions.
+
+        Args:
+            latex: LaTeX string.
+            source: Name of the source. Defaults to '<unknown>'.
+            start: Position in `latex` where scanning starts, should be
+              the start of a token returned by :meth:`scan`.
+
+        Yields:
+            Tokens representing the LaTeX string.
+        """
+        sc = copy.copy(self)
+        sc.latex = latex
+        sc.source = source
+        sc.max_pos = len(latex)
+        sc.pos = start
+        while sc.pos < sc.max_pos:
+            tok = sc.next_token()
+            if tok is not None:
+                yield tok
+
+
+    def rescan(self, old_tokens, edit_offset, removed_len, inserted_text,
+                    latex=None, source=None):
+        """
+        Update the token list of an edited LaTeX string.
+
+        The edit replaces `removed_len` characters at `edit_offset` of the
+        old string by `inserted_text`. Only a window around the edit is
+        scanned again: scanning restarts at a token boundary before the
+        line that precedes the edited line (a comment token, for
+        instance, depends on the next line), or at the beginning of the
+        string.  It restarts earlier at a verbatim or raw environment or
+        a skipped region in front of the edit whose end is missing, and
+        at an error mark that is cut off at the end of the old or new
+        string.  The result of scanning only depends on the
+        text from the current position on, therefore scanning stops as
+        soon as it reaches the start of an old token behind the edit.
+        The new tokens are spliced into `old_tokens`, and the positions
+        of the old tokens behind them are shifted.
+
+        Tokens that may depend on text far behind them are recorded for
+        the returned list, see :attr:`rescan_deps`, such that repeated
+        calls for the same list do not search all tokens before the
+        edit.
+
+        Afterwards, the scanner holds the new string as if :meth:`scan`
+        had been called.
+
+        Args:
+            old_tokens: Tokens returned by :meth:`scan` for the old string.
+            edit_offset: Position of the edit in the old string.
+            removed_len: Number of characters removed at `edit_offset`.
+            inserted_text: String inserted at `edit_offset`.
+            latex: The old LaTeX string. Defaults to the string of the
+              last call of :meth:`scan` or :meth:`rescan`.
+            source: Name of the source. Defaults to the last one.
+
+        Returns:
+            List `old_tokens`, modified to represent the new LaTeX string.
+        """
+        if latex is None:
+            latex = self.latex
+        if source is None:
+            source = self.source or '<unknown>'
+        edit_end = edit_offset + removed_len
+        delta = len(inserted_text) - removed_len
+        new_latex = latex[:edit_offset] + inserted_text + latex[edit_end:]
+
+        def start(i):
+            return token_start(old_tokens[i], latex)
+
+        def find(pos):
+            # index of the first old token starting behind `pos`
+            lo, hi = 0, len(old_tokens)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if start(mid) <= pos:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+
+        # restart at a token starting at or before the beginning of the
+        # line preceding the edited line; there may be no such token, if
+        # the string starts with a skipped region
+        nl = latex.rfind('\n', 0, edit_offset)
+        safe = latex.rfind('\n', 0, nl) + 1 if nl > 0 else 0
+        restart = find(safe) - 1
+
+        raw = self.parms.raw_environments
+        def depends(t, latex):
+            if t.pos_fix:
+                return True
+            if raw and type(t) is defs.BeginToken:
+                m = re.compile(r'\s*\{([^}]*)\}').match(latex,
+                                                t.pos + len('\\begin'))
+                return bool(m) and m.group(1) in raw
+            return False
+        if old_tokens is not self.rescan_list:
+            self.rescan_deps = [t for t in old_tokens if depends(t, latex)]
+        # a verbatim or raw environment or a skipped region without end
+        # depends on all text behind, an error mark is cut off at the end
+        # of the string
+        cut = min(len(latex), len(new_latex))
+        for t in self.rescan_deps:
+            if restart < 0 or token_start(t, latex) >= start(restart):
+                break
+            if (not t.pos_fix or t.pos + len(t.txt) >= cut
+                    or latex.startswith('\\begin', t.pos)
+                    or latex.startswith(self.parms.comment_skip_begin,
+                                                            t.pos)):
+                restart = find(token_start(t, latex)) - 1
+                break
+        if restart < 0:
+            restart = 0
+            self.pos = 0
+        else:
+            self.pos = start(restart)
+        deps_before = [t for t in self.rescan_deps
+                            if token_start(t, latex) < self.pos]
+
+        self.latex = new_latex
+        self.source = source
+        self.max_pos = len(new_latex)
+        tokens = []
+        j = restart
+        while self.pos < self.max_pos:
+            # synchronise with old token list behind the edit
+            while (j < len(old_tokens)
+                    and (old_tokens[j].pos_fix or start(j) < edit_end
+                            or start(j) + delta < self.pos)):
+                j += 1
+            if j < len(old_tokens) and start(j) + delta == self.pos:
+                break
+            tok = self.next_token()
+            if tok is not None:
+                tokens.append(tok)
+        else:
+            j = len(old_tokens)
+        deps_behind = [t for t in self.rescan_deps
+                            if j < len(old_tokens)
+                                and token_start(t, latex) >= start(j)]
+        if delta:
+            for t in old_tokens[j:]:
+                t.pos += delta
+        old_tokens[restart:j] = tokens
+        self.rescan_list = old_tokens
+        self.rescan_deps = (deps_before
+                            + [t for t in tokens if depends(t, new_latex)]
+                            + deps_behind)
+        return old_tokens
+
+
     def next_token(self):
         """
         Return next token based on position :attr:`pos`.
@@ -103,13 +341,36 @@ class Scanner:
                 return defs.SpecialToken(start, t)
         if c == '\\':
             return self.scan_macro(latex, start)
-        # otherwise, only return one character:
+        # otherwise, only return one character or a text run:
+        return self.scan_text(latex, start)
+
+
+    def scan_text(self, latex, start):
+        """Scan a single character, or a text run if enabled."""
+        if self.parms.text_runs:
+            m = self.re_text_run.match(latex, start)
+            if m:
+                self.pos = m.end()
+                return defs.TextToken(start, m.group(0))
         self.pos += 1
-        return defs.TextToken(start, c)
+        return defs.TextToken(start, latex[start])
 
 
     def scan_comment(self, latex, start):
-        """Scan a % comment."""
+        """
+        Scan a % comment.
+
+        Special comments :attr:`yalafi.parameters.Parameters.comment_skip_begin`
+        start a region that is skipped, see :meth:`scan_skip_region`.
+        """
+        if latex.startswith(self.parms.comment_skip_begin, start):
+            return self.scan_skip_region(latex, start)
+        self.skip_comment(latex, start)
+        return defs.CommentToken(start, latex[start:self.pos])
+
+
+    def skip_comment(self, latex, start):
+        """Advance :attr:`pos` behind the % comment at `start`."""
         self.pos = next((i for i in range(start + 1, self.max_pos)
                                 if latex[i] == '\n'), self.max_pos)
         next_non_space = next((i for i in range(self.pos + 1, self.max_pos)
@@ -117,7 +378,37 @@ class Scanner:
         if latex.count('\n', self.pos + 1, next_non_space) == 0:
             # next line not empty: progress further
             self.pos = next_non_space
-        return defs.CommentToken(start, latex[start:self.pos])
+
+
+    def scan_skip_region(self, latex, start):
+        """
+        Skip text till the closing special comment
+        :attr:`yalafi.parameters.Parameters.comment_skip_end`, including
+        both comments.
+
+        The text in between is not tokenized. Only a % that is not
+        preceded by another comment on the same line and not escaped by
+        a backslash starts the closing comment.
+
+        As the region yields no token, :meth:`rescan` cannot restart
+        scanning inside; for an edit in the region, or on the line
+        behind it, scanning restarts at the last token in front of the
+        region, or at the beginning of the string.
+
+        Returns:
+            `None`, or an error token, if the closing comment is missing.
+        """
+        mark = self.parms.comment_skip_end
+        pos = start
+        while True:
+            pos = latex.find(mark, pos + 1)
+            if pos < 0:
+                self.skip_comment(latex, start)
+                return self.latex_error('cannot find closing LaTeX comment '
+                                                + repr(mark), start)[0]
+            if first_comment(latex, latex.rfind('\n', 0, pos) + 1) == pos:
+                self.skip_comment(latex, pos)
+                return None
 
 
     def scan_space(self, latex, start):
@@ -138,7 +429,16 @@ class Scanner:
         if self.pos == start + 1 and self.pos < self.max_pos:
             # an accent macro like \'
             self.pos += 1
-        mac = latex[start:self.pos]
+        return self.classify_macro(latex, start, latex[start:self.pos])
+
+
+    def classify_macro(self, latex, start, mac):
+        r"""
+        Return the token for macro name `mac` starting at `start`.
+
+        Macros ``\begin``, ``\end``, ``\item``, ``\verb`` and accent
+        macros get their own token types.
+        """
         if mac == '\\begin':
             return self.scan_verbatim(latex, start, mac)
         if mac == '\\end':
@@ -189,12 +489,22 @@ class Scanner:
         If the environment name is ``verbatim``, the scanner is advanced
         and a :class:`yalafi.defs.VerbatimToken` with the content of the
         ``verbatim`` environment is returned.
+        If the environment name is in
+        :attr:`yalafi.parameters.Parameters.raw_environments`, see
+        :meth:`scan_raw_environment`.
         """
         # XXX: we do not account for % comments
-        pos = next((i for i in range(start + len('\\begin'), self.max_pos)
-                        if not latex[i].isspace()), self.max_pos)
+        pos = self.skip_space(latex, start + len('\\begin'))
         if (pos >= self.max_pos or latex.count('\n', start, pos) > 1
-                or not latex.startswith('{verbatim}', pos)):
+                or latex[pos] != '{'):
+            return defs.BeginToken(start, mac)
+        if not latex.startswith('{verbatim}', pos):
+            if self.parms.raw_environments:
+                end = latex.find('}', pos)
+                name = latex[pos+1:end]
+                if end > 0 and name in self.parms.raw_environments:
+                    return self.scan_raw_environment(latex, start,
+                                                        end + 1, name)
             return defs.BeginToken(start, mac)
 
         pos += len('{verbatim}')
@@ -205,6 +515,49 @@ class Scanner:
         return defs.VerbatimToken(pos, latex[pos:end], environ=True)
 
 
+    def scan_raw_environment(self, latex, start, pos, name):
+        r"""
+        Scan a whole environment, whose body is not tokenized.
+
+        Nested environments of the same name are counted, and ``\end``
+        in % comments is ignored. If there is no matching ``\end``, a
+        :class:`yalafi.defs.BeginToken` is returned and :attr:`pos` is
+        left unchanged.
+
+        Args:
+            latex: LaTeX string.
+            start: Position of ``\begin``.
+            pos: Position behind ``{name}``.
+            name: Name of the environment.
+
+        Returns:
+            A :class:`yalafi.defs.RawEnvironToken`.
+        """
+        r = self.raw_environ_res.get(name)
+        if r is None:
+            r = re.compile(r'%[^\n]*|\\(?:(begin)|(end))'
+                            + r'[ \t]*(?:\n[ \t]*)?\{' + re.escape(name)
+                            + r'\}|\\.', re.S)
+            self.raw_environ_res[name] = r
+        level = 1
+        for m in r.finditer(latex, pos):
+            if m.group(1):
+                level += 1
+            elif m.group(2):
+                level -= 1
+                if not level:
+                    self.pos = m.end()
+                    return defs.RawEnvironToken(start, latex[start:self.pos],
+                                                    name)
+        return defs.BeginToken(start, '\\begin')
+
+
+    def skip_space(self, latex, pos):
+        """Return position of first non-space character from `pos` on."""
+        return next((i for i in range(pos, self.max_pos)
+                        if not latex[i].isspace()), self.max_pos)
+
+
     #   HACK: we us a "fake parser"
     def latex_error(self, msg, pos):
         """Wrapper for :func:`yalafi.utils.latex_error`"""
@@ -217,36 +570,302 @@ class Scanner:
         return utils.latex_error(FakeParser(self), msg, pos)
 
 
+class TableScanner(Scanner):
+    """
+    Table-driven LaTeX scanner.
+
+    Produces exactly the same token stream as :class:`Scanner`, but
+    dispatches on the first character of each token with a precompiled
+    table, looks up special tokens through an index of their first
+    characters, and scans runs of space, comments and macro names with
+    :meth:`str.find` and compiled regular expressions.
+
+    The character class of macro names is taken from
+    :meth:`yalafi.parameters.Parameters.macro_character` for the first
+    256 code points.
+    """
+    def __init__(self, parms):
+        super().__init__(parms)
+
+        # special tokens indexed by first character, long tokens first
+        self.special_tokens_index = {}
+        for t in self.special_tokens_sorted:
+            self.special_tokens_index.setdefault(t[0], []).append(t)
+
+        letters = ''.join(chr(i) for i in range(256)
+                                if parms.macro_character(chr(i)))
+        self.re_macro = re.compile('[' + ''.join(re.escape(c)
+                                                for c in letters) + ']*')
+        self.re_space = re.compile(r'\s+')
+        self.re_non_space = re.compile(r'\S')
+
+        # dispatch table for first characters; characters not included
+        # are either (non-ASCII) space or yield a single TextToken;
+        # the table holds plain functions, thus it can be shared by
+        # copies of the scanner (see Scanner.iter_scan())
+        cls = type(self)
+        self.dispatch = {}
+        for c in self.special_tokens_index:
+            self.dispatch[c] = cls.scan_special
+        for i in range(128):
+            if chr(i).isspace():
+                self.dispatch[chr(i)] = cls.scan_space
+        self.dispatch['%'] = cls.scan_comment
+        self.dispatch['#'] = cls.scan_arg_token
+        self.dispatch['\\'] = cls.scan_special
+
+
+    def next_token(self):
+        """
+        Return next token based on position :attr:`pos`.
+
+        See :meth:`Scanner.next_token`.
+        """
+        latex = self.latex
+        start = self.pos
+        c = latex[start]
+        f = self.dispatch.get(c)
+        if f:
+            return f(self, latex, start)
+        if c.isspace():
+            return self.scan_space(latex, start)
+        return self.scan_text(latex, start)
+
+
+    def scan_special(self, latex, start):
+        r"""Scan a special token or a macro beginning with ``\``."""
+        for t in self.special_tokens_index.get(latex[start], ()):
+            if latex.startswith(t, start):
+                self.pos += len(t)
+                return defs.SpecialToken(start, t)
+        if latex[start] == '\\':
+            return self.scan_macro(latex, start)
+        return self.scan_text(latex, start)
+
+
+    def skip_comment(self, latex, start):
+        """Advance :attr:`pos` behind the % comment at `start`."""
+        self.pos = latex.find('\n', start + 1)
+        if self.pos < 0:
+            self.pos = self.max_pos
+        m = self.re_non_space.search(latex, self.pos + 1)
+        next_non_space = m.start() if m else self.max_pos
+        if latex.count('\n', self.pos + 1, next_non_space) == 0:
+            # next line not empty: progress further
+            self.pos = next_non_space
+
+
+    def scan_space(self, latex, start):
+        """Scan space."""
+        self.pos = self.re_space.match(latex, start).end()
+        space = latex[start:self.pos]
+        if space.count('\n') < 2:
+            return defs.SpaceToken(start, space)
+        return defs.ParagraphToken(start, space)
+
+
+    def scan_macro(self, latex, start):
+        r"""Scan a LaTeX macro beginning with ``\``"""
+        self.pos = self.re_macro.match(latex, start + 1).end()
+        if self.pos == start + 1 and self.pos < self.max_pos:
+            # an accent macro like \'
+            self.pos += 1
+        return self.classify_macro(latex, start, latex[start:self.pos])
+
+
+    def scan_verb(self, latex, start):
+        r"""Scan ``\verb``"""
+        start_arg = start + len('\\verb')
+        if start_arg >= self.max_pos:
+            return self.latex_error('bad \\verb argument', start)[0]
+        delim = latex[start_arg]
+        start_arg += 1
+        ends = [i for i in (latex.find(delim, start_arg),
+                            latex.find('\n', start_arg)) if i >= 0]
+        self.pos = min(ends) if ends else self.max_pos
+        if self.pos == self.max_pos or latex[self.pos] == '\n':
+            return self.latex_error('bad \\verb argument', start)[0]
+        self.pos += 1
+        return defs.VerbatimToken(start_arg, latex[start_arg:self.pos-1])
+
+
+    def skip_space(self, latex, pos):
+        """Return position of first non-space character from `pos` on."""
+        m = self.re_non_space.search(latex, pos)
+        return m.start() if m else self.max_pos
+
+
+class TokenTable:
+    """
+    Columnar token list returned by :meth:`Scanner.scan` with
+    ``table=True``.
+
+    Tokens are stored in parallel ``array('i')`` columns :attr:`kind`,
+    :attr:`start` and :attr:`length`; the text of a token is sliced from
+    the source string on demand. Indexing and iteration yield token
+    objects as in a list returned by :meth:`Scanner.scan`, but these are
+    created on each access. Tokens that cannot be represented by a slice
+    of the source, e.g. error marks from :func:`yalafi.utils.latex_error`,
+    are kept as objects in :attr:`extras`.
+
+    Columns can be inspected without creating token objects, and rows can
+    be dropped with :meth:`compress`.
+    """
+
+    kinds = (defs.TextToken, defs.SpaceToken, defs.ParagraphToken,
+                defs.CommentToken, defs.SpecialToken, defs.MacroToken,
+                defs.BeginToken, defs.EndToken, defs.ItemToken,
+                defs.AccentToken, defs.VerbatimToken, defs.ArgumentToken)
+    """Token classes, indexed by the codes in column :attr:`kind`."""
+    VERBATIM_ENV = len(kinds)
+    """Code for a :class:`yalafi.defs.VerbatimToken` from an environment."""
+    EXTRA = VERBATIM_ENV + 1
+    """Code for a token kept in :attr:`extras`."""
+
+    codes = {cls: code for code, cls in enumerate(kinds)}
+
+    def __init__(self, latex):
+        self.latex = latex
+        """Source string of the tokens."""
+        self.kind = array('i')
+        """Column of token kinds, see :attr:`kinds`."""
+        self.start = array('i')
+        """Column of token positions."""
+        self.length = array('i')
+        """Column of token text lengths."""
+        self.extras = {}
+        """Dictionary mapping row index to tokens of kind :attr:`EXTRA`."""
+
+
+    def append(self, tok):
+        """Append a token, only its kind, position and length are kept."""
+        code = self.codes.get(type(tok))
+        if code is None or tok.pos_fix:
+            code = self.EXTRA
+            self.extras[len(self.kind)] = tok
+        elif code == self.codes[defs.VerbatimToken] and tok.environ:
+            code = self.VERBATIM_ENV
+        self.kind.append(code)
+        self.start.append(tok.pos)
+        self.length.append(len(tok.txt))
+
+
+    def text(self, i):
+        """Return the text of token `i` without creating the token."""
+        if self.kind[i] == self.EXTRA:
+            return self.extras[i % len(self.kind)].txt
+        start = self.start[i]
+        return self.latex[start:start+self.length[i]]
+
+
+    def compress(self, selectors):
+        """
+        Return a new table containing the rows for which the corresponding
+        element of `selectors` is true, as :func:`itertools.compress`.
+        """
+        out = TokenTable(self.latex)
+        for i, sel in enumerate(selectors):
+            if not sel:
+                continue
+            if self.kind[i] == self.EXTRA:
+                out.extras[len(out.kind)] = self.extras[i]
+            out.kind.append(self.kind[i])
+            out.start.append(self.start[i])
+            out.length.append(self.length[i])
+        return out
+
+
+    def __len__(self):
+        return len(self.kind)
+
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self.kind)))]
+        code = self.kind[i]
+        if code == self.EXTRA:
+            return self.extras[i % len(self.kind)]
+        pos = self.start[i]
+        txt = self.latex[pos:pos+self.length[i]]
+        if code == self.VERBATIM_ENV:
+            return defs.VerbatimToken(pos, txt, environ=True)
+        cls = self.kinds[code]
+        if cls is defs.ArgumentToken:
+            return defs.ArgumentToken(pos, txt, int(txt[1:]))
+        return cls(pos, txt)
+
+
+    def __iter__(self):
+        for i in range(len(self.kind)):
+            yield self[i]
+
+
 class Buffer:
     """
     A buffer for tokens.
 
     It is basically a list of tokens, where all operations happen at the
-    beginning. In the implementation, it is a reversed list. This is
-    faster and more convenient than changing a list at the beginning.
+    beginning. The buffer reads from a base sequence that is never
+    modified, using an integer cursor. Tokens pushed back are kept on a
+    small overlay stack in front of the base tokens, the last item of
+    the stack is the first token.
+
+    Args:
+        tokens: Sequence of tokens, it is not copied.
+        start: Index of the first token in `tokens`. Defaults to 0.
+        stop: Index behind the last token in `tokens`. Defaults to the
+          length of `tokens`.
     """
 
-    def __init__(self, tokens):
-        self.tokens = list(reversed(tokens))
-        """List of tokens. The last item is the first token."""
+    space_types = frozenset((defs.SpaceToken, defs.CommentToken,
+                        defs.ActionToken, defs.VoidToken, defs.LanguageToken))
+    """Token types skipped by :meth:`skip_space` and :meth:`look_ahead`."""
+
+    def __init__(self, tokens, start=0, stop=None):
+        self.base = tokens
+        """Sequence of tokens, not modified by the buffer."""
+        self.cursor = start
+        """Index of the next token in :attr:`base`."""
+        self.stop = len(tokens) if stop is None else stop
+        """Index behind the last token in :attr:`base`."""
+        self.overlay = []
+        """Stack of pushed back tokens. The last item is the first token."""
+        self.expansions = 0
+        """
+        Number of expansions of pushed back tokens since a macro or
+        environment has been expanded from base tokens, counted by the
+        parser.
+        """
+        self.expansion_starts = {}
+        """
+        Dictionary macro or environment name -> lowest length of
+        :attr:`overlay` at its expansions since then, for dropping the
+        tokens generated by a runaway expansion.
+        """
 
 
     def all(self):
         """Return list of all remaining tokens."""
-        return list(reversed(self.tokens))
+        out = self.overlay[::-1]
+        out.extend(self.base[self.cursor:self.stop])
+        return out
 
 
     def cur(self):
         """Return the current (first) token in the buffer."""
-        if self.tokens:
-            return self.tokens[-1]
+        if self.overlay:
+            return self.overlay[-1]
+        if self.cursor < self.stop:
+            return self.base[self.cursor]
         return None
 
 
     def next(self):
         "Remove the current (first) token from the buffer and return the next."
-        if self.tokens:
-            self.tokens.pop()
+        if self.overlay:
+            self.overlay.pop()
+        elif self.cursor < self.stop:
+            self.cursor += 1
         return self.cur()
 
 
@@ -255,7 +874,52 @@ class Buffer:
         Push back a list of tokens, i.e. place them in front of all
         other tokens in the buffer.
         """
-        self.tokens.extend(reversed(toks))
+        self.overlay.extend(reversed(toks))
+
+
+    def clear(self):
+        """Remove all remaining tokens."""
+        self.overlay.clear()
+        self.cursor = self.stop
+
+
+    def mark(self):
+        """
+        Return a mark for :meth:`since`, or `None` if the current token
+        is not a base token.
+        """
+        if self.overlay:
+            return None
+        return self.cursor
+
+
+    def since(self, mark):
+        """
+        Return a new buffer viewing the base tokens read since `mark`
+        was taken by :meth:`mark`, without copying them.
+
+        Only valid if no tokens were pushed back in between.
+        """
+        return Buffer(self.base, mark, self.cursor)
+
+
+    def split_cur(self):
+        """
+        Split off the first character of a text run.
+
+        If the current token is a text run as generated by the scanner
+        with :attr:`yalafi.parameters.Parameters.text_runs`, it is
+        replaced by the tokens from :func:`split_text_run`.
+
+        Returns:
+            The (new) current token.
+        """
+        tok = self.cur()
+        if (type(tok) is defs.TextToken and len(tok.txt) > 1
+                and not tok.pos_fix):
+            self.next()
+            self.back(split_text_run(tok))
+        return self.cur()
 
 
     def skip_space(self):
@@ -267,7 +931,7 @@ class Buffer:
         skipped.
         """
         tok = self.cur()
-        while self.is_space(tok):
+        while type(tok) in self.space_types:
             tok = self.next()
         return tok
 
@@ -278,16 +942,19 @@ class Buffer:
         return the next other token.
 
         Paragraph tokens are not skipped, but they might be returned.
+        The buffer is not modified.
 
         See `Buffer.is_space` for details on which tokens are skipped.
         """
-        buf = []
-        tok = self.cur()
-        while self.is_space(tok):
-            buf.append(tok)
-            tok = self.next()
-        self.back(buf)
-        return tok
+        space_types = self.space_types
+        for tok in reversed(self.overlay):
+            if type(tok) not in space_types:
+                return tok
+        base = self.base
+        for i in range(self.cursor, self.stop):
+            if type(base[i]) not in space_types:
+                return base[i]
+        return None
 
 
     def is_space(self, tok):
@@ -304,5 +971,158 @@ class Buffer:
             :class:`yalafi.defs.VoidToken`, or
             :class:`yalafi.defs.LanguageToken`.
         """
-        return type(tok) in (defs.SpaceToken, defs.CommentToken,
-                        defs.ActionToken, defs.VoidToken, defs.LanguageToken)
+        return type(tok) in self.space_types
+
+
+class StreamBuffer(Buffer):
+    """
+    A buffer that pulls its tokens lazily from an iterable, e.g., from
+    :meth:`Scanner.iter_scan`.
+
+    Tokens are taken from the iterable in chunks of :attr:`chunk_size`
+    tokens, whenever the base tokens are exhausted. Tokens pushed back
+    with :meth:`Buffer.back` precede all tokens not yet pulled.
+    """
+
+    def __init__(self, tokens, chunk_size=256):
+        super().__init__([])
+        self.stream = iter(tokens)
+        """Iterator over the tokens not yet pulled into the buffer."""
+        self.chunk_size = chunk_size
+        """Number of tokens pulled at once."""
+
+
+    def fill(self):
+        """
+        Append the next chunk of tokens to the remaining base tokens.
+
+        A new base list is created, such that views returned by
+        :meth:`Buffer.since` remain valid.
+
+        Returns:
+            `False` if the iterable is exhausted.
+        """
+        if self.stream is None:
+            return False
+        chunk = list(islice(self.stream, self.chunk_size))
+        if not chunk:
+            self.stream = None
+            return False
+        if self.cursor < self.stop:
+            chunk[:0] = self.base[self.cursor:self.stop]
+        self.base = chunk
+        self.cursor = 0
+        self.stop = len(chunk)
+        return True
+
+
+    def all(self):
+        """Return list of all remaining tokens."""
+        if self.stream is not None:
+            rest = list(self.stream)
+            self.stream = None
+            self.base = self.base[self.cursor:self.stop] + rest
+            self.cursor = 0
+            self.stop = len(self.base)
+        return super().all()
+
+
+    def clear(self):
+        """Remove all remaining tokens without pulling them."""
+        self.stream = None
+        super().clear()
+
+
+    def cur(self):
+        """Return the current (first) token in the buffer."""
+        if self.overlay:
+            return self.overlay[-1]
+        if self.cursor < self.stop or self.fill():
+            return self.base[self.cursor]
+        return None
+
+
+    def next(self):
+        "Remove the current (first) token from the buffer and return the next."
+        if self.overlay:
+            self.overlay.pop()
+        elif self.cursor < self.stop or self.fill():
+            self.cursor += 1
+        return self.cur()
+
+
+    def mark(self):
+        """
+        Return `None`, base tokens may be replaced when pulling the next
+        chunk.
+        """
+        return None
+
+
+    def look_ahead(self):
+        """
+        Skip space and comment tokens, but keep them in the buffer, and
+        return the next other token.
+
+        See :meth:`Buffer.look_ahead`.
+        """
+        tok = super().look_ahead()
+        while tok is None and self.fill():
+            tok = super().look_ahead()
+        return tok
+
+
+def first_comment(latex, pos):
+    """
+    Return the position of the first % from `pos` on that is not escaped
+    by a backslash, or -1.
+    """
+    pos = latex.find('%', pos)
+    while pos >= 0:
+        i = pos
+        while i > 0 and latex[i-1] == '\\':
+            i -= 1
+        if (pos - i) % 2 == 0:
+            break
+        pos = latex.find('%', pos + 1)
+    return pos
+
+
+def token_start(tok, latex):
+    r"""
+    Return the position in `latex` where the scanner started the token.
+
+    This is the token position, except for verbatim tokens, which point
+    to the text behind ``\verb?`` or ``\begin{verbatim}``.
+
+    Args:
+        tok: A token returned by :meth:`Scanner.scan` for `latex`.
+        latex: The scanned LaTeX string.
+    """
+    if type(tok) is defs.VerbatimToken:
+        if tok.environ:
+            return latex.rfind('\\begin', 0, tok.pos)
+        return tok.pos - 1 - len('\\verb')
+    return tok.pos
+
+
+def split_text_run(tok):
+    """
+    Split a text run into its first character and the rest.
+
+    Blanks following the first character become a separate
+    :class:`yalafi.defs.SpaceToken`, as they would without text runs.
+
+    Args:
+        tok: :class:`yalafi.defs.TextToken` with more than one character.
+
+    Returns:
+        List of two or three tokens.
+    """
+    out = [defs.TextToken(tok.pos, tok.txt[0])]
+    rest = tok.txt[1:]
+    blank = len(rest) - len(rest.lstrip(' \t'))
+    if blank:
+        out.append(defs.SpaceToken(tok.pos + 1, rest[:blank]))
+    out.append(defs.TextToken(tok.pos + 1 + blank, rest[blank:]))
+    return out
@@ -53,6 +53,12 @@ def run_proofreader(file):
                         cmdline.disablecategories, cmdline.enablecategories,
                         cmdline.lt_options[1:].split())
 
+#   modification of parameters for multi-language documents,
+#   a module-level function lets tex2txt() reuse its parsers
+#
+def modify_parms(parms):
+    parms.ml_continue_thresh = cmdline.ml_continue_threshold
+
 #   this can be used, if the shell is run as an HTTP server
 #   - for that: overwrite CLI options from from fields of HTML request
 #
@@ -65,7 +71,7 @@ def run_proofreader_options(tex, source, source_defs, language,
                             extr=cmdline.extract, unkn=cmdline.list_unknown,
                             seqs=cmdline.simple_equations,
                             dcls=cmdline.documentclass, pack=cmdline.packages,
-                            nosp=cmdline.no_specials)
+                            nosp=cmdline.no_specials, prof=profiler)
 
     if cmdline.plain_input:
         plain_map = {language: [(tex, list(range(1, len(tex) + 1)))]}
@@ -76,10 +82,8 @@ def run_proofreader_options(tex, source, source_defs, language,
                                                 source_defs=source_defs)
             return (tex, plain, charmap, [])
         if cmdline.multi_language:
-            def mod_parms(parms):
-                parms.ml_continue_thresh = cmdline.ml_continue_threshold
             plain_map = tex2txt.tex2txt(tex, t2t_options, multi_language=True,
-                                    modify_parms=mod_parms,
+                                    modify_parms=modify_parms,
                                     source=source, source_defs=source_defs)
         else:
             plain, charmap = tex2txt.tex2txt(tex, t2t_options, source=source,
@@ -339,6 +343,8 @@ def init(vars):
     equation_replacements_inline = vars.equation_replacements_inline
     global equation_replacements
     equation_replacements = vars.equation_replacements
+    global profiler
+    profiler = vars.profiler
     global lt_option_map 
     lt_option_map = vars.lt_option_map 
     global source_defs
@@ -118,7 +118,7 @@ import sys
 import argparse
 import json
 import signal
-from yalafi import tex2txt, parameters
+from yalafi import tex2txt, parameters, profiler
 
 # parse command line
 #
@@ -165,6 +165,8 @@ parser.add_argument('--ml-disablecategories',
                         default=default_option_ml_disablecategories)
 parser.add_argument('--no-config', action='store_true')
 parser.add_argument('--no-specials', action='store_true')
+parser.add_argument('--profile', action='store_true')
+parser.add_argument('--profile-json')
 parser.add_argument('file', nargs='*')
 
 cmdline = parser.parse_args(sys.argv[1:])
@@ -349,6 +351,9 @@ vars.highlight_style = highlight_style
 vars.number_style = number_style
 vars.lt_option_map = lt_option_map
 vars.source_defs = source_defs
+vars.profiler = None
+if cmdline.profile or cmdline.profile_json:
+    vars.profiler = profiler.Profiler()
 
 # import functions for calling proofreader
 #
@@ -388,3 +393,5 @@ elif cmdline.output == 'json':
     genjson.generate_json_report(cmdline, proofreader.run_proofreader,
                                             json_get, out_utf8)
 
+if vars.profiler:
+    vars.profiler.report(cmdline.profile_json)
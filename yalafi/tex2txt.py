@@ -26,36 +26,29 @@
 #   - option '--pack mods' calls functions init_module() from packages
 #
 
-from yalafi import parameters, parser, utils
+from yalafi import parameters, parser, profiler, utils
+
+#   parsers with loaded packages, and their snapshots,
+#   reused for following calls of tex2txt() with equal settings
+#
+parser_cache = {}
+parser_cache_size = 8
 
 def tex2txt(latex, opts, source='<unknown>', source_defs='<unknown>',
                     multi_language=False, modify_parms=None):
-    def read(file):
-        try:
-            with open(file, encoding=opts.ienc) as f:
-                return True, f.read()
-        except:
-            return False, ''
-
-    parms = parameters.Parameters(opts.lang or '')
-    parms.multi_language = multi_language
-    packages = get_packages(opts.dcls, parms.class_modules)
-    packages.extend(get_packages(opts.pack, parms.package_modules))
+    p = get_parser(opts, multi_language, modify_parms)
+    p.profiler = opts.prof
+    parms = p.parms
 
     if opts.extr:
         extr = ['\\' + s for s in opts.extr.split(',')]
     else:
         extr = []
-    if opts.seqs:
-        parms.math_displayed_simple = True
-    if opts.nosp:
-        parms.no_specials()
-
-    if modify_parms:
-        modify_parms(parms)
-    p = parser.Parser(parms, packages, read_macros=read)
     toks = p.parse(latex, source=source, define=opts.defs,
-                            source_defs=source_defs, extract=extr)
+                            source_defs=source_defs, extract=extr,
+                            stop_at=opts.stop)
+    if opts.utot is not None:
+        merge_unknowns(opts.utot, p.get_unknowns(counts=True))
 
     if not multi_language:
         txt, pos = utils.get_txt_pos(toks)
@@ -78,6 +71,86 @@ def tex2txt(latex, opts, source='<unknown>', source_defs='<unknown>',
             part[1]= list(n + 1 for n in part[1])
     return ml
 
+#   generator of (txt, pos) for parts of the text, as soon as the parser
+#   reaches a paragraph boundary; no multi-language support
+#
+def tex2txt_iter(latex, opts, source='<unknown>', source_defs='<unknown>',
+                    modify_parms=None):
+    p = get_parser(opts, False, modify_parms)
+    p.profiler = opts.prof
+
+    if opts.extr:
+        extr = ['\\' + s for s in opts.extr.split(',')]
+    else:
+        extr = []
+    parts = p.parse_iter(latex, source=source, define=opts.defs,
+                            source_defs=source_defs, extract=extr,
+                            stop_at=opts.stop)
+    if opts.unkn:
+        for toks in parts:
+            pass
+        parts = []
+    for toks in parts:
+        txt, pos = utils.get_txt_pos(toks)
+        if opts.repl:
+            # NB: phrases do not extend over paragraph boundaries
+            txt, pos = utils.replace_phrases(txt, pos, opts.repl)
+        yield txt, [n + 1 for n in pos]
+    if opts.utot is not None:
+        merge_unknowns(opts.utot, p.get_unknowns(counts=True))
+    if opts.unkn:
+        txt = '\n'.join(p.get_unknowns()) + '\n'
+        yield txt, [1 for n in range(len(txt))]
+
+def get_parser(opts, multi_language, modify_parms):
+    key = (opts.lang, opts.dcls, opts.pack, opts.seqs, opts.nosp, opts.ienc,
+                multi_language, modify_parms)
+    if key in parser_cache:
+        base, snapshot = parser_cache[key]
+        return base.fork(snapshot)
+
+    def read(file):
+        try:
+            with open(file, encoding=opts.ienc) as f:
+                return True, f.read()
+        except:
+            return False, ''
+
+    parms = parameters.Parameters(opts.lang or '')
+    parms.multi_language = multi_language
+    packages = get_packages(opts.dcls, parms.class_modules)
+    packages.extend(get_packages(opts.pack, parms.package_modules))
+    if opts.seqs:
+        parms.math_displayed_simple = True
+    if opts.nosp:
+        parms.no_specials()
+    if modify_parms:
+        modify_parms(parms)
+    base = parser.Parser(parms, packages, read_macros=read)
+    snapshot = base.snapshot()
+    if len(parser_cache) >= parser_cache_size:
+        del parser_cache[next(iter(parser_cache))]
+    parser_cache[key] = base, snapshot
+    return base.fork(snapshot)
+
+#   merge unknowns from Parser.get_unknowns(counts=True) into dictionary
+#   total: name -> [count, source, line, column of first occurrence]
+#
+def merge_unknowns(total, unknowns):
+    for name, count, source, lin, col in unknowns:
+        if name in total:
+            total[name][0] += count
+        else:
+            total[name] = [count, source, lin, col]
+
+#   list of merged unknowns, sorted by decreasing count
+#
+def format_unknowns(total):
+    items = sorted(total.items(), key=lambda item: -item[1][0])
+    return ''.join('{:>7}  {}  {}:{}:{}\n'.format(count, name, source,
+                                                        lin, col)
+                        for name, (count, source, lin, col) in items)
+
 def get_packages(packs, prefix):
     ret = []
     if not packs:
@@ -226,7 +299,11 @@ class Options:
             lang=None,      # or set to language code
             seqs=False,     # True: simple replacements for displayed equations
             nosp=False,     # True: deactivate special macros and comments
-            unkn=False):    # True: print unknowns
+            unkn=False,     # True: print unknowns
+            prof=None,      # or profiler.Profiler object
+            utot=None,      # or dict for merge_unknowns()
+            stop=None):     # or 'begin', 'end': stop at \begin{document}
+                            #   or \end{document}
         self.ienc = ienc
         self.repl = repl
         self.char = char
@@ -241,12 +318,15 @@ class Options:
         self.seqs = seqs
         self.nosp = nosp
         self.unkn = unkn
+        self.prof = prof
+        self.utot = utot
+        self.stop = stop
 
 #   function to be called for stand-alone script
 #
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('file', nargs='?')
+    parser.add_argument('file', nargs='*')
     parser.add_argument('--repl')
     parser.add_argument('--nums')
     parser.add_argument('--char', action='store_true')
@@ -260,6 +340,8 @@ def main():
     parser.add_argument('--unkn', action='store_true')
     parser.add_argument('--nosp', action='store_true')
     parser.add_argument('--mula')
+    parser.add_argument('--profile', action='store_true')
+    parser.add_argument('--profile-json')
     cmdline = parser.parse_args()
 
     if not cmdline.ienc:
@@ -277,6 +359,26 @@ def main():
                 seqs=cmdline.seqs,
                 unkn=cmdline.unkn,
                 nosp=cmdline.nosp)
+    if cmdline.profile or cmdline.profile_json:
+        options.prof = profiler.Profiler()
+    source_defs = cmdline.defs or ''
+
+    if len(cmdline.file) > 1:
+        # merge unknowns of all files
+        if not cmdline.unkn:
+            parser.error('several files are only accepted with --unkn')
+        options.utot = {}
+        for file in cmdline.file:
+            with myopen(file, encoding=cmdline.ienc) as f:
+                txt = f.read()
+            tex2txt(txt, options, source=file, source_defs=source_defs)
+        sout = open(sys.stdout.fileno(), mode='w', encoding='utf-8')
+        sout.write(format_unknowns(options.utot))
+        sout.flush()
+        if options.prof:
+            options.prof.report(cmdline.profile_json)
+        sys.exit()
+    cmdline.file = cmdline.file[0] if cmdline.file else None
 
     if cmdline.file:
         source = cmdline.file
@@ -288,8 +390,6 @@ def main():
         # reopen stdin in text mode: handling of '\r', proper decoding
         txt = open(sys.stdin.fileno(), encoding=cmdline.ienc).read()
 
-    source_defs = cmdline.defs or ''
-
     if cmdline.mula:
         # multi-language: write text sections to files
         ml = tex2txt(txt, options, multi_language=True)
@@ -303,6 +403,8 @@ def main():
                 with myopen(cmdline.nums + '.' + str(nr + 1) + '.' + lang,
                                     mode='w', encoding='utf-8') as f:
                     write_output(txt_pos, None, f)
+        if options.prof:
+            options.prof.report(cmdline.profile_json)
         sys.exit()
 
     if cmdline.nums:
@@ -310,10 +412,14 @@ def main():
 
     # ensure UTF-8 output under Windows, too
     sout = open(sys.stdout.fileno(), mode='w', encoding='utf-8')
-    text = tex2txt(txt, options, source=source, source_defs=source_defs)
-    write_output(text, sout, cmdline.nums)
+    # write text while the rest of the document is parsed
+    for text in tex2txt_iter(txt, options, source=source,
+                                source_defs=source_defs):
+        write_output(text, sout, cmdline.nums)
     if cmdline.nums:
         cmdline.nums.close()
+    if options.prof:
+        options.prof.report(cmdline.profile_json)
 
 if __name__ == '__main__':
     # used as stand-alone script
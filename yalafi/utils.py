@@ -238,6 +238,136 @@ def filter_set_toks(toks, pos, tok_typ):
     return [f(t) for t in toks if tok_typ is None or type(t) is tok_typ]
 
 
+class LayeredDict(dict):
+    """
+    Dictionary with named layers of changes that can be rolled back.
+
+    The dictionary itself always holds the merged content of all layers,
+    such that lookups are those of a plain dictionary.  Each layer above
+    the bottom layer records the previous values of the keys changed
+    while it is the top layer.  Thus, :meth:`rollback` takes time
+    proportional to the number of changes, not to the size of the
+    dictionary.
+
+    Args:
+        name: Name of the bottom layer.
+    """
+
+    missing = object()
+    """Marks a key not present before the change."""
+
+    def __init__(self, name='base'):
+        super().__init__()
+        self.layers = [(name, None)]
+        """
+        List of pairs of layer name and dictionary of previous values,
+        `None` for the bottom layer.
+        """
+        self.version = 0
+        """Number increased by each change, also by a rollback."""
+
+    def __setitem__(self, key, value):
+        prev = self.layers[-1][1]
+        if prev is not None and key not in prev:
+            prev[key] = self.get(key, self.missing)
+        self.version += 1
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        prev = self.layers[-1][1]
+        if prev is not None and key not in prev:
+            prev[key] = self[key]
+        self.version += 1
+        super().__delitem__(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def popitem(self):
+        if not self:
+            raise KeyError('popitem(): dictionary is empty')
+        key = next(reversed(self))
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def copy(self):
+        """Return a copy with copies of all layers."""
+        new = type(self)()
+        dict.update(new, self)
+        new.layers = [(name, prev if prev is None else dict(prev))
+                            for name, prev in self.layers]
+        new.version = self.version
+        return new
+
+    def layer_names(self):
+        """Return list of layer names, starting with the bottom layer."""
+        return [name for name, prev in self.layers]
+
+    def checkpoint(self, name):
+        """
+        Start layer `name` for the following changes.
+
+        If layer `name` already exists, all layers above are merged into
+        it, and it becomes the top layer again.  A rollback to `name`
+        then still restores the content at its creation.
+        """
+        names = self.layer_names()
+        if name not in names:
+            self.layers.append((name, {}))
+            return
+        n = names.index(name)
+        prev = self.layers[n][1]
+        if prev is not None:
+            for name_above, above in self.layers[n+1:]:
+                for key, value in above.items():
+                    prev.setdefault(key, value)
+        del self.layers[n+1:]
+
+    def rollback(self, name):
+        """
+        Undo all changes of layer `name` and of the layers above, which
+        are removed.  Layer `name` remains as empty top layer.
+
+        Raises:
+            KeyError: There is no layer `name`.
+        """
+        names = self.layer_names()
+        if name not in names:
+            raise KeyError(name)
+        n = names.index(name)
+        self.version += 1
+        if n == 0:
+            super().clear()
+            del self.layers[1:]
+            return
+        for layer_name, prev in reversed(self.layers[n:]):
+            for key, value in prev.items():
+                if value is self.missing:
+                    super().pop(key, None)
+                else:
+                    super().__setitem__(key, value)
+        del self.layers[n+1:]
+        self.layers[n] = (name, {})
+
+
 class LanguageSection:
     """
     Language Section of parsed text.